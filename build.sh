@@ -20,6 +20,10 @@ chmod -R 755 staticfiles
 echo "Setting up static directory..."
 chmod -R 755 static
 
+# Recompress bundled images before collectstatic picks them up
+echo "Optimizing images..."
+python manage.py optimize_images
+
 # Collect static files
 echo "Collecting static files..."
 python manage.py collectstatic --no-input
@@ -28,4 +32,12 @@ python manage.py collectstatic --no-input
 echo "Running database migrations..."
 python manage.py migrate --no-input
 
+# Backfill the owner dashboard rollups
+echo "Rebuilding dashboard rollups..."
+python manage.py rebuild_rollups
+
+# Backfill the search index
+echo "Rebuilding search index..."
+python manage.py rebuild_search_index
+
 echo "Build process completed!"
@@ -3,6 +3,15 @@ ASGI config for hotel_management project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The live kitchen order feed (``owner/orders/stream/``) streams Server-Sent
+Events and must be served through this entry point, with ORDER_FEED_ENABLED
+set, e.g.::
+
+    ORDER_FEED_ENABLED=true gunicorn hotel_management.asgi:application -k uvicorn.workers.UvicornWorker
+
+The Procfile and render.yaml serve the WSGI entry point, where the feed is
+off: the stream endpoint returns 204 and owners refresh the orders page.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -3,12 +3,12 @@ from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.static import serve
-from django.http import FileResponse, HttpResponse, JsonResponse
+from django.http import FileResponse, HttpResponse
 import logging
 import os
 import mimetypes
-import sys
-from datetime import datetime
+
+from main import health
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -20,6 +20,9 @@ class RequestLoggingMiddleware:
         self.get_response = get_response
 
     def __call__(self, request):
+        if request.path.startswith(('/health/', settings.MEDIA_URL, settings.STATIC_URL)):
+            # Probes arrive every few seconds, and a page pulls in many files
+            return self.get_response(request)
         logger.info(f"Received request: {request.method} {request.path}")
         response = self.get_response(request)
         logger.info(f"Response status: {response.status_code}")
@@ -27,11 +30,11 @@ class RequestLoggingMiddleware:
 
 # Custom media file handler with logging
 def logged_media_serve(request, path, document_root, show_indexes):
-    logger.info(f"Media request: {path}")
-    logger.info(f"Looking in: {document_root}/{path}")
+    logger.debug(f"Media request: {path}")
+    logger.debug(f"Looking in: {document_root}/{path}")
     try:
         response = serve(request, path, document_root, show_indexes)
-        logger.info(f"Media served successfully: {path}")
+        logger.debug(f"Media served successfully: {path}")
         return response
     except Exception as e:
         logger.error(f"Error serving media: {path}, Error: {str(e)}")
@@ -91,95 +94,12 @@ if settings.DEBUG:
              lambda request: serve(request, 'restaurants/Korean_Res.png', document_root=settings.MEDIA_ROOT),
              name='korean_image'),
     ]  
-# Enhanced health check endpoint for Render deployment verification
-def health_check(request):
-    """
-    Enhanced health check endpoint that returns application status
-    and environment information as JSON. Optimized for Render deployment.
-    """
-    logger.info("Health check requested")
-    
-    try:
-        # Check for critical directories
-        media_exists = os.path.exists(settings.MEDIA_ROOT)
-        static_exists = os.path.exists(settings.STATIC_ROOT)
-        media_items_exists = os.path.exists(os.path.join(settings.MEDIA_ROOT, 'menu_items'))
-        restaurants_exists = os.path.exists(os.path.join(settings.MEDIA_ROOT, 'restaurants'))
-        
-        # Count files in directories
-        media_files_count = sum(len(files) for _, _, files in os.walk(settings.MEDIA_ROOT)) if media_exists else 0
-        static_files_count = sum(len(files) for _, _, files in os.walk(settings.STATIC_ROOT)) if static_exists else 0
-        
-        # Check mountpoint if on Render
-        render_disk_mounted = False
-        render_mountpath = '/opt/render/project/src/media'
-        if os.environ.get('RENDER') == 'true':
-            render_disk_mounted = os.path.exists(render_mountpath) and os.path.ismount(render_mountpath)
-            logger.info(f"Render disk mount check: {render_disk_mounted}")
-        
-        # Get a list of sample files to verify
-        sample_files = []
-        if media_items_exists:
-            try:
-                sample_files = os.listdir(os.path.join(settings.MEDIA_ROOT, 'menu_items'))[:5]
-            except Exception as e:
-                logger.error(f"Error listing menu items: {str(e)}")
-        
-        # Build status response
-        status = {
-            'status': 'healthy',
-            'timestamp': datetime.now().isoformat(),
-            'render': {
-                'is_render': os.environ.get('RENDER') == 'true',
-                'disk_mounted': render_disk_mounted,
-                'external_url': os.environ.get('RENDER_EXTERNAL_URL', 'not set'),
-            },
-            'environment': os.environ.get('DJANGO_ENV', 'not set'),
-            'python_version': sys.version,
-            'debug_mode': settings.DEBUG,
-            'allowed_hosts': settings.ALLOWED_HOSTS,
-            'csrf_trusted_origins': settings.CSRF_TRUSTED_ORIGINS,
-            'directories': {
-                'media_root': {
-                    'path': settings.MEDIA_ROOT,
-                    'exists': media_exists,
-                    'files_count': media_files_count,
-                    'is_writable': os.access(settings.MEDIA_ROOT, os.W_OK) if media_exists else False,
-                },
-                'static_root': {
-                    'path': settings.STATIC_ROOT,
-                    'exists': static_exists,
-                    'files_count': static_files_count,
-                    'is_writable': os.access(settings.STATIC_ROOT, os.W_OK) if static_exists else False,
-                },
-                'menu_items': {
-                    'path': os.path.join(settings.MEDIA_ROOT, 'menu_items'),
-                    'exists': media_items_exists,
-                    'sample_files': sample_files[:5] if sample_files else []
-                },
-                'restaurants': {
-                    'path': os.path.join(settings.MEDIA_ROOT, 'restaurants'),
-                    'exists': restaurants_exists
-                }
-            }
-        }
-        
-        logger.info(f"Health check response: {status}")
-        return JsonResponse(status)
-    except Exception as e:
-        logger.error(f"Health check failed with error: {str(e)}", exc_info=True)
-        return JsonResponse({
-            'status': 'unhealthy',
-            'error': str(e),
-            'timestamp': datetime.now().isoformat()
-        }, status=500)
-    logger.info(f"Health check response: {status}")
-    return JsonResponse(status)
-
 # Define main URL patterns
 urlpatterns = debug_patterns + [
 # Health check should be accessible without authentication
-path('health/', health_check, name='health_check'),
+path('health/', health.health_check, name='health_check'),
+path('health/live', health.live, name='health_live'),
+path('health/ready', health.ready, name='health_ready'),
 path('admin/', admin.site.urls),
 path('', include('main.urls')),
 #path('rating/', include('ratings.urls')),
@@ -22,9 +22,11 @@ class OrderAdmin(admin.ModelAdmin):
 
 @admin.register(Coupon)
 class CouponAdmin(admin.ModelAdmin):
-    list_display = ("code", "discount_percentage", "valid_from", "valid_to", "is_active")
+    list_display = ("code", "discount_percentage", "valid_from", "valid_to", "is_active",
+                    "restaurant", "redemption_count", "max_redemptions")
     search_fields = ("code",)
-    list_filter = ("is_active",)
+    list_filter = ("is_active", "restaurant")
+    readonly_fields = ("redemption_count",)
 
 # @admin.register(Owner)
 # class OwnerAdmin(admin.ModelAdmin):
@@ -0,0 +1,236 @@
+"""
+Read-only JSON API (v1) for the kiosk and QR table clients.
+
+Restaurant and menu payloads are built from the menu cache (main.menu_cache),
+so a 200 usually needs no queries either. Every successful response carries
+a strong ETag derived from the per-restaurant change versions the menu cache
+keeps, and the ETag is computed before the view runs: a matching
+``If-None-Match`` is answered with 304 without touching the ORM. Error
+responses carry no ETag.
+
+Query parameters:
+    ids: Comma separated restaurant ids for batched fetches (at most MAX_BATCH)
+    fields[restaurants], fields[items], fields[reviews]: Comma separated
+        sparse fieldsets; omitted means every field
+    cursor: Keyset pagination cursor for reviews
+"""
+
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.http import condition, require_GET
+
+from . import menu_cache
+from .models import Review
+from .pagination import KeysetPaginator
+from .replica import read_replica
+
+API_VERSION = 'v1'
+MAX_BATCH = 50
+REVIEWS_PER_PAGE = 20
+
+RESTAURANT_FIELDS = (
+    'id', 'name', 'location', 'description', 'cuisine', 'cuisine_display', 'image_url',
+    'rating', 'review_count', 'menu_item_count', 'min_price', 'max_price',
+)
+ITEM_FIELDS = ('id', 'name', 'description', 'price', 'image_url')
+REVIEW_FIELDS = ('id', 'restaurant_id', 'author', 'rating', 'text', 'created_at')
+
+
+class ApiError(Exception):
+    """A bad request answered with a JSON error body"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_ids(request):
+    """Restaurant ids from ``?ids=``, de-duplicated in request order, or None"""
+    raw = request.GET.get('ids')
+    if raw is None:
+        return None
+    try:
+        ids = list(dict.fromkeys(int(part) for part in raw.split(',') if part.strip()))
+    except ValueError:
+        raise ApiError('ids must be a comma separated list of integers')
+    if not ids:
+        raise ApiError('ids must not be empty')
+    if len(ids) > MAX_BATCH:
+        raise ApiError(f'at most {MAX_BATCH} ids per request')
+    return ids
+
+
+def parse_fields(request, resource, allowed):
+    """Sparse fieldset for one resource type from ``?fields[<resource>]=``"""
+    raw = request.GET.get(f'fields[{resource}]')
+    if raw is None:
+        return allowed
+    fields = tuple(dict.fromkeys(field.strip() for field in raw.split(',') if field.strip()))
+    unknown = sorted(set(fields) - set(allowed))
+    if unknown:
+        raise ApiError(f"unknown {resource} field(s): {', '.join(unknown)}")
+    return fields
+
+
+def _etag(request, version):
+    """Strong validator for this exact URL at the given change version(s)"""
+    # The build too: responses hold content-hashed image URLs
+    payload = f'{API_VERSION}|{settings.BUILD_VERSION}|{request.get_full_path()}|{version}'
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def _restaurant(data, fields):
+    values = {
+        'id': data['id'],
+        'name': data['name'],
+        'location': data['location'],
+        'description': data['description'],
+        'cuisine': data['cuisine'],
+        'cuisine_display': data['get_cuisine_display'],
+        'image_url': data['url'] if data['image'] else None,
+        'rating': round(data['average_rating'], 2) if data['review_count'] else None,
+        'review_count': data['review_count'],
+        'menu_item_count': data['menu_item_count'],
+        'min_price': data['min_price'],
+        'max_price': data['max_price'],
+    }
+    return {field: values[field] for field in fields}
+
+
+def _item(data, fields):
+    values = {
+        'id': data['id'],
+        'name': data['name'],
+        'description': data['description'],
+        'price': data['price'],
+        'image_url': data['url'] if data['image'] else None,
+    }
+    return {field: values[field] for field in fields}
+
+
+def _review(review, fields):
+    values = {
+        'id': review.id,
+        'restaurant_id': review.restaurant_id,
+        'author': review.user.username if review.user else (review.name or 'Anonymous'),
+        'rating': review.rating,
+        'text': review.review_text,
+        'created_at': review.created_at,
+    }
+    return {field: values[field] for field in fields}
+
+
+def _menu(menu, restaurant_fields, item_fields):
+    data = _restaurant(menu['restaurant'], restaurant_fields)
+    data['items'] = [_item(item, item_fields) for item in menu['items']]
+    return data
+
+
+def api_view(etag_func):
+    """GET-only JSON view with ETag/304 handling and ApiError responses"""
+    def etag(request, *args, **kwargs):
+        try:
+            return etag_func(request, *args, **kwargs)
+        except ApiError:
+            # Let the view report the error
+            return None
+
+    def decorator(view):
+        @read_replica
+        def handled(request, *args, **kwargs):
+            try:
+                return view(request, *args, **kwargs)
+            except ApiError as e:
+                return JsonResponse({'error': str(e)}, status=e.status)
+
+        conditional_view = condition(etag_func=etag)(handled)
+
+        @require_GET
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code not in (200, 304):
+                # condition() tags every response; an error body is not a
+                # representation of the resource, so it gets no validator
+                del response['ETag']
+            return response
+        return wrapper
+    return decorator
+
+
+def _restaurants_etag(request):
+    ids = parse_ids(request)
+    version = menu_cache.versions(ids) if ids else menu_cache.catalogue_version()
+    return _etag(request, version)
+
+
+def _restaurant_etag(request, id):
+    return _etag(request, menu_cache.versions([id]))
+
+
+def _menus_etag(request):
+    ids = parse_ids(request)
+    if ids is None:
+        raise ApiError('ids is required')
+    return _etag(request, menu_cache.versions(ids))
+
+
+@api_view(_restaurants_etag)
+def restaurants(request):
+    """All restaurants, or those listed in ``?ids=``"""
+    fields = parse_fields(request, 'restaurants', RESTAURANT_FIELDS)
+    ids = parse_ids(request)
+    if ids is None:
+        return JsonResponse({'data': [_restaurant(data, fields) for data in menu_cache.get_catalogue()]})
+
+    menus = menu_cache.get_menus(ids)
+    return JsonResponse({
+        'data': [_restaurant(menus[rid]['restaurant'], fields) for rid in ids if rid in menus],
+        'missing': [rid for rid in ids if rid not in menus],
+    })
+
+
+@api_view(_restaurant_etag)
+def restaurant_detail(request, id):
+    """One restaurant with its menu"""
+    restaurant_fields = parse_fields(request, 'restaurants', RESTAURANT_FIELDS)
+    item_fields = parse_fields(request, 'items', ITEM_FIELDS)
+    menu = menu_cache.get_menu(id)
+    if menu is None:
+        raise ApiError('restaurant not found', status=404)
+    return JsonResponse({'data': _menu(menu, restaurant_fields, item_fields)})
+
+
+@api_view(_menus_etag)
+def menus(request):
+    """Restaurants with their menus for every id in ``?ids=``"""
+    restaurant_fields = parse_fields(request, 'restaurants', RESTAURANT_FIELDS)
+    item_fields = parse_fields(request, 'items', ITEM_FIELDS)
+    ids = parse_ids(request)
+    if ids is None:
+        raise ApiError('ids is required')
+    found = menu_cache.get_menus(ids)
+    return JsonResponse({
+        'data': [_menu(found[rid], restaurant_fields, item_fields) for rid in ids if rid in found],
+        'missing': [rid for rid in ids if rid not in found],
+    })
+
+
+@api_view(_restaurant_etag)
+def restaurant_reviews(request, id):
+    """A restaurant's reviews, newest first, in keyset pages"""
+    fields = parse_fields(request, 'reviews', REVIEW_FIELDS)
+    if menu_cache.get_menu(id) is None:
+        raise ApiError('restaurant not found', status=404)
+    queryset = Review.objects.filter(restaurant_id=id)
+    if 'author' in fields:
+        queryset = queryset.select_related('user')
+    page = KeysetPaginator(queryset, REVIEWS_PER_PAGE).page(request.GET.get('cursor'))
+    return JsonResponse({
+        'data': [_review(review, fields) for review in page],
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    })
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        # Connect the signal receivers for the dashboard rollups, the live order
+        # feed, menu cache invalidation, the search index, shared-cache purges,
+        # the coupon index and the SQLite connection setup
+        from . import coupons, events, menu_cache, rollups, search, shared_cache, sqlite  # noqa: F401
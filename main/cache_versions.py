@@ -0,0 +1,56 @@
+"""
+Cache version counters kept in the database.
+
+Cached data is stored under keys that embed a version (main.menu_cache,
+main.coupons, main.owners), and a write bumps that version so stale entries
+are never read again. The counters must be seen by every worker process the
+moment they change. The default cache is per process, so they live in the
+CacheVersion table, where reading several of them is one primary-key
+lookup. The cached data itself can stay in whatever cache is configured.
+
+Counters are read from ``default``, never from a lagging replica. A counter
+that was never bumped reads as version 0 with no modification time.
+"""
+
+import time
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CacheVersion
+
+
+def get_many(keys):
+    """
+    Current counters.
+
+    Returns:
+        dict: key -> (version, modified datetime or None), for every key
+    """
+    found = {
+        key: (version, modified)
+        for key, version, modified in CacheVersion.objects.using(DEFAULT_DB_ALIAS)
+        .filter(key__in=keys).values_list('key', 'version', 'modified')
+    }
+    return {key: found.get(key, (0, None)) for key in keys}
+
+
+def get(key):
+    return get_many([key])[key]
+
+
+def bump(*keys):
+    """Move each counter to a new version; call after the change has committed"""
+    now = timezone.now()
+    counters = CacheVersion.objects.using(DEFAULT_DB_ALIAS).filter(key__in=keys)
+    if counters.update(version=F('version') + 1, modified=now) == len(keys):
+        return
+    # Time based, so a counter that is created again never reuses an old
+    # version. A concurrent bump may have created some of them in the
+    # meantime, so increment once more rather than lose its change
+    CacheVersion.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+        [CacheVersion(key=key, version=time.time_ns(), modified=now) for key in keys],
+        ignore_conflicts=True,
+    )
+    counters.update(version=F('version') + 1, modified=now)
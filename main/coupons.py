@@ -0,0 +1,355 @@
+"""
+Coupon engine: cached rule lookup and atomic redemption limits.
+
+Lookups go through a per-process index of coupon rules keyed by code. It is
+filled lazily, remembers unknown codes too, and is dropped whenever the
+coupon version (main.cache_versions) changes, so every worker process sees
+an edit at once. Coupon saves and deletes bump that version, and so does
+anything that bulk-inserts coupons (``invalidate()``). Applying a coupon
+therefore costs one version lookup and no coupon queries once its code is
+warm.
+
+Applying a code to a pending order only records it and its discount. The
+redemption is counted by ``redeem()`` inside the checkout transaction, so
+carts that are abandoned never use up a limit, and it is given back when a
+checked-out order is cancelled. Limits are enforced in the database. The
+total limit is a conditional ``UPDATE ... SET redemption_count =
+redemption_count + 1 WHERE redemption_count < max_redemptions``, and the
+per-user limit does the same on a CouponUsage row. Concurrent checkouts can
+never push a counter past its limit, and a redemption that fails one check
+rolls back the other.
+"""
+
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import cache_versions
+from .models import Coupon, CouponUsage, Order
+
+VERSION_KEY = 'coupons'
+# Codes remembered per process before the index starts over
+INDEX_SIZE = 50_000
+# Campaign codes: no 0/O or 1/I, so codes survive being read aloud or retyped
+CODE_ALPHABET = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
+CODE_LENGTH = 10
+# Generated codes must use at most this share of the possible codes
+MAX_KEYSPACE_FILL = 0.01
+
+
+class CouponError(Exception):
+    """A coupon that can't be applied; the message is shown to the customer"""
+
+
+@dataclass(frozen=True)
+class CouponRule:
+    id: int
+    code: str
+    discount_percentage: int
+    valid_from: datetime
+    valid_to: datetime
+    restaurant_id: Optional[int]
+    min_order_total: Decimal
+    max_redemptions: Optional[int]
+    max_redemptions_per_user: Optional[int]
+
+    @classmethod
+    def from_coupon(cls, coupon):
+        return cls(
+            id=coupon.id,
+            code=coupon.code,
+            discount_percentage=coupon.discount_percentage,
+            valid_from=coupon.valid_from,
+            valid_to=coupon.valid_to,
+            restaurant_id=coupon.restaurant_id,
+            min_order_total=coupon.min_order_total,
+            max_redemptions=coupon.max_redemptions,
+            max_redemptions_per_user=coupon.max_redemptions_per_user,
+        )
+
+    def check(self, order, now=None):
+        """Raise CouponError if the coupon's rules don't allow it on this order"""
+        now = now or timezone.now()
+        if now < self.valid_from:
+            raise CouponError(f'Coupon {self.code} is not valid yet.')
+        if now > self.valid_to:
+            raise CouponError(f'Coupon {self.code} has expired.')
+        if self.restaurant_id is not None and self.restaurant_id != order.restaurant_id:
+            raise CouponError(f'Coupon {self.code} is not valid at {order.restaurant.name}.')
+        if order.total_price < self.min_order_total:
+            raise CouponError(f'Coupon {self.code} needs an order of at least ₹{self.min_order_total}.')
+
+    def discount_for(self, subtotal):
+        discount = subtotal * self.discount_percentage / Decimal(100)
+        return discount.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def normalize(code):
+    return (code or '').strip().upper()
+
+
+class CouponIndex:
+    """Per-process map of code -> CouponRule (or None for unknown codes)"""
+
+    def __init__(self):
+        self.rules = {}
+        self.version = None
+        self.lock = threading.Lock()
+
+    def get(self, code):
+        """Active rule for a code, or None"""
+        code = normalize(code)
+        if not code:
+            return None
+        version, _ = cache_versions.get(VERSION_KEY)
+        with self.lock:
+            if version != self.version:
+                self.rules = {}
+                self.version = version
+            if code in self.rules:
+                return self.rules[code]
+
+        coupon = Coupon.objects.filter(code=code, is_active=True).first()
+        rule = CouponRule.from_coupon(coupon) if coupon else None
+        with self.lock:
+            if self.version == version:
+                if len(self.rules) >= INDEX_SIZE:
+                    self.rules = {}
+                self.rules[code] = rule
+        return rule
+
+
+index = CouponIndex()
+
+
+def invalidate():
+    """Make every process reload coupon rules"""
+    cache_versions.bump(VERSION_KEY)
+
+
+def _random_codes(count, length, alphabet):
+    """``count`` uniformly random codes; bytes that would bias the draw are discarded"""
+    limit = 256 - 256 % len(alphabet)
+    table = bytes(ord(alphabet[b % len(alphabet)]) if b < limit else 0 for b in range(256))
+    rejected = bytes(range(limit, 256))
+    needed = count * length
+    chars = b''
+    while len(chars) < needed:
+        chars += os.urandom((needed - len(chars)) * 256 // limit + 64).translate(table, rejected)
+    chars = chars[:needed].decode('ascii')
+    return [chars[i:i + length] for i in range(0, needed, length)]
+
+
+def generate_codes(count, length=CODE_LENGTH, alphabet=CODE_ALPHABET, prefix=''):
+    """
+    Draw ``count`` distinct coupon codes that aren't already in use.
+
+    Args:
+        count (int): Number of codes
+        length (int): Random characters per code, after the prefix
+        alphabet (str): ASCII characters to draw from
+        prefix (str): Fixed start of every code, e.g. a campaign name. Codes
+            are checked against the existing ones with that prefix, which
+            are loaded into memory: without a prefix that is every coupon
+            code, fine for tables of a few million codes
+
+    Returns:
+        list: The codes, sorted so they append to the unique index in order
+
+    Raises:
+        ValueError: The alphabet or length can't produce that many codes safely
+    """
+    prefix = normalize(prefix)
+    alphabet = ''.join(dict.fromkeys(alphabet.upper()))
+    max_length = Coupon._meta.get_field('code').max_length
+    if not 2 <= len(alphabet) <= 256 or not alphabet.isascii():
+        raise ValueError('The alphabet needs between 2 and 256 distinct ASCII characters.')
+    if len(prefix) + length > max_length:
+        raise ValueError(f'Codes are limited to {max_length} characters including the prefix.')
+    existing = set(Coupon.objects.filter(code__startswith=prefix).values_list('code', flat=True))
+    if count + len(existing) > len(alphabet) ** length * MAX_KEYSPACE_FILL:
+        raise ValueError('Too many codes for this alphabet and length; use longer codes.')
+
+    codes = set()
+    while len(codes) < count:
+        for code in _random_codes(count - len(codes), length, alphabet):
+            code = prefix + code
+            if code not in existing:
+                codes.add(code)
+    return sorted(codes)
+
+
+def create_coupons(codes, batch_size=5000, **fields):
+    """
+    Insert one coupon per code in a single transaction, ``batch_size`` rows per INSERT.
+
+    Args:
+        codes (list): Codes from generate_codes()
+        batch_size (int): Rows per INSERT statement; the database backend
+            lowers it if its parameter limit requires
+        **fields: Coupon fields shared by every code (discount_percentage, valid_from, ...)
+
+    Returns:
+        int: Number of coupons created
+    """
+    with transaction.atomic():
+        for start in range(0, len(codes), batch_size):
+            Coupon.objects.bulk_create(
+                [Coupon(code=code, **fields) for code in codes[start:start + batch_size]],
+                batch_size=batch_size,
+            )
+        # No post_save is sent for these rows, so refresh the index ourselves
+        transaction.on_commit(invalidate)
+    return len(codes)
+
+
+def _reserve(rule, user):
+    """Count one redemption against the coupon's limits, or raise CouponError"""
+    claimed = Coupon.objects.filter(pk=rule.id).filter(
+        Q(max_redemptions__isnull=True) | Q(redemption_count__lt=F('max_redemptions'))
+    ).update(redemption_count=F('redemption_count') + 1)
+    if not claimed:
+        raise CouponError(f'Coupon {rule.code} has been fully redeemed.')
+
+    cap = rule.max_redemptions_per_user
+    if cap is None:
+        return
+    if user is None or not user.is_authenticated:
+        raise CouponError(f'Please log in to use coupon {rule.code}.')
+    usage = CouponUsage.objects.filter(coupon_id=rule.id, user=user)
+    if usage.filter(redemptions__lt=cap).update(redemptions=F('redemptions') + 1):
+        return
+    if cap > 0 and not usage.exists():
+        try:
+            with transaction.atomic():
+                CouponUsage.objects.create(coupon_id=rule.id, user=user, redemptions=1)
+            return
+        except IntegrityError:
+            # A concurrent checkout by the same user created the row first
+            if usage.filter(redemptions__lt=cap).update(redemptions=F('redemptions') + 1):
+                return
+    raise CouponError(f'You have already used coupon {rule.code} the maximum number of times.')
+
+
+def _release(coupon_id, user):
+    """Give back a redemption when a checked-out order is cancelled"""
+    Coupon.objects.filter(pk=coupon_id, redemption_count__gt=0).update(
+        redemption_count=F('redemption_count') - 1
+    )
+    if user is not None:
+        CouponUsage.objects.filter(coupon_id=coupon_id, user=user, redemptions__gt=0).update(
+            redemptions=F('redemptions') - 1
+        )
+
+
+def _check_limits(rule, user):
+    """Fail early when a limit is already used up; redeem() enforces them atomically"""
+    if rule.max_redemptions is not None and not Coupon.objects.filter(
+        pk=rule.id, redemption_count__lt=F('max_redemptions')
+    ).exists():
+        raise CouponError(f'Coupon {rule.code} has been fully redeemed.')
+    cap = rule.max_redemptions_per_user
+    if cap is None:
+        return
+    if user is None or not user.is_authenticated:
+        raise CouponError(f'Please log in to use coupon {rule.code}.')
+    if cap == 0 or CouponUsage.objects.filter(coupon_id=rule.id, user=user, redemptions__gte=cap).exists():
+        raise CouponError(f'You have already used coupon {rule.code} the maximum number of times.')
+
+
+def apply_coupon(order, code, user):
+    """
+    Validate a code against a pending order and store its discount.
+
+    Nothing is counted against the coupon's limits until ``redeem()`` runs at
+    checkout; a limit that is already used up is reported here.
+
+    Args:
+        order (Order): A pending order; its stored totals are refreshed
+        code (str): Code as typed by the customer
+        user (User): Customer redeeming the code, for per-user limits
+
+    Returns:
+        CouponRule: The applied coupon
+
+    Raises:
+        CouponError: Unknown code, a rule not met, or a limit reached
+    """
+    rule = index.get(code)
+    if rule is None:
+        raise CouponError('Invalid coupon code.')
+    if order.status != 'Pending' or order.coupon_redeemed:
+        raise CouponError('Coupons can only be applied to pending orders.')
+    rule.check(order)
+    if order.coupon_id == rule.id:
+        return rule
+    _check_limits(rule, user)
+
+    with transaction.atomic():
+        Order.objects.filter(pk=order.pk).update(
+            coupon_id=rule.id,
+            discount_applied=rule.discount_for(order.total_price),
+        )
+        Order.update_totals(order.pk)
+    order.refresh_from_db(fields=['coupon', 'discount_applied', *Order.TOTAL_FIELDS])
+    return rule
+
+
+def remove_coupon(order):
+    """Take an unredeemed coupon off an order and restore the full price"""
+    with transaction.atomic():
+        Order.objects.filter(pk=order.pk, coupon_redeemed=False).update(coupon=None, discount_applied=0)
+        Order.update_totals(order.pk)
+    order.refresh_from_db(fields=['coupon', 'discount_applied', *Order.TOTAL_FIELDS])
+
+
+def redeem(order, user):
+    """
+    Count an order's coupon against its limits; call inside the checkout transaction.
+
+    The coupon is checked again, as it may have been deactivated, edited or
+    used up since it was applied. A failure leaves the order's coupon in
+    place for the caller to remove.
+
+    Raises:
+        CouponError: The coupon can no longer be used on this order
+    """
+    if order.coupon_id is None:
+        return
+    # Only once per order, however often checkout is submitted
+    if not Order.objects.filter(pk=order.pk, coupon_redeemed=False).update(coupon_redeemed=True):
+        return
+    code = Coupon.objects.filter(pk=order.coupon_id).values_list('code', flat=True).first()
+    rule = index.get(code)
+    if rule is None or rule.id != order.coupon_id:
+        raise CouponError('The coupon on this order is no longer available.')
+    rule.check(order)
+    _reserve(rule, user)
+    order.coupon_redeemed = True
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def coupon_changed(sender, instance, **kwargs):
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Order)
+def order_cancelled(sender, instance, created, raw=False, **kwargs):
+    """Give back the coupon redemption of a checked-out order that is cancelled"""
+    if raw or created or instance.status != 'Cancelled' or instance.coupon_id is None:
+        return
+    if getattr(instance, '_previous_status', None) == 'Cancelled':
+        return
+    if Order.objects.filter(pk=instance.pk, coupon_redeemed=True).update(coupon_redeemed=False):
+        instance.coupon_redeemed = False
+        _release(instance.coupon_id, instance.user)
@@ -0,0 +1,211 @@
+"""
+Live kitchen order feed served as Server-Sent Events.
+
+Order writes append a row to OrderEvent inside the same transaction. Each
+process runs at most one notifier task, and only while it has listeners: it
+reads new OrderEvent rows once per ``ORDER_FEED_POLL_INTERVAL`` and fans them
+out to per-connection queues. Connected browsers therefore never query the
+database themselves, and an idle connection is just a coroutine waiting on
+its queue. Because the log lives in the database, events reach the stream no
+matter which worker process handled the write.
+
+Streaming needs the ASGI entry point (hotel_management.asgi), so the feed is
+off unless ``ORDER_FEED_ENABLED`` is set for a deployment served that way.
+While it is off no events are recorded, and the endpoint answers 204 so
+browsers stop reconnecting and the page falls back to manual refresh.
+
+The log is pruned from the write path, at most once per ``PRUNE_INTERVAL``
+seconds per process and after the order's transaction commits, so it stays
+bounded whether or not anyone is listening.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import dateformat, timezone
+
+from .models import Order, OrderEvent
+
+logger = logging.getLogger(__name__)
+
+# Comment line sent when nothing happened, so proxies keep the connection open
+HEARTBEAT_SECONDS = 15
+# Events buffered per connection before a slow client starts missing updates
+QUEUE_SIZE = 100
+# Seconds between prunes of the event log, per process
+PRUNE_INTERVAL = 60
+# Longest pause between notifier polls while the database keeps failing
+MAX_BACKOFF_SECONDS = 30
+
+_pruned_at = None
+
+
+def enabled():
+    return getattr(settings, 'ORDER_FEED_ENABLED', False)
+
+
+def serialize_event(event):
+    order = event.order
+    return {
+        'id': event.id,
+        'restaurant_id': event.restaurant_id,
+        'kind': event.kind,
+        'order': {
+            'id': order.id,
+            'status': order.status,
+            'customer': order.user.username if order.user else 'Guest',
+            'created_at': dateformat.format(timezone.localtime(order.created_at), 'M d, Y'),
+            'total': str(order.total_after_discount),
+        },
+    }
+
+
+def fetch_events(after_id, restaurant_id=None, limit=500):
+    """Return serialized events newer than ``after_id``, oldest first"""
+    events = OrderEvent.objects.filter(id__gt=after_id)
+    if restaurant_id is not None:
+        events = events.filter(restaurant_id=restaurant_id)
+    events = events.select_related('order', 'order__user').order_by('id')[:limit]
+    return [serialize_event(event) for event in events]
+
+
+def latest_event_id():
+    return OrderEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def poll(after_id):
+    """
+    One notifier round trip: the latest event id when ``after_id`` is None,
+    otherwise the events after it.
+    """
+    try:
+        return latest_event_id() if after_id is None else fetch_events(after_id)
+    except Exception:
+        # Reconnect on the next poll
+        connection.close()
+        raise
+
+
+def prune_events():
+    retention = getattr(settings, 'ORDER_FEED_RETENTION', 3600)
+    OrderEvent.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=retention)).delete()
+
+
+def schedule_prune():
+    """Prune the event log once the current transaction commits, if it is due"""
+    global _pruned_at
+    now = time.monotonic()
+    if _pruned_at is not None and now - _pruned_at < PRUNE_INTERVAL:
+        return
+    _pruned_at = now
+    transaction.on_commit(prune_events)
+
+
+def format_sse(event):
+    return f"id: {event['id']}\nevent: order\ndata: {json.dumps(event['order'])}\n\n"
+
+
+class OrderFeed:
+    """Per-process fan-out of OrderEvent rows to connected listeners"""
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.task = None
+        self.last_id = 0
+
+    async def listen(self, restaurant_id, last_event_id=None):
+        """
+        Yield Server-Sent Event frames for one restaurant until the client disconnects.
+
+        Args:
+            restaurant_id (int): Restaurant whose orders to stream
+            last_event_id (int, optional): Replay missed events after this id,
+                as sent by a reconnecting EventSource
+        """
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.subscribers[restaurant_id].add(queue)
+        self._ensure_running()
+        sent = last_event_id or 0
+        try:
+            yield 'retry: 3000\n\n'
+            if last_event_id is not None:
+                for event in await sync_to_async(fetch_events)(last_event_id, restaurant_id):
+                    sent = event['id']
+                    yield format_sse(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                if event['id'] > sent:
+                    sent = event['id']
+                    yield format_sse(event)
+        finally:
+            listeners = self.subscribers.get(restaurant_id)
+            if listeners is not None:
+                listeners.discard(queue)
+                if not listeners:
+                    del self.subscribers[restaurant_id]
+
+    def _ensure_running(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        """
+        Poll for new events while anyone is listening. A failed poll is
+        logged and retried with a growing pause, so a locked or restarting
+        database doesn't end the feed for everyone already connected.
+        """
+        interval = getattr(settings, 'ORDER_FEED_POLL_INTERVAL', 1.0)
+        delay = interval
+        self.last_id = None
+        while self.subscribers:
+            try:
+                result = await sync_to_async(poll)(self.last_id)
+            except Exception:
+                delay = min(delay * 2, MAX_BACKOFF_SECONDS)
+                logger.exception(f'Polling the order feed failed, retrying in {delay:g}s')
+            else:
+                delay = interval
+                if self.last_id is None:
+                    self.last_id = result
+                else:
+                    self.publish(result)
+            await asyncio.sleep(delay)
+
+    def publish(self, events):
+        for event in events:
+            self.last_id = event['id']
+            for queue in list(self.subscribers.get(event['restaurant_id'], ())):
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    pass
+
+
+order_feed = OrderFeed()
+
+
+@receiver(post_save, sender=Order)
+def record_order_event(sender, instance, created, raw=False, **kwargs):
+    if raw or not enabled():
+        return
+    if created:
+        kind = OrderEvent.CREATED
+    elif getattr(instance, '_previous_status', None) not in (None, instance.status):
+        kind = OrderEvent.STATUS
+    else:
+        return
+    OrderEvent.objects.create(restaurant_id=instance.restaurant_id, order=instance, kind=kind)
+    schedule_prune()
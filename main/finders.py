@@ -0,0 +1,55 @@
+"""
+Static files finder that prefers the optimized copies of bundled images.
+
+``manage.py optimize_images`` writes recompressed images, and WebP/AVIF
+siblings, under IMAGE_BUILD_DIR at the same path relative to BASE_DIR as the
+originals (``static/images/x.jpg`` -> ``build/static/images/x.jpg``). This
+finder looks in that mirror of each STATICFILES_DIRS entry first, so
+collectstatic (and WhiteNoise's finder mode in development) picks up the
+optimized copy and the originals stay untouched in the repository.
+"""
+
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import utils
+from django.contrib.staticfiles.finders import FileSystemFinder
+from django.core.files.storage import FileSystemStorage
+
+
+class OptimizedFileSystemFinder(FileSystemFinder):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # STATICFILES_DIRS root -> its mirror under IMAGE_BUILD_DIR
+        self.overlays = {}
+        for prefix, root in self.locations:
+            try:
+                relative = Path(root).resolve().relative_to(Path(settings.BASE_DIR).resolve())
+            except ValueError:
+                continue
+            overlay = FileSystemStorage(location=Path(settings.IMAGE_BUILD_DIR) / relative)
+            overlay.prefix = prefix
+            self.overlays[root] = overlay
+
+    def find_location(self, root, path, prefix=None):
+        overlay = self.overlays.get(root)
+        if overlay is not None:
+            matched_path = super().find_location(overlay.location, path, prefix)
+            if matched_path:
+                return matched_path
+        return super().find_location(root, path, prefix)
+
+    def list(self, ignore_patterns):
+        for prefix, root in self.locations:
+            overlay = self.overlays.get(root)
+            optimized = set()
+            if overlay is not None and os.path.isdir(overlay.location):
+                for path in utils.get_files(overlay, ignore_patterns):
+                    optimized.add(path)
+                    yield path, overlay
+            if os.path.isdir(root):
+                storage = self.storages[root]
+                for path in utils.get_files(storage, ignore_patterns):
+                    if path not in optimized:
+                        yield path, storage
@@ -0,0 +1,144 @@
+"""
+Group commit: one writer thread per process that batches short write transactions.
+
+SQLite admits one writer at a time, so concurrent request threads that each
+commit their own tiny transaction mostly wait on each other for the lock.
+With ``ORDER_GROUP_COMMIT`` on they hand the write to ``writer`` instead.
+The writer thread takes whatever jobs queued up while it was committing
+the previous batch, up to ``ORDER_GROUP_COMMIT_BATCH`` (optionally waiting
+``ORDER_GROUP_COMMIT_WAIT`` seconds for more), and runs them in a single
+transaction. If a job raises, the batch is rolled back and run again with a
+savepoint per job, so a failing job only fails its own caller. Callers block
+until the batch has committed and then get the job's return value or
+exception. A caller whose job is still queued after
+``ORDER_GROUP_COMMIT_TIMEOUT`` seconds withdraws it and writes it in its own
+transaction, so a stuck or dead writer delays orders instead of hanging them.
+
+Jobs must therefore be safe to run again, as they also are when the commit
+hits a lock timeout and the whole batch is retried.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from .sqlite import is_lock_error, retry_on_lock
+
+logger = logging.getLogger(__name__)
+
+
+def enabled():
+    return getattr(settings, 'ORDER_GROUP_COMMIT', False) and not connection.in_atomic_block
+
+
+class GroupCommitWriter:
+    def __init__(self):
+        self.jobs = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.pid = None
+        self.thread = None
+        self.batches = 0
+        self.written = 0
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Run ``func(*args, **kwargs)`` in the next batch and wait for its result.
+
+        A job the writer hasn't picked up within ``ORDER_GROUP_COMMIT_TIMEOUT``
+        seconds is withdrawn and run in the caller's own transaction instead.
+        """
+        self.ensure_started()
+        future = Future()
+        self.jobs.put((future, func, args, kwargs))
+        try:
+            return future.result(timeout=getattr(settings, 'ORDER_GROUP_COMMIT_TIMEOUT', 5))
+        except TimeoutError:
+            if not future.cancel():
+                # Already in a batch being committed, which always resolves it
+                return future.result()
+        logger.warning(f'Group commit writer is not keeping up, writing {func.__qualname__} inline')
+        with transaction.atomic():
+            return func(*args, **kwargs)
+
+    def ensure_started(self):
+        # A forked worker inherits the object but not the thread, and a
+        # thread killed by an unexpected error must not strand later callers
+        if self.pid == os.getpid() and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.pid == os.getpid() and self.thread.is_alive():
+                return
+            if self.pid not in (None, os.getpid()):
+                # The parent's queued jobs belong to the parent's callers
+                self.jobs = queue.SimpleQueue()
+            elif self.thread is not None:
+                logger.error('Group commit writer thread died, starting a new one')
+            self.thread = threading.Thread(target=self.run, name='group-commit-writer', daemon=True)
+            self.thread.start()
+            self.pid = os.getpid()
+
+    def run(self):
+        while True:
+            batch = [self.jobs.get()]
+            limit = getattr(settings, 'ORDER_GROUP_COMMIT_BATCH', 32)
+            deadline = time.monotonic() + getattr(settings, 'ORDER_GROUP_COMMIT_WAIT', 0)
+            while len(batch) < limit:
+                # Jobs queued while the previous batch committed are taken at once
+                try:
+                    batch.append(self.jobs.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            # Skip jobs whose callers stopped waiting and ran them inline
+            batch = [job for job in batch if job[0].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                close_old_connections()
+                results = self.commit(batch)
+            except Exception as e:
+                logger.exception(f'Group commit of {len(batch)} writes failed')
+                for future, *_ in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.written += len(batch)
+            for (future, *_), (ok, value) in zip(batch, results):
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    @retry_on_lock
+    def commit(self, batch):
+        """Run a batch in one transaction; returns (ok, result or exception) per job"""
+        try:
+            with transaction.atomic():
+                return [(True, func(*args, **kwargs)) for _, func, args, kwargs in batch]
+        except Exception as e:
+            if is_lock_error(e):
+                raise
+            if len(batch) == 1:
+                return [(False, e)]
+
+        # A job failed and took the batch down with it: run them again, each
+        # in its own savepoint, so only that job's caller sees the error
+        results = []
+        with transaction.atomic():
+            for _, func, args, kwargs in batch:
+                try:
+                    with transaction.atomic():
+                        results.append((True, func(*args, **kwargs)))
+                except Exception as e:
+                    if is_lock_error(e):
+                        raise
+                    results.append((False, e))
+        return results
+
+
+writer = GroupCommitWriter()
@@ -0,0 +1,226 @@
+"""
+Health endpoints for Render and the load balancer.
+
+- ``/health/live``: the process is up and answering requests. It touches
+  nothing else, so a slow database never gets a worker restarted.
+- ``/health/ready``: the process can also reach its databases. ``SELECT 1``
+  runs on a dedicated thread and the probe waits at most
+  ``HEALTH_DB_TIMEOUT`` seconds for it. While a check is still stuck, later
+  probes wait on that same check instead of starting another, and a result
+  is reused for ``HEALTH_CHECK_TTL`` seconds.
+- ``/health/``: the detailed status for people. The directory statistics
+  (file counts under MEDIA_ROOT and STATIC_ROOT, the Render disk) come from
+  a snapshot that a background thread retakes every
+  ``HEALTH_SNAPSHOT_INTERVAL`` seconds.
+
+None of them walks a directory or logs per probe, so they answer in the
+same time however much media is stored.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from datetime import datetime
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.http import JsonResponse
+from django.views.decorators.cache import never_cache
+
+from . import menu_cache
+
+logger = logging.getLogger(__name__)
+
+RENDER_MOUNTPATH = '/opt/render/project/src/media'
+
+
+def _ping():
+    """Round trip to every configured database; returns {alias: milliseconds}"""
+    close_old_connections()
+    timings = {}
+    for alias in settings.DATABASES:
+        connection = connections[alias]
+        started = time.perf_counter()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+        except Exception as e:
+            # Reconnect on the next check
+            connection.close()
+            raise RuntimeError(f'{alias}: {e}') from e
+        timings[alias] = round((time.perf_counter() - started) * 1000, 2)
+    return timings
+
+
+class DatabaseCheck:
+    """Per-process readiness check with a bounded wait and a short-lived result"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.executor = None
+        self.pending = None
+        self.result = None
+        self.checked = 0.0
+
+    def run(self):
+        """
+        Whether the databases answered.
+
+        Returns:
+            (ok, details): details maps each alias to its round trip in
+            milliseconds, or holds the error when the check failed or timed out
+        """
+        with self.lock:
+            if self.result is not None and time.monotonic() - self.checked < settings.HEALTH_CHECK_TTL:
+                return self.result
+            if self.pending is None or self.pending.done() or self.pid != os.getpid():
+                self.pending = self.get_executor().submit(_ping)
+            future = self.pending
+        try:
+            result = True, {'latency_ms': future.result(timeout=settings.HEALTH_DB_TIMEOUT)}
+        except TimeoutError:
+            result = False, {'error': f'no answer within {settings.HEALTH_DB_TIMEOUT}s'}
+        except Exception as e:
+            result = False, {'error': str(e)}
+        with self.lock:
+            self.result, self.checked = result, time.monotonic()
+        return result
+
+    def get_executor(self):
+        # A forked worker inherits the executor but not its thread
+        if self.executor is None or self.pid != os.getpid():
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='health-db')
+            self.pid = os.getpid()
+        return self.executor
+
+
+database = DatabaseCheck()
+
+
+def collect_directories():
+    """The expensive part of the detailed status: walks MEDIA_ROOT and STATIC_ROOT"""
+    media_root = settings.MEDIA_ROOT
+    static_root = str(settings.STATIC_ROOT)
+    menu_items = os.path.join(media_root, 'menu_items')
+    restaurants = os.path.join(media_root, 'restaurants')
+    media_exists = os.path.exists(media_root)
+    static_exists = os.path.exists(static_root)
+    media_items_exists = os.path.exists(menu_items)
+
+    sample_files = []
+    if media_items_exists:
+        try:
+            sample_files = os.listdir(menu_items)[:5]
+        except OSError as e:
+            logger.error(f'Error listing menu items: {e}')
+
+    return {
+        'render_disk_mounted': (
+            os.environ.get('RENDER') == 'true'
+            and os.path.exists(RENDER_MOUNTPATH)
+            and os.path.ismount(RENDER_MOUNTPATH)
+        ),
+        'directories': {
+            'media_root': {
+                'path': media_root,
+                'exists': media_exists,
+                'files_count': sum(len(files) for _, _, files in os.walk(media_root)) if media_exists else 0,
+                'is_writable': os.access(media_root, os.W_OK) if media_exists else False,
+            },
+            'static_root': {
+                'path': static_root,
+                'exists': static_exists,
+                'files_count': sum(len(files) for _, _, files in os.walk(static_root)) if static_exists else 0,
+                'is_writable': os.access(static_root, os.W_OK) if static_exists else False,
+            },
+            'menu_items': {
+                'path': menu_items,
+                'exists': media_items_exists,
+                'sample_files': sample_files,
+            },
+            'restaurants': {
+                'path': restaurants,
+                'exists': os.path.exists(restaurants),
+            },
+        },
+    }
+
+
+class DirectorySnapshot:
+    """Directory statistics retaken by a background thread, started on first use"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.data = None
+        self.taken_at = None
+
+    def get(self):
+        """(data, taken_at); both None until the first snapshot is taken"""
+        self.ensure_started()
+        return self.data, self.taken_at
+
+    def ensure_started(self):
+        # A forked worker inherits the object but not the thread
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                threading.Thread(target=self.run, name='health-snapshot', daemon=True).start()
+                self.pid = os.getpid()
+
+    def run(self):
+        while True:
+            try:
+                data = collect_directories()
+            except Exception:
+                logger.exception('Taking the health snapshot failed')
+            else:
+                self.data, self.taken_at = data, datetime.now()
+            time.sleep(settings.HEALTH_SNAPSHOT_INTERVAL)
+
+
+snapshot = DirectorySnapshot()
+
+
+@never_cache
+def live(request):
+    return JsonResponse({'status': 'ok'})
+
+
+@never_cache
+def ready(request):
+    ok, details = database.run()
+    return JsonResponse({'status': 'ready' if ok else 'unavailable', 'database': details}, status=200 if ok else 503)
+
+
+@never_cache
+def health_check(request):
+    """
+    Application status and environment information as JSON, for Render
+    deployment verification. Directory statistics are from the latest snapshot.
+    """
+    data, taken_at = snapshot.get()
+    data = data or {}
+    return JsonResponse({
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'render': {
+            'is_render': os.environ.get('RENDER') == 'true',
+            'disk_mounted': data.get('render_disk_mounted', False),
+            'external_url': os.environ.get('RENDER_EXTERNAL_URL', 'not set'),
+        },
+        'environment': os.environ.get('DJANGO_ENV', 'not set'),
+        'python_version': sys.version,
+        'debug_mode': settings.DEBUG,
+        'allowed_hosts': settings.ALLOWED_HOSTS,
+        'csrf_trusted_origins': settings.CSRF_TRUSTED_ORIGINS,
+        'menu_cache': menu_cache.stats(),
+        'snapshot_taken_at': taken_at.isoformat() if taken_at else None,
+        'directories': data.get('directories'),
+    })
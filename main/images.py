@@ -0,0 +1,424 @@
+"""
+Responsive derivatives for uploaded restaurant and menu item photos.
+
+An upload is never stored as-is. ``save_upload`` hands its bytes to a small
+pool of worker processes, which open it with Pillow under a pixel limit
+(``IMAGE_MAX_PIXELS``, so a decompression bomb fails before it is decoded),
+apply the EXIF orientation, drop all metadata and encode one file per width in
+``IMAGE_WIDTHS`` (never upscaling) and per format in ``IMAGE_FORMATS`` that
+this Pillow build can write. Decoding runs outside the web process, so a
+hostile or huge file can't stall request threads or grow their memory.
+
+Files are named after the SHA-256 of the upload,
+``uploads/<kind>/<digest>-<width>.<ext>``, so a path never changes content and
+the same photo uploaded twice is stored once. The model keeps the largest
+JPEG in ``image`` (its ``url`` for a plain <img>) and the widths and formats
+in ``image_variants``; ``sources()`` and the ``{% picture %}`` tag
+(main.templatetags.pictures) turn those into ``srcset`` without touching the
+filesystem.
+
+``url()`` resolves a model's ``image`` value. Uploads are content-addressed
+already. Bundled images under static/images are looked up in the manifest
+collectstatic writes (path -> content-hashed copy), loaded once per process,
+so each lookup is a dict access and the URL changes whenever the file does.
+Both kinds are served with ``Cache-Control: immutable``.
+
+This module must not import models: the worker processes import it without
+setting up Django.
+"""
+
+import functools
+import hashlib
+import io
+import logging
+import math
+import mimetypes
+import multiprocessing
+import os
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = 'uploads'
+DIGEST_LENGTH = 20
+
+# Decoders allowed for uploads; anything else is rejected unopened
+INPUT_FORMATS = ('JPEG', 'PNG', 'WEBP', 'GIF', 'AVIF')
+
+# Pillow format, file extension, MIME type and encoder options per output
+# format. Best first: browsers take the first <source> they support.
+OUTPUT_FORMATS = {
+    'avif': ('AVIF', 'avif', 'image/avif', {'quality': 55, 'speed': 6}),
+    'webp': ('WEBP', 'webp', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'png': ('PNG', 'png', 'image/png', {'optimize': True}),
+}
+FALLBACK_FORMAT = 'jpeg'
+
+# Output format of a bundled image's optimized copy, by file extension
+# (optimize_file); some .jpg files are really PNGs
+EXTENSION_FORMATS = {'jpg': 'jpeg', 'jpeg': 'jpeg', 'png': 'png', 'webp': 'webp'}
+
+mimetypes.add_type('image/avif', '.avif')
+mimetypes.add_type('image/webp', '.webp')
+
+
+class ImageError(Exception):
+    """An upload that isn't an acceptable image; the message is shown to the owner"""
+
+
+def available_formats():
+    """IMAGE_FORMATS that this Pillow build can encode, best first"""
+    from PIL import Image
+
+    Image.init()
+    formats = [
+        name for name in OUTPUT_FORMATS
+        if name in settings.IMAGE_FORMATS and OUTPUT_FORMATS[name][0] in Image.SAVE
+    ]
+    if FALLBACK_FORMAT not in formats:
+        formats.append(FALLBACK_FORMAT)
+    return formats
+
+
+def target_widths(width, widths):
+    """The fixed widths to generate for an image ``width`` pixels wide"""
+    return [w for w in sorted(widths) if w <= width] or [width]
+
+
+def _decode(image, width):
+    """
+    Load an opened image upright as RGB or RGBA, at least ``width`` pixels wide.
+
+    JPEGs are decoded straight at a fraction of their size when that still
+    covers ``width``, which is much faster than decoding in full.
+    """
+    from PIL import ExifTags, ImageOps
+
+    oriented_width = image.width
+    if image.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8):
+        oriented_width = image.height
+    scale = min(1, width / oriented_width)
+    image.draft('RGB', (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+    image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    return image
+
+
+def _encode(image, name):
+    from PIL import Image
+
+    pil_format, _, _, options = OUTPUT_FORMATS[name]
+    if pil_format == 'JPEG' and image.mode == 'RGBA':
+        frame = Image.new('RGB', image.size, 'white')
+        frame.paste(image, mask=image.getchannel('A'))
+        image = frame
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def _resize(image, width):
+    from PIL import Image
+
+    if image.width <= width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def render_derivatives(data, widths, formats, max_pixels):
+    """
+    Decode an image and encode every derivative. Runs in a worker process.
+
+    Args:
+        data (bytes): The uploaded file
+        widths (list): Candidate widths; see target_widths()
+        formats (list): Keys of OUTPUT_FORMATS
+        max_pixels (int): Largest width x height accepted
+
+    Returns:
+        dict: ``width`` and ``height`` of the decoded image, and ``files``
+        mapping (width, format) to the encoded bytes
+
+    Raises:
+        ImageError: For anything that isn't a readable image within the limits
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    try:
+        with warnings.catch_warnings():
+            # Pillow only warns between 1x and 2x the limit
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            Image.init()
+            image = Image.open(io.BytesIO(data), formats=[f for f in INPUT_FORMATS if f in Image.OPEN])
+        if image.width * image.height > max_pixels:
+            raise ImageError(f'Images can have at most {max_pixels:,} pixels.')
+        image = _decode(image, max(widths))
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning) as e:
+        raise ImageError(f'Images can have at most {max_pixels:,} pixels.') from e
+    except UnidentifiedImageError as e:
+        raise ImageError('Please upload a JPEG, PNG, WebP or GIF image.') from e
+    except (OSError, SyntaxError, ValueError) as e:
+        raise ImageError('The image could not be read.') from e
+
+    width, height = image.size
+    files = {}
+    for size in reversed(target_widths(width, widths)):
+        # Each step shrinks the previous (larger) one, which is much cheaper
+        # than going back to the original every time
+        image = _resize(image, size)
+        for name in formats:
+            files[size, name] = _encode(image, name)
+    return {'width': width, 'height': height, 'files': files}
+
+
+def optimize_file(source, destination, max_width, formats, max_pixels):
+    """
+    Recompress one bundled image for the build. Runs in a worker process.
+
+    The image is resized to at most ``max_width`` and written to
+    ``destination`` in the format its extension names, but only if that
+    comes out smaller than the source; each of ``formats`` in a different
+    format is written next to it as ``destination + '.' + extension``.
+
+    Args:
+        source (str): The image file
+        destination (str): Where its optimized copy goes
+        max_width (int): Widest output
+        formats (list): Keys of OUTPUT_FORMATS to add
+        max_pixels (int): Largest width x height accepted
+
+    Returns:
+        dict: The source's own ``format`` (a key of OUTPUT_FORMATS), the
+        output ``width`` and ``height``, and ``outputs``, which maps each
+        format to (path, size), or to None for the source's own format when
+        the original was kept
+    """
+    from PIL import Image
+
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    own = EXTENSION_FORMATS[destination.rsplit('.', 1)[-1].lower()]
+    with Image.open(source) as opened:
+        image = _resize(_decode(opened, max_width), max_width)
+
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    outputs = {}
+    content = _encode(image, own)
+    if len(content) < os.path.getsize(source):
+        with open(destination, 'wb') as f:
+            f.write(content)
+        outputs[own] = (destination, len(content))
+    else:
+        outputs[own] = None
+    for name in formats:
+        if name == own:
+            continue
+        path = f'{destination}.{OUTPUT_FORMATS[name][1]}'
+        content = _encode(image, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        outputs[name] = (path, len(content))
+    return {'format': own, 'width': image.width, 'height': image.height, 'outputs': outputs}
+
+
+class DerivativePool:
+    """Worker processes for render_derivatives(), started on first use"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pid = None
+
+    def run(self, *args):
+        if settings.IMAGE_WORKERS <= 0:
+            return render_derivatives(*args)
+        future = self.get_executor().submit(render_derivatives, *args)
+        try:
+            return future.result(timeout=settings.IMAGE_TIMEOUT)
+        except FutureTimeoutError:
+            future.cancel()
+            raise ImageError('The image took too long to process.')
+        except BrokenProcessPool:
+            # A worker died (out of memory, killed); start afresh next time
+            logger.exception('Image worker pool broke')
+            self.reset()
+            raise ImageError('The image could not be processed.')
+
+    def get_executor(self):
+        # A forked gunicorn worker inherits the object but not the processes
+        with self.lock:
+            if self.executor is None or self.pid != os.getpid():
+                self.executor = ProcessPoolExecutor(
+                    max_workers=settings.IMAGE_WORKERS,
+                    # Never fork a process that runs request threads
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+                self.pid = os.getpid()
+            return self.executor
+
+    def reset(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+pool = DerivativePool()
+
+
+def derivative_name(base, width, name):
+    return f'{base}-{width}.{OUTPUT_FORMATS[name][1]}'
+
+
+def save_upload(upload, kind):
+    """
+    Validate an uploaded photo and store its derivatives.
+
+    Args:
+        upload: The UploadedFile from request.FILES
+        kind (str): 'restaurants' or 'menu_items'
+
+    Returns:
+        (image, variants): values for the model's ``image`` and ``image_variants``
+
+    Raises:
+        ImageError: If the file is too large or not an acceptable image
+    """
+    if upload.size > settings.IMAGE_MAX_UPLOAD_BYTES:
+        raise ImageError(f'Images can be at most {settings.IMAGE_MAX_UPLOAD_BYTES // (1024 * 1024)} MB.')
+    data = b''.join(upload.chunks())
+    digest = hashlib.sha256(data).hexdigest()[:DIGEST_LENGTH]
+    base = f'{UPLOAD_DIR}/{kind}/{digest}'
+    formats = available_formats()
+
+    result = pool.run(data, list(settings.IMAGE_WIDTHS), formats, settings.IMAGE_MAX_PIXELS)
+    for (width, name), content in result['files'].items():
+        path = derivative_name(base, width, name)
+        # Same name, same bytes: a repeated upload writes nothing
+        if not default_storage.exists(path):
+            default_storage.save(path, ContentFile(content))
+
+    widths = sorted({width for width, _ in result['files']})
+    variants = {
+        'base': base,
+        'widths': widths,
+        'formats': formats,
+        'width': result['width'],
+        'height': result['height'],
+    }
+    return derivative_name(base, widths[-1], FALLBACK_FORMAT), variants
+
+
+@functools.cache
+def _static_manifest():
+    """Unhashed -> hashed name of every collected static file"""
+    from django.contrib.staticfiles.storage import staticfiles_storage
+
+    if settings.DEBUG:
+        # Development serves the unhashed files straight from the finders
+        return {}
+    return dict(getattr(staticfiles_storage, 'hashed_files', {}))
+
+
+def static_url(path):
+    """URL of a bundled image in static/images, content-hashed once collected"""
+    name = f'images/{path}'
+    return settings.STATIC_URL + _static_manifest().get(name, name)
+
+
+def static_sources(path):
+    """(MIME type, URL) of the optimize_images copies of a bundled image in better formats"""
+    manifest = _static_manifest()
+    name = f'images/{path}'
+    return [
+        (mime, settings.STATIC_URL + manifest[f'{name}.{extension}'])
+        for _, extension, mime, _ in (OUTPUT_FORMATS[format] for format in ('avif', 'webp'))
+        if f'{name}.{extension}' in manifest
+    ]
+
+
+def _static_path(image, kind):
+    # Stored with or without the '<kind>/' prefix
+    return image if image.startswith(f'{kind}/') else f'{kind}/{image}'
+
+
+def url(image, kind):
+    """
+    URL for a Restaurant or MenuItem ``image`` value.
+
+    Args:
+        image (str): The stored value: an upload path, or a path under
+            static/images/<kind>/
+        kind (str): 'restaurants' or 'menu_items'
+    """
+    image = (image or '').strip()
+    if not image:
+        return static_url(f'{kind}/default.jpg')
+    if is_upload(image):
+        return upload_url(image)
+    return static_url(_static_path(image, kind))
+
+
+def image_sources(image, variants, kind):
+    """
+    <source> candidates for a Restaurant or MenuItem image, best format first.
+
+    Returns:
+        list: (MIME type, srcset) pairs, without the JPEG/original fallback
+        that goes on the <img> itself
+    """
+    if variants:
+        return [(mime, srcset) for mime, srcset in sources(variants) if mime != 'image/jpeg']
+    image = (image or '').strip()
+    if not image or is_upload(image):
+        return []
+    return static_sources(_static_path(image, kind))
+
+
+def is_upload(path):
+    return bool(path) and path.startswith(f'{UPLOAD_DIR}/')
+
+
+def upload_url(path):
+    return settings.MEDIA_URL + path
+
+
+def sources(variants):
+    """
+    ``srcset`` per format for an image's derivatives, best format first.
+
+    Returns:
+        list: (MIME type, srcset) pairs; empty for images without derivatives
+    """
+    if not variants:
+        return []
+    return [
+        (
+            OUTPUT_FORMATS[name][2],
+            ', '.join(
+                f"{upload_url(derivative_name(variants['base'], width, name))} {width}w"
+                for width in variants['widths']
+            ),
+        )
+        for name in variants['formats']
+        if name in OUTPUT_FORMATS
+    ]
+
+
+def display_size(variants, width):
+    """(width, height) for the <img> attributes, so the layout doesn't shift"""
+    if not variants or not variants.get('width'):
+        return None
+    return width, max(1, round(variants['height'] * width / variants['width']))
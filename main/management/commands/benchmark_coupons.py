@@ -0,0 +1,130 @@
+import statistics
+import threading
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from django.utils import timezone
+
+from main import coupons
+from main.models import Coupon, MenuItem, Order, Restaurant
+from main.orders import checkout, create_order
+
+BENCH_NAME = '__benchmark_coupons__'
+
+
+class Command(BaseCommand):
+    help = (
+        'Check out orders carrying one capped coupon from many threads at once and check '
+        'that exactly max_redemptions succeed'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=16, help='Concurrent threads')
+        parser.add_argument('--attempts', type=int, default=25, help='Redemptions attempted per thread')
+        parser.add_argument('--limit', type=int, default=100, help="The coupon's max_redemptions")
+        parser.add_argument('--per-user', type=int, default=None, help="The coupon's max_redemptions_per_user")
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        attempts = options['attempts']
+        now = timezone.now()
+
+        restaurant = Restaurant.objects.create(name=BENCH_NAME, location=BENCH_NAME)
+        users = [User.objects.create(username=f'{BENCH_NAME}{n}') for n in range(workers)]
+        coupon = Coupon.objects.create(
+            code='BENCHCOUPON', discount_percentage=10,
+            valid_from=now - timedelta(days=1), valid_to=now + timedelta(days=1),
+            max_redemptions=options['limit'], max_redemptions_per_user=options['per_user'],
+        )
+        try:
+            item = MenuItem.objects.create(restaurant=restaurant, name='Item', price=100)
+            orders = {
+                user.id: [create_order(user, restaurant, {item.id: 1}) for _ in range(attempts)]
+                for user in users
+            }
+
+            results = {'redeemed': 0, 'refused': 0, 'locked': 0}
+            timings = []
+            lock = threading.Lock()
+            start_line = threading.Barrier(workers)
+
+            def redeem(user):
+                mine = {'redeemed': 0, 'refused': 0, 'locked': 0}
+                mine_timings = []
+                start_line.wait()
+                try:
+                    for order in orders[user.id]:
+                        start = time.perf_counter()
+                        try:
+                            # As in the checkout view: apply, then redeem at checkout
+                            coupons.apply_coupon(order, coupon.code, user)
+                            try:
+                                checkout(order, user)
+                            except coupons.CouponError:
+                                coupons.remove_coupon(order)
+                                raise
+                            mine['redeemed'] += 1
+                        except coupons.CouponError:
+                            mine['refused'] += 1
+                        except OperationalError:
+                            # SQLite gave up waiting for the write lock
+                            mine['locked'] += 1
+                        mine_timings.append((time.perf_counter() - start) * 1000)
+                finally:
+                    connections.close_all()
+                with lock:
+                    for key, value in mine.items():
+                        results[key] += value
+                    timings.extend(mine_timings)
+
+            threads = [threading.Thread(target=redeem, args=(user,)) for user in users]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+            coupon.refresh_from_db()
+            redeemed_orders = Order.objects.filter(restaurant=restaurant, coupon=coupon, coupon_redeemed=True)
+            completed = redeemed_orders.filter(status='Completed').count()
+            redeemed_orders = redeemed_orders.count()
+            capacity = [coupon.max_redemptions, workers * attempts]
+            if coupon.max_redemptions_per_user is not None:
+                capacity.append(workers * min(attempts, coupon.max_redemptions_per_user))
+            expected = min(capacity)
+            self.stdout.write(
+                f'{workers} workers x {attempts} checkouts in {elapsed:.2f}s: '
+                f"{results['redeemed']} redeemed, {results['refused']} refused, {results['locked']} lock timeouts"
+            )
+            self.stdout.write(
+                f'latency: mean {statistics.mean(timings):.2f} ms, p99 {self.percentile(timings, 99):.2f} ms'
+            )
+            self.stdout.write(
+                f'redemption_count {coupon.redemption_count} / max {coupon.max_redemptions}, '
+                f'expected {expected}, redeemed orders {redeemed_orders} ({completed} completed)'
+            )
+            consistent = coupon.redemption_count == redeemed_orders == completed == results['redeemed']
+            # Lock timeouts lose attempts, so then only the cap itself can be checked
+            if results['locked']:
+                exact = coupon.redemption_count <= expected
+            else:
+                exact = coupon.redemption_count == expected
+            if consistent and exact:
+                self.stdout.write(self.style.SUCCESS(f'{coupon.redemption_count} redemption(s) as expected, counters match'))
+            else:
+                self.stdout.write(self.style.ERROR('Counters disagree or the wrong number of checkouts redeemed'))
+        finally:
+            restaurant.delete()
+            coupon.delete()
+            for user in users:
+                user.delete()
+
+    @staticmethod
+    def percentile(values, pct):
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+        return ordered[index]
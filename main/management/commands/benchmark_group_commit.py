@@ -0,0 +1,92 @@
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from main.group_commit import writer
+from main.models import MenuItem, Restaurant
+from main.orders import create_order
+
+BENCH_NAME = '__benchmark_group_commit__'
+
+
+class Command(BaseCommand):
+    help = 'Compare order throughput from concurrent threads with and without group commit'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent ordering threads')
+        parser.add_argument('--duration', type=float, default=5, help='Seconds of traffic per mode')
+
+    def handle(self, *args, **options):
+        restaurant = Restaurant.objects.create(name=BENCH_NAME, location=BENCH_NAME)
+        users = [User.objects.create(username=f'{BENCH_NAME}{n}') for n in range(options['threads'])]
+        enabled = settings.ORDER_GROUP_COMMIT
+        try:
+            items = MenuItem.objects.bulk_create([
+                MenuItem(restaurant=restaurant, name=f'Item {n}', price=10 + n) for n in range(3)
+            ])
+            quantities = {item.id: 1 for item in items}
+
+            self.stdout.write(f"{'mode':<14} {'orders':>7} {'errors':>7} {'orders/s':>9} {'mean ms':>9} {'p99 ms':>9}")
+            for label, group in (('per-request', False), ('group commit', True)):
+                settings.ORDER_GROUP_COMMIT = group
+                batches, written = writer.batches, writer.written
+                orders, errors, timings, elapsed = self.measure(
+                    users, restaurant, quantities, options['duration']
+                )
+                self.stdout.write(
+                    f'{label:<14} {orders:>7} {errors:>7} {orders / elapsed:>9.1f} '
+                    f'{statistics.mean(timings):>9.2f} {self.percentile(timings, 99):>9.2f}'
+                )
+                if group and writer.batches > batches:
+                    self.stdout.write(
+                        f'  {(writer.written - written) / (writer.batches - batches):.1f} orders per transaction'
+                    )
+        finally:
+            settings.ORDER_GROUP_COMMIT = enabled
+            restaurant.delete()
+            for user in users:
+                user.delete()
+
+    def measure(self, users, restaurant, quantities, duration):
+        lock = threading.Lock()
+        totals = {'orders': 0, 'errors': 0}
+        timings = []
+        deadline = time.monotonic() + duration
+
+        def place(user):
+            mine = []
+            errors = 0
+            try:
+                while time.monotonic() < deadline:
+                    start = time.perf_counter()
+                    try:
+                        create_order(user, restaurant, quantities)
+                    except Exception:
+                        errors += 1
+                        continue
+                    mine.append((time.perf_counter() - start) * 1000)
+            finally:
+                connections.close_all()
+            with lock:
+                totals['orders'] += len(mine)
+                totals['errors'] += errors
+                timings.extend(mine)
+
+        threads = [threading.Thread(target=place, args=(user,)) for user in users]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return totals['orders'], totals['errors'], timings or [0], time.perf_counter() - started
+
+    @staticmethod
+    def percentile(values, pct):
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+        return ordered[index]
@@ -0,0 +1,73 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from main.models import MenuItem, Order, OrderItem, Restaurant
+from main.orders import create_order
+
+BENCH_NAME = '__benchmark_orders__'
+
+
+def legacy_place_order(user, restaurant, quantities):
+    """The per-line ORM path place_order used before the ingestion service"""
+    items_to_add = []
+    for item_id, quantity in quantities.items():
+        items_to_add.append((MenuItem.objects.get(id=item_id, restaurant=restaurant), quantity))
+    order = Order(user=user, restaurant=restaurant, status='Pending')
+    order.save()
+    for menu_item, quantity in items_to_add:
+        OrderItem.objects.create(order=order, menu_item=menu_item, quantity=quantity)
+    order.save()
+    return order
+
+
+class Command(BaseCommand):
+    help = 'Compare queries and latency per order for the legacy and bulk order placement paths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Orders placed per path and size')
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 50], help='Order lines per order')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        sizes = options['sizes']
+
+        restaurant = Restaurant.objects.create(name=BENCH_NAME, location=BENCH_NAME)
+        user = User.objects.create(username=BENCH_NAME)
+        try:
+            menu_items = MenuItem.objects.bulk_create([
+                MenuItem(restaurant=restaurant, name=f'Item {n}', price=10 + n)
+                for n in range(max(sizes))
+            ])
+
+            self.stdout.write(f"{'lines':>6} {'path':<8} {'queries':>8} {'mean ms':>9} {'p99 ms':>9}")
+            for size in sizes:
+                quantities = {item.id: 1 for item in menu_items[:size]}
+                for label, place in (('legacy', legacy_place_order), ('bulk', create_order)):
+                    queries, timings = self.measure(place, user, restaurant, quantities, iterations)
+                    self.stdout.write(
+                        f'{size:>6} {label:<8} {queries:>8} '
+                        f'{statistics.mean(timings):>9.2f} {self.percentile(timings, 99):>9.2f}'
+                    )
+        finally:
+            restaurant.delete()
+            user.delete()
+
+    def measure(self, place, user, restaurant, quantities, iterations):
+        timings = []
+        with CaptureQueriesContext(connection) as captured:
+            for _ in range(iterations):
+                start = time.perf_counter()
+                place(user, restaurant, quantities)
+                timings.append((time.perf_counter() - start) * 1000)
+        return len(captured.captured_queries) // iterations, timings
+
+    @staticmethod
+    def percentile(values, pct):
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+        return ordered[index]
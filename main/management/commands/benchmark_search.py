@@ -0,0 +1,66 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main import search
+from main.models import MenuItem, Restaurant
+
+BENCH_NAME = '__benchmark_search__'
+WORDS = [
+    'paneer', 'butter', 'chicken', 'masala', 'tikka', 'dal', 'makhani', 'garlic', 'naan', 'biryani',
+    'spicy', 'ramen', 'miso', 'kimchi', 'bibimbap', 'sushi', 'tempura', 'pasta', 'pizza', 'truffle',
+    'mushroom', 'risotto', 'taco', 'burrito', 'salsa', 'mango', 'lassi', 'coconut', 'curry', 'noodle',
+]
+
+
+class Command(BaseCommand):
+    help = 'Measure search and typeahead latency against a synthetic catalogue (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=100_000, help='Synthetic menu items to index')
+        parser.add_argument('--queries', type=int, default=500, help='Queries per measurement')
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        with transaction.atomic():
+            restaurant = Restaurant.objects.create(name=BENCH_NAME, location=BENCH_NAME)
+            start = time.perf_counter()
+            for offset in range(0, options['items'], search.BATCH_SIZE):
+                items = MenuItem.objects.bulk_create([
+                    MenuItem(
+                        restaurant=restaurant,
+                        name=' '.join(rng.sample(WORDS, 3)).title(),
+                        description=' '.join(rng.choices(WORDS, k=12)),
+                        price=rng.randint(50, 900),
+                    )
+                    for _ in range(min(search.BATCH_SIZE, options['items'] - offset))
+                ])
+                search.index_items(items)
+            self.stdout.write(f"Indexed {options['items']} items in {time.perf_counter() - start:.1f}s "
+                              f"({'FTS5' if search.fts_enabled() else 'portable term index'})")
+
+            prefixes = [word[:length] for word in WORDS for length in (2, 3, 5)]
+            phrases = [f'{a} {b[:3]}' for a, b in zip(rng.choices(WORDS, k=50), rng.choices(WORDS, k=50))]
+            self.stdout.write(f"{'measure':<20} {'mean ms':>9} {'p99 ms':>9}")
+            for label, run, queries in (
+                ('suggest (prefix)', search.suggest, prefixes),
+                ('suggest (phrase)', search.suggest, phrases),
+                ('search (ranked)', search.search, phrases),
+            ):
+                timings = []
+                for _ in range(options['queries']):
+                    query = rng.choice(queries)
+                    begin = time.perf_counter()
+                    run(query)
+                    timings.append((time.perf_counter() - begin) * 1000)
+                self.stdout.write(f'{label:<20} {statistics.mean(timings):>9.2f} {self.percentile(timings, 99):>9.2f}')
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def percentile(values, pct):
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+        return ordered[index]
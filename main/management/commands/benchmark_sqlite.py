@@ -0,0 +1,129 @@
+import multiprocessing
+import os
+import re
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+
+from main.models import MenuItem, Order, Restaurant
+
+BENCH_NAME = '__benchmark_sqlite__'
+# Django's own SQLite behaviour: rollback journal, deferred transactions, no retries
+BASELINE = {'pragmas': {'journal_mode': 'delete'}, 'options': {}, 'retries': 0}
+
+
+def tuned_profile():
+    return {
+        'pragmas': settings.SQLITE_PRAGMAS,
+        'options': settings.DATABASES['default'].get('OPTIONS', {}),
+        'retries': settings.SQLITE_LOCK_RETRIES,
+    }
+
+
+def use_database(path, profile):
+    """Point this process's default connection at ``path`` with a tuning profile"""
+    connections.close_all()
+    connection.settings_dict['NAME'] = path
+    connection.settings_dict['OPTIONS'] = dict(profile['options'])
+    settings.SQLITE_PRAGMAS = profile['pragmas']
+    settings.SQLITE_LOCK_RETRIES = profile['retries']
+
+
+def worker(path, profile, user_id, restaurant_id, item_id, duration, results):
+    """Place and pay for orders through the real views until ``duration`` is up"""
+    use_database(path, profile)
+    client = Client(HTTP_HOST='localhost')
+    client.force_login(User.objects.get(pk=user_id))
+    timings, ops = [], 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        response = client.post(f'/place-order/{restaurant_id}/', {f'quantity_{item_id}': 1})
+        timings.append((time.perf_counter() - start) * 1000)
+        ops += 1
+        match = re.search(r'/order-summary/(\d+)/', response.get('Location', ''))
+        if not match:
+            continue
+        start = time.perf_counter()
+        client.post(f'/checkout/{match[1]}/', {'payment_method': 'card'})
+        timings.append((time.perf_counter() - start) * 1000)
+        ops += 1
+    connections.close_all()
+    results.put((ops, timings))
+
+
+class Command(BaseCommand):
+    help = (
+        'Run concurrent place_order and checkout traffic from several processes against a copy '
+        'of the SQLite database, with SQLite defaults and with the tuned profile'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=8, help='Concurrent worker processes')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of traffic per profile')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('This benchmark only applies to SQLite.')
+        source = str(connection.settings_dict['NAME'])
+        connections.close_all()
+
+        # The views turn write errors into flash messages, so success is counted in the database
+        self.stdout.write(
+            f"{'profile':<9} {'requests':>9} {'placed':>7} {'paid':>6} {'failed':>7} "
+            f"{'writes/s':>9} {'mean ms':>9} {'p99 ms':>9}"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for label, profile in (('baseline', BASELINE), ('tuned', tuned_profile())):
+                path = os.path.join(directory, f'{label}.sqlite3')
+                with sqlite3.connect(source) as src, sqlite3.connect(path) as dst:
+                    src.backup(dst)
+                self.run_profile(label, path, profile, options['processes'], options['duration'])
+
+    def run_profile(self, label, path, profile, processes, duration):
+        use_database(path, profile)
+        restaurant = Restaurant.objects.create(name=BENCH_NAME, location=BENCH_NAME)
+        item = MenuItem.objects.create(restaurant=restaurant, name='Item', price=10)
+        users = [User.objects.create(username=f'{BENCH_NAME}{n}') for n in range(processes)]
+        connections.close_all()
+
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        started = time.perf_counter()
+        workers = [
+            context.Process(
+                target=worker,
+                args=(path, profile, user.pk, restaurant.pk, item.pk, duration, results),
+            )
+            for user in users
+        ]
+        for process in workers:
+            process.start()
+        collected = [results.get() for _ in workers]
+        for process in workers:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        ops = sum(result[0] for result in collected)
+        timings = [t for result in collected for t in result[1]]
+        orders = Order.objects.filter(restaurant=restaurant)
+        placed = orders.count()
+        paid = orders.filter(status='Completed').count()
+        connections.close_all()
+        self.stdout.write(
+            f'{label:<9} {ops:>9} {placed:>7} {paid:>6} {ops - placed - paid:>7} '
+            f'{(placed + paid) / elapsed:>9.1f} {statistics.mean(timings):>9.2f} {self.percentile(timings, 99):>9.2f}'
+        )
+
+    @staticmethod
+    def percentile(values, pct):
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+        return ordered[index]
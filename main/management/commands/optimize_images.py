@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.images import OUTPUT_FORMATS, available_formats, optimize_file
+
+EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+MANIFEST = 'manifest.json'
+
+
+class Command(BaseCommand):
+    help = 'Recompress and resize the bundled images and add WebP/AVIF copies (run before collectstatic)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='Worker processes')
+        parser.add_argument('--max-width', type=int, default=max(settings.IMAGE_WIDTHS),
+                            help='Resize wider images down to this width')
+        parser.add_argument('--force', action='store_true', help='Redo images that are up to date')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        base_dir = Path(settings.BASE_DIR)
+        build_dir = Path(settings.IMAGE_BUILD_DIR)
+        manifest_path = build_dir / MANIFEST
+        try:
+            previous = json.loads(manifest_path.read_text())
+        except (FileNotFoundError, ValueError):
+            previous = {}
+
+        formats = [name for name in available_formats() if name != 'png']
+        # Changing any of these redoes every image
+        signature = hashlib.sha256(json.dumps(
+            [options['max_width'], formats, {name: spec[3] for name, spec in OUTPUT_FORMATS.items()}],
+            sort_keys=True,
+        ).encode()).hexdigest()
+
+        manifest = {}
+        pending = {}
+        for source in self.sources(base_dir):
+            key = source.relative_to(base_dir).as_posix()
+            digest = hashlib.sha256(source.read_bytes()).hexdigest()
+            entry = previous.get(key)
+            if (
+                not options['force']
+                and entry
+                and entry['sha256'] == digest
+                and entry['signature'] == signature
+                and all((build_dir / output[0]).exists() for output in entry['outputs'].values() if output)
+            ):
+                manifest[key] = entry
+            else:
+                pending[key] = (source, digest)
+
+        failed = 0
+        if pending:
+            with ProcessPoolExecutor(max_workers=max(1, options['jobs'])) as executor:
+                futures = {
+                    executor.submit(
+                        optimize_file, str(source), str(build_dir / key),
+                        options['max_width'], formats, settings.IMAGE_MAX_PIXELS,
+                    ): (key, source, digest)
+                    for key, (source, digest) in pending.items()
+                }
+                for future in as_completed(futures):
+                    key, source, digest = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # The original is still collected as it is
+                        failed += 1
+                        self.stderr.write(f'{key}: {e}')
+                        continue
+                    outputs = {}
+                    for name, output in result['outputs'].items():
+                        if output:
+                            path, size = output
+                            output = [Path(path).relative_to(build_dir).as_posix(), size]
+                        outputs[name] = output
+                    manifest[key] = {
+                        'sha256': digest,
+                        'signature': signature,
+                        'size': source.stat().st_size,
+                        'format': result['format'],
+                        'width': result['width'],
+                        'height': result['height'],
+                        'outputs': outputs,
+                    }
+
+        self.remove_stale(build_dir, previous, manifest)
+        build_dir.mkdir(parents=True, exist_ok=True)
+        temporary = manifest_path.with_suffix('.tmp')
+        temporary.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+        os.replace(temporary, manifest_path)
+
+        self.report(manifest, len(pending) - failed, failed, time.perf_counter() - started)
+
+    @staticmethod
+    def sources(base_dir):
+        for directory in settings.IMAGE_OPTIMIZE_DIRS:
+            for root, _, files in os.walk(base_dir / directory):
+                for name in sorted(files):
+                    if name.lower().endswith(EXTENSIONS):
+                        yield Path(root) / name
+
+    @staticmethod
+    def remove_stale(build_dir, previous, manifest):
+        """Delete outputs of images that were removed or no longer need them"""
+        current = {output[0] for entry in manifest.values() for output in entry['outputs'].values() if output}
+        for entry in previous.values():
+            for output in entry['outputs'].values():
+                if output and output[0] not in current:
+                    (build_dir / output[0]).unlink(missing_ok=True)
+
+    def report(self, manifest, optimized, failed, elapsed):
+        self.stdout.write(
+            f'{optimized} images optimized, {len(manifest) - optimized} unchanged, '
+            f'{failed} failed in {elapsed:.1f}s'
+        )
+        original = sum(entry['size'] for entry in manifest.values())
+        served = 0
+        alternatives = {}
+        for entry in manifest.values():
+            for name, output in entry['outputs'].items():
+                if name == entry['format']:
+                    served += output[1] if output else entry['size']
+                elif output:
+                    alternatives[name] = alternatives.get(name, 0) + output[1]
+        saved = original - served
+        percent = 100 * saved / original if original else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Bundled images: {self.size(original)} -> {self.size(served)} '
+            f'(saved {self.size(saved)}, {percent:.0f}%)'
+        ))
+        for name, size in sorted(alternatives.items()):
+            self.stdout.write(f'  {name} copies: {self.size(size)}')
+
+    @staticmethod
+    def size(count):
+        return f'{count / (1024 * 1024):.1f} MB'
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from main.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily, hourly and per-item dashboard rollups from orders and reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurant', type=int, action='append', dest='restaurants',
+                            help='Only rebuild this restaurant id (may be repeated)')
+
+    def handle(self, *args, **options):
+        written = rebuild(restaurant_ids=options['restaurants'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rollups: {written} rows written'))
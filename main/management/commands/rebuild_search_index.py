@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.search import fts_enabled, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the restaurant and menu item search index'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            indexed = rebuild()
+        backend = 'FTS5' if fts_enabled() else 'portable term index'
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search index ({backend}): {indexed} documents'))
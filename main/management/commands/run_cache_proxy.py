@@ -0,0 +1,180 @@
+import http.client
+import threading
+import time
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from main.shared_cache import SURROGATE_KEY_HEADER, fetch_purges, latest_purge_id, prune_purges
+
+HOP_BY_HOP = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailers', 'transfer-encoding', 'upgrade',
+}
+# Prune the purge log every this many polls
+PRUNE_EVERY = 600
+
+
+def shared_max_age(headers):
+    """s-maxage from a response's Cache-Control if a shared cache may store it, else None"""
+    directives = {}
+    for part in headers.get('Cache-Control', '').split(','):
+        name, _, value = part.strip().partition('=')
+        directives[name.lower()] = value
+    if 'public' not in directives or {'private', 'no-store'} & directives.keys():
+        return None
+    try:
+        return int(directives.get('s-maxage', ''))
+    except ValueError:
+        return None
+
+
+class ProxyCache:
+    """In-memory page store indexed by surrogate key"""
+
+    def __init__(self):
+        self.entries = {}
+        self.by_key = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def get(self, url):
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is None or entry['expires'] < time.time():
+                return None
+            return entry
+
+    def put(self, url, status, headers, body, ttl):
+        keys = dict(headers).get(SURROGATE_KEY_HEADER, '').split()
+        with self.lock:
+            self.entries[url] = {
+                'status': status,
+                'headers': headers,
+                'body': body,
+                'stored': time.time(),
+                'expires': time.time() + ttl,
+            }
+            for key in keys:
+                self.by_key[key].add(url)
+
+    def purge(self, keys):
+        with self.lock:
+            urls = set().union(*(self.by_key.pop(key, set()) for key in keys))
+            for url in urls:
+                self.entries.pop(url, None)
+            return len(urls)
+
+
+class Command(BaseCommand):
+    help = (
+        'Run a local caching reverse proxy that honours s-maxage and Surrogate-Key headers '
+        'and applies purge events; a stand-in for the CDN in development and load tests'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default='127.0.0.1:8080', help='Address to listen on')
+        parser.add_argument('--upstream', default='http://127.0.0.1:8000', help='Django server to forward to')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds between purge event polls')
+
+    def handle(self, *args, **options):
+        host, _, port = options['bind'].rpartition(':')
+        upstream = urlsplit(options['upstream'])
+        cache = ProxyCache()
+        command = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self.proxy(cacheable=True)
+
+            def do_HEAD(self):
+                self.proxy(cacheable=True)
+
+            def do_POST(self):
+                self.proxy(cacheable=False)
+
+            do_PUT = do_PATCH = do_DELETE = do_OPTIONS = do_POST
+
+            def proxy(self, cacheable):
+                cookies = SimpleCookie(self.headers.get('Cookie', ''))
+                if settings.SESSION_COOKIE_NAME in cookies:
+                    # Signed-in (or at least session-holding) visitors always go upstream
+                    cacheable = False
+
+                if cacheable:
+                    entry = cache.get(self.path)
+                    if entry is not None:
+                        age = int(time.time() - entry['stored'])
+                        return self.reply(entry['status'], entry['headers'], entry['body'], 'HIT', age)
+
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else None
+                headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_BY_HOP}
+                headers['X-Forwarded-For'] = self.client_address[0]
+                connection = http.client.HTTPConnection(upstream.hostname, upstream.port or 80, timeout=30)
+                try:
+                    connection.request(self.command, self.path, body=body, headers=headers)
+                    response = connection.getresponse()
+                    payload = response.read()
+                    response_headers = [(k, v) for k, v in response.getheaders() if k.lower() not in HOP_BY_HOP]
+                finally:
+                    connection.close()
+
+                status = 'BYPASS'
+                if cacheable:
+                    status = 'MISS'
+                    ttl = shared_max_age(dict(response_headers))
+                    has_cookies = any(k.lower() == 'set-cookie' for k, _ in response_headers)
+                    if self.command == 'GET' and response.status == 200 and ttl and not has_cookies:
+                        cache.put(self.path, response.status, response_headers, payload, ttl)
+                self.reply(response.status, response_headers, payload, status)
+
+            def reply(self, status, headers, body, cache_status, age=None):
+                self.send_response(status)
+                for header, value in headers:
+                    # Surrogate keys are for caches, not browsers
+                    if header.lower() not in ('content-length', SURROGATE_KEY_HEADER.lower()):
+                        self.send_header(header, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('X-Cache', cache_status)
+                if age is not None:
+                    self.send_header('Age', str(age))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                command.stdout.write(f'{self.address_string()} {format % args}')
+
+        threading.Thread(target=self.consume_purges, args=(cache, options['poll']), daemon=True).start()
+        server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), Handler)
+        self.stdout.write(f"Caching proxy on http://{options['bind']} -> {options['upstream']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+    def consume_purges(self, cache, interval):
+        last_id = latest_purge_id()
+        polls = 0
+        while True:
+            time.sleep(interval)
+            try:
+                for event_id, keys in fetch_purges(last_id):
+                    last_id = event_id
+                    purged = cache.purge(keys)
+                    self.stdout.write(f"Purged {purged} page(s) for {' '.join(keys)}")
+                polls += 1
+                if polls % PRUNE_EVERY == 0:
+                    prune_purges()
+            except Exception as e:
+                self.stderr.write(f'Purge poll failed: {e}')
+                connections.close_all()
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Max, Min, Sum
+
+from main.models import MenuItem, Restaurant, Review
+
+
+class Command(BaseCommand):
+    help = 'Check the denormalized restaurant rating and menu stats against their source rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Recompute the stats of every restaurant')
+
+    def handle(self, *args, **options):
+        menus = {
+            row['restaurant']: row for row in MenuItem.objects.order_by().values('restaurant').annotate(
+                menu_item_count=Count('id'), min_price=Min('price'), max_price=Max('price'),
+            )
+        }
+        reviews = {
+            row['restaurant']: row for row in Review.objects.order_by().values('restaurant').annotate(
+                rating_sum=Sum('rating'), review_count=Count('id'),
+            )
+        }
+
+        mismatched = 0
+        for restaurant in Restaurant.objects.only('name', *Restaurant.STATS_FIELDS):
+            expected = {
+                'menu_item_count': 0, 'min_price': None, 'max_price': None,
+                'rating_sum': 0, 'review_count': 0,
+            }
+            expected.update({k: v for k, v in menus.get(restaurant.pk, {}).items() if k != 'restaurant'})
+            expected.update({k: v for k, v in reviews.get(restaurant.pk, {}).items() if k != 'restaurant'})
+            stale = {
+                field: (getattr(restaurant, field), value)
+                for field, value in expected.items()
+                if getattr(restaurant, field) != value
+            }
+            if stale:
+                mismatched += 1
+                details = ', '.join(f'{field}: {stored} != {actual}' for field, (stored, actual) in stale.items())
+                self.stdout.write(self.style.WARNING(f'{restaurant.name} (#{restaurant.pk}): {details}'))
+
+        if options['fix']:
+            Restaurant.update_menu_stats()
+            Restaurant.update_review_stats()
+            self.stdout.write(self.style.SUCCESS(f'Recomputed stats; {mismatched} restaurant(s) were out of date'))
+        elif mismatched:
+            self.stdout.write(self.style.ERROR(f'{mismatched} restaurant(s) have stale stats, rerun with --fix'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All restaurant stats are up to date'))
@@ -0,0 +1,197 @@
+"""
+Versioned per-restaurant menu cache for restaurant_detail and menu_view.
+
+Each restaurant's menu is cached as plain dicts (restaurant fields plus its
+items, already in display order) under a key that embeds a per-restaurant
+version counter. Any Restaurant, MenuItem or Review write bumps the counter,
+so stale entries are never read again and simply expire. The list of all
+restaurants is cached the same way under a catalogue version. The counters
+live in the database (main.cache_versions), so a write in one worker process
+is seen by all of them. A cache hit serves either view with one primary-key
+lookup of the counters instead of the menu queries. The versions and
+last-modified times double as cheap HTTP validators (main.api,
+main.conditional).
+
+Hit/miss counts and rebuild timings are kept per process and reported by
+stats() for the health endpoint.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache_versions
+from .models import MenuItem, Restaurant, Review
+from .replica import use_primary
+
+CATALOGUE_VERSION_KEY = 'menu:catalogue'
+
+_stats = {'hits': 0, 'misses': 0, 'rebuilds': 0, 'rebuild_seconds': 0.0}
+_stats_lock = threading.Lock()
+
+
+def _timeout():
+    return getattr(settings, 'MENU_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def _version_key(restaurant_id):
+    return f'menu:{restaurant_id}'
+
+
+def _menu_key(restaurant_id, version):
+    # The build too: entries hold content-hashed image URLs
+    return f'menu:{settings.BUILD_VERSION}:{restaurant_id}:v{version}'
+
+
+def bump(restaurant_id):
+    """Invalidate one restaurant's cached menu and the catalogue"""
+    cache_versions.bump(_version_key(restaurant_id), CATALOGUE_VERSION_KEY)
+
+
+def _record(hits=0, misses=0, rebuild_seconds=None):
+    with _stats_lock:
+        _stats['hits'] += hits
+        _stats['misses'] += misses
+        if rebuild_seconds is not None:
+            _stats['rebuilds'] += 1
+            _stats['rebuild_seconds'] += rebuild_seconds
+
+
+def stats():
+    """Hit ratio and rebuild timings for this process"""
+    with _stats_lock:
+        snapshot = dict(_stats)
+    lookups = snapshot['hits'] + snapshot['misses']
+    snapshot['hit_ratio'] = round(snapshot['hits'] / lookups, 4) if lookups else None
+    snapshot['avg_rebuild_ms'] = (
+        round(snapshot['rebuild_seconds'] * 1000 / snapshot['rebuilds'], 3) if snapshot['rebuilds'] else None
+    )
+    return snapshot
+
+
+def serialize_restaurant(restaurant):
+    return {
+        'id': restaurant.id,
+        'name': restaurant.name,
+        'location': restaurant.location,
+        'description': restaurant.description,
+        'image': restaurant.image,
+        'image_variants': restaurant.image_variants,
+        'url': restaurant.url,
+        'image_sources': restaurant.image_sources,
+        'cuisine': restaurant.cuisine,
+        'get_cuisine_display': restaurant.get_cuisine_display(),
+        'review_count': restaurant.review_count,
+        'average_rating': restaurant.average_rating,
+        'menu_item_count': restaurant.menu_item_count,
+        'min_price': restaurant.min_price,
+        'max_price': restaurant.max_price,
+    }
+
+
+def serialize_item(item):
+    return {
+        'id': item.id,
+        'name': item.name,
+        'description': item.description,
+        'price': item.price,
+        'image': item.image,
+        'image_variants': item.image_variants,
+        'url': item.url,
+        'image_sources': item.image_sources,
+    }
+
+
+def catalogue_version():
+    """Change version covering every restaurant"""
+    return cache_versions.get(CATALOGUE_VERSION_KEY)[0]
+
+
+def versions(restaurant_ids):
+    """Change version of each restaurant's menu, reviews and details"""
+    found = cache_versions.get_many([_version_key(rid) for rid in restaurant_ids])
+    return {rid: found[_version_key(rid)][0] for rid in restaurant_ids}
+
+
+def last_modified(restaurant_id=None):
+    """When one restaurant, or without an id any restaurant, last changed; None if unknown"""
+    key = CATALOGUE_VERSION_KEY if restaurant_id is None else _version_key(restaurant_id)
+    return cache_versions.get(key)[1]
+
+
+def get_catalogue():
+    """All restaurants as dicts, ordered by id"""
+    version = catalogue_version()
+    key = f'menu:catalogue:{settings.BUILD_VERSION}:v{version}'
+    catalogue = cache.get(key)
+    if catalogue is not None:
+        _record(hits=1)
+        return catalogue
+
+    start = time.perf_counter()
+    with use_primary():
+        catalogue = [serialize_restaurant(r) for r in Restaurant.objects.order_by('id')]
+    cache.set(key, catalogue, _timeout())
+    _record(misses=1, rebuild_seconds=time.perf_counter() - start)
+    return catalogue
+
+
+def get_menus(restaurant_ids):
+    """
+    Cached menus for several restaurants.
+
+    Returns:
+        dict: restaurant id -> {'restaurant': dict, 'items': [dict, ...]};
+            ids of restaurants that don't exist are left out
+    """
+    if not restaurant_ids:
+        return {}
+    current = versions(restaurant_ids)
+    keys = {rid: _menu_key(rid, current[rid]) for rid in restaurant_ids}
+    found = cache.get_many(keys.values())
+    menus = {rid: found[key] for rid, key in keys.items() if key in found}
+
+    missing = [rid for rid in restaurant_ids if rid not in menus]
+    _record(hits=len(menus), misses=len(missing))
+    if missing:
+        start = time.perf_counter()
+        # Cached copies must come from the primary, not a lagging replica
+        with use_primary():
+            rebuilt = {
+                r.id: {'restaurant': serialize_restaurant(r), 'items': []}
+                for r in Restaurant.objects.filter(id__in=missing)
+            }
+            for item in MenuItem.objects.filter(restaurant_id__in=rebuilt).order_by('restaurant_id', 'id'):
+                rebuilt[item.restaurant_id]['items'].append(serialize_item(item))
+        cache.set_many({keys[rid]: menu for rid, menu in rebuilt.items()}, _timeout())
+        _record(rebuild_seconds=time.perf_counter() - start)
+        menus.update(rebuilt)
+    return menus
+
+
+def get_menu(restaurant_id):
+    """Cached menu for one restaurant, or None if it doesn't exist"""
+    return get_menus([restaurant_id]).get(restaurant_id)
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def restaurant_changed(sender, instance, **kwargs):
+    # After commit, so a concurrent rebuild can't cache pre-commit rows under the new version
+    restaurant_id = instance.pk
+    transaction.on_commit(lambda: bump(restaurant_id))
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def menu_changed(sender, instance, **kwargs):
+    # Reviews change the rating shown alongside the menu
+    restaurant_id = instance.restaurant_id
+    transaction.on_commit(lambda: bump(restaurant_id))
@@ -1,85 +1,300 @@
-import os
-import mimetypes
-import logging
+"""
+Serving uploaded media (restaurant and menu item images) under MEDIA_URL.
+
+MediaFilesMiddleware answers GET and HEAD requests for files in MEDIA_ROOT
+before the rest of the stack runs:
+
+- Validators: a strong ETag built from the file's size and modification time,
+  and Last-Modified. ``If-None-Match``/``If-Modified-Since`` get a 304,
+  ``If-Match``/``If-Unmodified-Since`` a 412.
+- Ranges: a single byte range gets a 206 with ``Content-Range``, an
+  unsatisfiable one a 416. Several ranges, or an ``If-Range`` that no longer
+  matches, get the whole file, as HTTP allows.
+- Metadata: the stat result, MIME type and validators of each file are kept
+  in a per-process cache and re-checked every ``MEDIA_STAT_TTL`` seconds.
+
+The bytes themselves don't pass through Python. By default the response
+wraps the open file, positioned at the start of the range and with an exact
+Content-Length; gunicorn hands such a response to ``os.sendfile()`` through
+``wsgi.file_wrapper``. Behind nginx or Apache, ``MEDIA_SENDFILE`` offloads the
+body to the proxy instead: ``x-accel-redirect`` sends the internal location
+``MEDIA_ACCEL_REDIRECT_PREFIX`` + path, ``x-sendfile`` the absolute file path.
+"""
+
 import asyncio
-from contextlib import contextmanager
+import logging
+import mimetypes
+import os
+import threading
+import time
+from dataclasses import dataclass
+
 from django.conf import settings
-from django.http import HttpResponse, FileResponse
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
 from django.utils.decorators import sync_and_async_middleware
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+from . import images
 
 logger = logging.getLogger(__name__)
 
+CACHE_CONTROL = 'public, max-age=31536000'
+# Uploaded image derivatives are named after their content (main.images)
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+METADATA_CACHE_SIZE = 10_000
+
+
+@dataclass(frozen=True)
+class MediaFile:
+    path: str
+    size: int
+    mtime: int
+    content_type: str
+    etag: str
+    last_modified: str
+    immutable: bool
+    checked: float
+
+    @classmethod
+    def stat(cls, path, immutable=False):
+        """Metadata for a regular file, or None if there is none at ``path``"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path):
+            return None
+        content_type, encoding = mimetypes.guess_type(path)
+        if encoding or not content_type:
+            # Never let a browser transparently decompress a .gz upload
+            content_type = 'application/octet-stream'
+        return cls(
+            path=path,
+            size=st.st_size,
+            mtime=int(st.st_mtime),
+            content_type=content_type,
+            etag=f'"{st.st_size:x}-{st.st_mtime_ns:x}"',
+            last_modified=http_date(st.st_mtime),
+            immutable=immutable,
+            checked=time.monotonic(),
+        )
+
+
+class MetadataCache:
+    """Per-process map of relative media path -> MediaFile"""
+
+    def __init__(self):
+        self.files = {}
+        self.lock = threading.Lock()
+
+    def get(self, relative_path):
+        media = self.files.get(relative_path)
+        if media and time.monotonic() - media.checked < settings.MEDIA_STAT_TTL:
+            return media
+        try:
+            path = safe_join(settings.MEDIA_ROOT, relative_path)
+        except SuspiciousFileOperation:
+            return None
+        media = MediaFile.stat(path, immutable=images.is_upload(relative_path))
+        with self.lock:
+            if media is None:
+                self.files.pop(relative_path, None)
+            else:
+                if len(self.files) >= METADATA_CACHE_SIZE:
+                    self.files = {}
+                self.files[relative_path] = media
+        return media
+
+    def forget(self, relative_path):
+        with self.lock:
+            self.files.pop(relative_path, None)
+
+
+metadata = MetadataCache()
+
+
+def parse_range(header, size):
+    """
+    The byte range a ``Range`` header asks for.
+
+    Args:
+        header (str): The Range header value
+        size (int): The file size
+
+    Returns:
+        (start, end) inclusive for one satisfiable range; None when the whole
+        file should be sent instead (no range, several ranges, or a header
+        that can't be parsed)
+
+    Raises:
+        ValueError: When the range lies entirely past the end of the file
+    """
+    unit, _, ranges = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in ranges:
+        return None
+    first, dash, last = (part.strip() for part in ranges.strip().partition('-'))
+    if not dash or not (first or last) or not all(part.isdecimal() for part in (first, last) if part):
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError('empty suffix range')
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None
+    if start >= size:
+        raise ValueError('range starts past the end of the file')
+    return start, min(end, size - 1)
+
+
+class FileRange:
+    """Read-only view of ``length`` bytes from a file's current position"""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def fileno(self):
+        # For wsgi.file_wrapper / os.sendfile(), which start at the file's
+        # position and stop at the response's Content-Length
+        return self.file.fileno()
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
 @sync_and_async_middleware
 class MediaFilesMiddleware:
     """
-    Middleware to handle media files with proper cache control and content type headers.
-    This helps ensure media files are properly served and cached by browsers.
-    
+    Middleware to serve media files with validators, byte ranges and sendfile.
+
     Supports both sync and async operations using Django's sync_and_async_middleware.
     """
-    
+
     def __init__(self, get_response):
         self.get_response = get_response
         # Initialize MIME types
         mimetypes.init()
-        logger.info("MediaFilesMiddleware initialized")
-    
+
     def __call__(self, request):
         """Synchronous request handler"""
-        # Check if this is a media file request
-        if request.path.startswith(settings.MEDIA_URL):
+        if self.is_media_request(request):
             response = self.handle_media_request(request)
             if response:
                 return response
-        
+
         # Not a media file or file not found, continue with regular processing
         return self.get_response(request)
-    
+
     async def __acall__(self, request):
         """Asynchronous request handler"""
-        # Check if this is a media file request
-        if request.path.startswith(settings.MEDIA_URL):
-            # Use sync_to_async to handle file operations which are blocking
+        if self.is_media_request(request):
+            # stat() and open() block, so run them in a thread
             response = await asyncio.to_thread(self.handle_media_request, request)
             if response:
                 return response
-        
+
         # Not a media file or file not found, continue with regular processing
         return await self.get_response(request)
-    
+
+    @staticmethod
+    def is_media_request(request):
+        return request.method in ('GET', 'HEAD') and request.path.startswith(settings.MEDIA_URL)
+
     def handle_media_request(self, request):
-        """Handle media file requests for both sync and async contexts"""
-        # Extract relative path from media URL
+        """Response for a media file, or None if there is no such file"""
         relative_path = request.path[len(settings.MEDIA_URL):]
-        # Construct absolute file path
-        file_path = os.path.join(settings.MEDIA_ROOT, relative_path)
-        
-        # Check if file exists
-        if os.path.exists(file_path) and os.path.isfile(file_path):
+        media = metadata.get(relative_path)
+        if media is None:
+            return None
+
+        response = get_conditional_response(request, etag=media.etag, last_modified=media.mtime)
+        if response is not None:
+            return self.add_headers(response, media)
+        if settings.MEDIA_SENDFILE:
+            # The proxy sends the file and handles Range itself
+            return self.add_headers(self.offload(media), media)
+
+        start, end = 0, media.size - 1
+        status = 200
+        range_header = request.META.get('HTTP_RANGE')
+        if range_header and self.if_range_matches(request, media):
             try:
-                # Get content type based on file extension
-                content_type, encoding = mimetypes.guess_type(file_path)
-                if not content_type:
-                    content_type = 'application/octet-stream'
-                
-                # Use FileResponse for better performance with proper file handling
-                with open(file_path, 'rb') as f:
-                    response = FileResponse(f, content_type=content_type)
-                    
-                    # Set cache control headers
-                    response['Cache-Control'] = 'public, max-age=31536000'  # Cache for 1 year
-                    response['Content-Disposition'] = 'inline; filename=' + os.path.basename(file_path)
-                    response['Accept-Ranges'] = 'bytes'  # Support range requests for video/audio
-                    
-                    logger.info(f"Serving media file: {file_path}")
-                    return response
-            except FileNotFoundError:
-                logger.error(f"Media file not found: {file_path}")
-            except PermissionError:
-                logger.error(f"Permission denied for media file: {file_path}")
-            except Exception as e:
-                logger.error(f"Error serving media file {file_path}: {str(e)}")
-        
-        # File doesn't exist or error occurred
-        return None
+                requested = parse_range(range_header, media.size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{media.size}'
+                return self.add_headers(response, media)
+            if requested:
+                (start, end), status = requested, 206
+
+        length = end - start + 1
+        if request.method == 'HEAD' or length == 0:
+            response = HttpResponse(content_type=media.content_type)
+        else:
+            try:
+                response = self.stream(media, start, length)
+            except OSError as e:
+                # Deleted or replaced since it was stat'ed
+                logger.warning(f'Error serving media file {media.path}: {e}')
+                metadata.forget(relative_path)
+                return None
+        response.status_code = status
+        response['Content-Length'] = length
+        if status == 206:
+            response['Content-Range'] = f'bytes {start}-{end}/{media.size}'
+        return self.add_headers(response, media)
+
+    @staticmethod
+    def if_range_matches(request, media):
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if not if_range:
+            return True
+        if if_range.startswith(('"', 'W/')):
+            return if_range == media.etag
+        modified = parse_http_date_safe(if_range)
+        return modified is not None and modified >= media.mtime
+
+    @staticmethod
+    def offload(media):
+        response = HttpResponse(content_type=media.content_type)
+        if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+            relative_path = os.path.relpath(media.path, settings.MEDIA_ROOT).replace(os.sep, '/')
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + relative_path
+        else:
+            response['X-Sendfile'] = media.path
+        return response
+
+    @staticmethod
+    def stream(media, start, length):
+        file = open(media.path, 'rb')
+        try:
+            file.seek(start)
+            return FileResponse(FileRange(file, length), content_type=media.content_type)
+        except BaseException:
+            file.close()
+            raise
 
+    @staticmethod
+    def add_headers(response, media):
+        response['ETag'] = media.etag
+        response['Last-Modified'] = media.last_modified
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if media.immutable else CACHE_CONTROL
+        response['Accept-Ranges'] = 'bytes'
+        if response.status_code < 300:
+            response['Content-Disposition'] = content_disposition_header(False, os.path.basename(media.path))
+        return response
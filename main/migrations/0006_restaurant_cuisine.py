@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2025-04-12 06:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_alter_menuitem_restaurant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='cuisine',
+            field=models.CharField(choices=[('korean', 'Korean'), ('italian', 'Italian'), ('japanese', 'Japanese'), ('mexican', 'Mexican'), ('chinese', 'Chinese'), ('thai', 'Thai'), ('spanish', 'Spanish'), ('indian', 'Indian')], default='indian', max_length=20),
+        ),
+    ]
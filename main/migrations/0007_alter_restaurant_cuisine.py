@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2025-04-17 06:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_restaurant_cuisine'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='restaurant',
+            name='cuisine',
+            field=models.CharField(choices=[('korean', 'Korean'), ('italian', 'Italian'), ('japanese', 'Japanese'), ('mexican', 'Mexican'), ('chinese', 'Chinese'), ('thai', 'Thai'), ('spanish', 'Spanish'), ('indian', 'Indian')], default='indian', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2025-04-29 16:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_owner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='has_been_reviewed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2 on 2026-10-17 04:46
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+
+
+def backfill_order_totals(apps, schema_editor):
+    Order = apps.get_model('main', 'Order')
+    OrderItem = apps.get_model('main', 'OrderItem')
+    lines = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    subtotal = Coalesce(
+        Subquery(lines.annotate(s=Sum(F('quantity') * F('menu_item__price'))).values('s')),
+        0,
+        output_field=models.DecimalField(max_digits=8, decimal_places=2),
+    )
+    Order.objects.update(
+        total_price=subtotal,
+        item_count=Coalesce(Subquery(lines.annotate(c=Sum('quantity')).values('c')), 0),
+        total_after_discount=Greatest(subtotal - F('discount_applied'), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_order_has_been_reviewed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_after_discount',
+            field=models.DecimalField(decimal_places=2, default=0.0, editable=False, max_digits=8),
+        ),
+        migrations.AlterField(
+            model_name='menuitem',
+            name='image',
+            field=models.CharField(blank=True, help_text='Relative path to image in static/images/menu_items/', max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='restaurant',
+            name='image',
+            field=models.CharField(blank=True, help_text='Relative path to image in static/images/restaurants/', max_length=255, null=True),
+        ),
+        migrations.RunPython(backfill_order_totals, migrations.RunPython.noop),
+    ]
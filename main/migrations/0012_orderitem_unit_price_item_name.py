@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-17 04:48
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def backfill_price_snapshot(apps, schema_editor):
+    OrderItem = apps.get_model('main', 'OrderItem')
+    items = OrderItem.objects.select_related('menu_item').order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(items.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            break
+        for item in batch:
+            item.unit_price = item.menu_item.price
+            item.item_name = item.menu_item.name
+        OrderItem.objects.bulk_update(batch, ['unit_price', 'item_name'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_order_item_count_order_total_after_discount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='item_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(backfill_price_snapshot, migrations.RunPython.noop),
+    ]
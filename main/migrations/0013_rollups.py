@@ -0,0 +1,61 @@
+# Generated by Django 5.2 on 2026-10-17 04:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_orderitem_unit_price_item_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('pending_orders', models.PositiveIntegerField(default=0)),
+                ('completed_orders', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('discounted_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='main.restaurant')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('restaurant', 'date'), name='unique_daily_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('completed_orders', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('discounted_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_rollups', to='main.restaurant')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('restaurant', 'hour'), name='unique_hourly_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ItemRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('item_name', models.CharField(max_length=255)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='item_rollups', to='main.restaurant')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('restaurant', 'date', 'item_name'), name='unique_item_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2 on 2026-10-17 04:54
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_restaurant_stats(apps, schema_editor):
+    Restaurant = apps.get_model('main', 'Restaurant')
+    MenuItem = apps.get_model('main', 'MenuItem')
+    Review = apps.get_model('main', 'Review')
+    items = MenuItem.objects.filter(restaurant=OuterRef('pk')).order_by().values('restaurant')
+    reviews = Review.objects.filter(restaurant=OuterRef('pk')).order_by().values('restaurant')
+    Restaurant.objects.update(
+        menu_item_count=Coalesce(Subquery(items.annotate(c=Count('id')).values('c')), 0),
+        min_price=Subquery(items.annotate(p=Min('price')).values('p')),
+        max_price=Subquery(items.annotate(p=Max('price')).values('p')),
+        rating_sum=Coalesce(Subquery(reviews.annotate(s=Sum('rating')).values('s')), 0),
+        review_count=Coalesce(Subquery(reviews.annotate(c=Count('id')).values('c')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_orderevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='max_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='menu_item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='min_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_restaurant_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2 on 2026-10-17 04:58
+
+import django.db.models.deletion
+from django.db import OperationalError, migrations, models
+
+
+def create_fts_table(apps, schema_editor):
+    # SQLite builds without FTS5 fall back to SearchDocument/SearchTerm
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE main_search USING fts5("
+            "title, body, restaurant_id UNINDEXED, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+    except OperationalError:
+        pass
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS main_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_restaurant_summary_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('restaurant', 'Restaurant'), ('item', 'Menu item')], max_length=10)),
+                ('object_id', models.PositiveIntegerField()),
+                ('restaurant_id', models.PositiveIntegerField()),
+                ('title', models.CharField(max_length=255)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_document')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(db_index=True, max_length=64)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='main.searchdocument')),
+            ],
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-17 05:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurgeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('keys', models.CharField(help_text='Space separated surrogate keys', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
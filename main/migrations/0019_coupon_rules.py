@@ -0,0 +1,66 @@
+# Generated by Django 5.2 on 2026-10-17 05:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_redemption_count(apps, schema_editor):
+    # Orders already carrying a coupon count against any limit set later
+    Coupon = apps.get_model('main', 'Coupon')
+    Order = apps.get_model('main', 'Order')
+    orders = Order.objects.filter(coupon=OuterRef('pk')).order_by().values('coupon')
+    Coupon.objects.update(
+        redemption_count=Coalesce(Subquery(orders.annotate(c=Count('id')).values('c')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_purgeevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coupon',
+            name='max_redemptions',
+            field=models.PositiveIntegerField(blank=True, help_text='Leave empty for no limit', null=True),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='max_redemptions_per_user',
+            field=models.PositiveIntegerField(blank=True, help_text='Leave empty for no limit', null=True),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='min_order_total',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Minimum subtotal for the coupon to apply', max_digits=8),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='redemption_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='restaurant',
+            field=models.ForeignKey(blank=True, help_text='Only valid at this restaurant', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='coupons', to='main.restaurant'),
+        ),
+        migrations.CreateModel(
+            name='CouponUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('redemptions', models.PositiveIntegerField(default=0)),
+                ('coupon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usages', to='main.coupon')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='coupon_usages', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('coupon', 'user'), name='unique_coupon_usage')],
+            },
+        ),
+        migrations.RunPython(backfill_redemption_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 05:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0019_coupon_rules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='menuitem',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-17 05:57
+
+import time
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def seed_menu_versions(apps, schema_editor):
+    # Versions start from the clock, so menus cached under the old per-process
+    # counters are never read again
+    CacheVersion = apps.get_model('main', 'CacheVersion')
+    Restaurant = apps.get_model('main', 'Restaurant')
+    now = timezone.now()
+    keys = ['menu:catalogue'] + [f'menu:{pk}' for pk in Restaurant.objects.values_list('pk', flat=True)]
+    CacheVersion.objects.bulk_create(
+        [CacheVersion(key=key, version=time.time_ns(), modified=now) for key in keys],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0020_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('key', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField()),
+                ('modified', models.DateTimeField()),
+            ],
+        ),
+        migrations.RunPython(seed_menu_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-17 05:59
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def recount_redemptions(apps, schema_editor):
+    # Coupons used to be counted when applied to a pending order. Only orders
+    # past checkout hold a redemption now, so recount from those
+    Coupon = apps.get_model('main', 'Coupon')
+    CouponUsage = apps.get_model('main', 'CouponUsage')
+    Order = apps.get_model('main', 'Order')
+    Order.objects.filter(coupon__isnull=False).exclude(status__in=['Pending', 'Cancelled']).update(coupon_redeemed=True)
+    redeemed = Order.objects.filter(coupon_redeemed=True).order_by()
+    Coupon.objects.update(redemption_count=Coalesce(Subquery(
+        redeemed.filter(coupon=OuterRef('pk')).values('coupon').annotate(c=Count('id')).values('c')
+    ), 0))
+    CouponUsage.objects.update(redemptions=Coalesce(Subquery(
+        redeemed.filter(coupon=OuterRef('coupon'), user=OuterRef('user')).values('coupon')
+        .annotate(c=Count('id')).values('c')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0021_cache_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='coupon_redeemed',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(recount_redemptions, migrations.RunPython.noop),
+    ]
@@ -3,9 +3,13 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.validators import MinValueValidator
 import uuid
-from django.db.models.signals import post_save
+from django.db.models import Count, F, Max, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
+from . import images
+
 class Restaurant(models.Model):
     CUISINE_CHOICES = [
         ('korean','Korean'),
@@ -22,24 +26,74 @@ class Restaurant(models.Model):
     location = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     image = models.CharField(max_length=255, blank=True, null=True, help_text="Relative path to image in static/images/restaurants/")
+    # Responsive derivatives of an uploaded image (main.images)
+    image_variants = models.JSONField(default=dict, blank=True)
     cuisine = models.CharField(
         max_length=20,
         choices=CUISINE_CHOICES,
         default='indian'
     )
+    # Summary stats maintained from Review and MenuItem writes, see update_menu_stats()
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    menu_item_count = models.PositiveIntegerField(default=0, editable=False)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
+
+    # Columns owned by the stats receivers; a plain save() never writes them back
+    STATS_FIELDS = ('rating_sum', 'review_count', 'menu_item_count', 'min_price', 'max_price')
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Don't overwrite counters maintained by the Review/MenuItem receivers
+        # with the values this instance happened to load
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.STATS_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    @property
+    def rating_count(self):
+        """Every review carries a rating, so this is the review count"""
+        return self.review_count
+
+    @property
+    def average_rating(self):
+        """Mean review rating, or 0 when there are no reviews"""
+        return self.rating_sum / self.review_count if self.review_count else 0
+
+    @classmethod
+    def update_menu_stats(cls, restaurant_ids=None):
+        """Rewrite the menu size and price range from MenuItem in a single UPDATE"""
+        items = MenuItem.objects.filter(restaurant=OuterRef('pk')).order_by().values('restaurant')
+        restaurants = cls.objects.all() if restaurant_ids is None else cls.objects.filter(pk__in=restaurant_ids)
+        return restaurants.update(
+            menu_item_count=Coalesce(Subquery(items.annotate(c=Count('id')).values('c')), 0),
+            min_price=Subquery(items.annotate(p=Min('price')).values('p')),
+            max_price=Subquery(items.annotate(p=Max('price')).values('p')),
+        )
+
+    @classmethod
+    def update_review_stats(cls, restaurant_ids=None):
+        """Rewrite the rating sum and review count from Review in a single UPDATE"""
+        reviews = Review.objects.filter(restaurant=OuterRef('pk')).order_by().values('restaurant')
+        restaurants = cls.objects.all() if restaurant_ids is None else cls.objects.filter(pk__in=restaurant_ids)
+        return restaurants.update(
+            rating_sum=Coalesce(Subquery(reviews.annotate(s=Sum('rating')).values('s')), 0),
+            review_count=Coalesce(Subquery(reviews.annotate(c=Count('id')).values('c')), 0),
+        )
+
     @property
     def url(self):
-        if self.image and self.image.strip():
-            # Remove any existing 'restaurants/' prefix to avoid duplication
-            image_path = self.image.strip()
-            if not image_path.startswith('restaurants/'):
-                image_path = f'restaurants/{image_path}'
-            return f"/static/images/{image_path}"
-        return '/static/images/restaurants/default.jpg'
+        return images.url(self.image, 'restaurants')
+
+    @property
+    def image_sources(self):
+        return images.image_sources(self.image, self.image_variants, 'restaurants')
 
 class MenuItem(models.Model):
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name="menu_items")
@@ -47,28 +101,44 @@ class MenuItem(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
     description = models.TextField(blank=True)
     image = models.CharField(max_length=255, blank=True, null=True, help_text="Relative path to image in static/images/menu_items/")
+    # Responsive derivatives of an uploaded image (main.images)
+    image_variants = models.JSONField(default=dict, blank=True)
     def __str__(self):
         return f"{self.name} - {self.restaurant.name}"
     
     @property
     def url(self):
-        if self.image and self.image.strip():
-            # Remove any existing 'menu_items/' prefix to avoid duplication
-            image_path = self.image.strip()
-            if not image_path.startswith('menu_items/'):
-                image_path = f'menu_items/{image_path}'
-            return f"/static/images/{image_path}"
-        return '/static/images/menu_items/default.jpg'
+        return images.url(self.image, 'menu_items')
+
+    @property
+    def image_sources(self):
+        return images.image_sources(self.image, self.image_variants, 'menu_items')
 class Coupon(models.Model):
     code = models.CharField(max_length=20, unique=True, blank=True)
     discount_percentage = models.IntegerField(default=10)
     valid_from = models.DateTimeField()
     valid_to = models.DateTimeField()
     is_active = models.BooleanField(default=True)
-        
+    # Redemption rules, enforced by main.coupons
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, null=True, blank=True,
+                                   related_name='coupons', help_text="Only valid at this restaurant")
+    min_order_total = models.DecimalField(max_digits=8, decimal_places=2, default=0,
+                                          help_text="Minimum subtotal for the coupon to apply")
+    max_redemptions = models.PositiveIntegerField(null=True, blank=True, help_text="Leave empty for no limit")
+    max_redemptions_per_user = models.PositiveIntegerField(null=True, blank=True,
+                                                           help_text="Leave empty for no limit")
+    # Maintained with conditional F() updates, never written by save()
+    redemption_count = models.PositiveIntegerField(default=0, editable=False)
+
     def save(self, *args, **kwargs):
         if not self.code:
             self.code = str(uuid.uuid4())[:8].upper()
+        # Don't overwrite redemptions counted since this instance was loaded
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'redemption_count'
+            ]
         super().save(*args, **kwargs)
     
     def is_valid(self):
@@ -78,6 +148,21 @@ class Coupon(models.Model):
     def __str__(self):
         return f"{self.code} - {self.discount_percentage}%"
 
+
+class CouponUsage(models.Model):
+    """How many times one user has redeemed a coupon with a per-user limit"""
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name='usages')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='coupon_usages')
+    redemptions = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['coupon', 'user'], name='unique_coupon_usage'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} used {self.coupon_id} {self.redemptions}×"
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('Pending', 'Pending'),
@@ -93,49 +178,83 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
     total_price = models.DecimalField(max_digits=8, decimal_places=2, default=0.00, editable=False)
     discount_applied = models.DecimalField(max_digits=8, decimal_places=2, default=0.00)
+    # Denormalized from the order lines by refresh_totals() so list views never touch OrderItem
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+    total_after_discount = models.DecimalField(max_digits=8, decimal_places=2, default=0.00, editable=False)
     coupon = models.ForeignKey(Coupon, null=True, blank=True, on_delete=models.SET_NULL)
+    # Set at checkout once the coupon counts against its limits (main.coupons)
+    coupon_redeemed = models.BooleanField(default=False, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     has_been_reviewed = models.BooleanField(default=False)
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.skip_price_calculation = False
+    class Meta:
+        indexes = [
+            # Keyset pagination of order_history and owner_orders
+            models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_idx'),
+            models.Index(fields=['restaurant', 'created_at', 'id'], name='order_restaurant_created_idx'),
+        ]
+
+    # Columns owned by refresh_totals(); a plain save() never writes them back
+    TOTAL_FIELDS = ('total_price', 'item_count', 'total_after_discount')
+    # Columns owned by main.coupons; a plain save() never writes them back either
+    COUPON_FIELDS = ('coupon_redeemed',)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status so the rollups can tell what changed
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
 
     def save(self, *args, **kwargs):
-        # Calculate total price if we're not skipping calculation
-        if not hasattr(self, 'skip_price_calculation') or not self.skip_price_calculation:
-            calculated_total = self.calculate_total
-            if calculated_total > 0:
-                self.total_price = calculated_total
-            
         if not self.user and not self.guest_id:
             self.guest_id = uuid.uuid4()
+
+        # An in-memory instance may hold stale totals, so don't clobber the
+        # values maintained by the OrderItem signals when updating a row
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.TOTAL_FIELDS + self.COUPON_FIELDS
+            ]
+        # Let post_save receivers see what the status was before this save
+        self._previous_status = getattr(self, '_loaded_status', None)
         super().save(*args, **kwargs)
-        
+        self._loaded_status = self.status
+
+    def refresh_totals(self):
+        """Recompute the stored totals from the order lines in a single UPDATE"""
+        Order.update_totals(self.pk)
+        self.refresh_from_db(fields=self.TOTAL_FIELDS)
+
+    @classmethod
+    def update_totals(cls, order_id):
+        """Atomically rewrite the denormalized totals of one order from its lines"""
+        lines = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+        subtotal = Coalesce(
+            Subquery(lines.annotate(s=Sum(F('quantity') * F('unit_price'))).values('s')),
+            0,
+            output_field=models.DecimalField(max_digits=8, decimal_places=2),
+        )
+        item_count = Coalesce(Subquery(lines.annotate(c=Sum('quantity')).values('c')), 0)
+        cls.objects.filter(pk=order_id).update(
+            total_price=subtotal,
+            item_count=item_count,
+            total_after_discount=Greatest(subtotal - F('discount_applied'), 0),
+        )
+
     @property
     def calculate_total(self):
         """Calculate current total from order items"""
-        total = sum(item.quantity * item.menu_item.price for item in self.items.all())
+        total = self.items.aggregate(total=Sum(F('quantity') * F('unit_price')))['total'] or 0
         return total if total > 0 else 0  # Ensure we never return None or negative
 
     def apply_coupon(self):
         if self.coupon and self.coupon.is_valid():
-            # Recalculate total price first to ensure it's up to date
-            total = sum(
-                order_item.quantity * order_item.menu_item.price 
-                for order_item in self.items.all()
-            )
-            self.total_price = total
-            
-            # Calculate discount
-            discount_amount = (self.total_price * self.coupon.discount_percentage) / 100
-            self.discount_applied = discount_amount
-            
-            # Set the skip_price_calculation flag to avoid recalculating in save()
-            self.skip_price_calculation = True
+            # Discount is taken from the stored subtotal
+            self.discount_applied = (self.total_price * self.coupon.discount_percentage) / 100
             self.save()
-            # Reset the flag after saving
-            self.skip_price_calculation = False
+            self.refresh_totals()
 
     def __str__(self):
         return f"Order {self.id} by {self.user if self.user else 'Guest'}"
@@ -143,7 +262,7 @@ class Order(models.Model):
     @property
     def get_total_items(self):
         """Return the total number of items in this order"""
-        return sum(item.quantity for item in self.items.all())
+        return self.item_count
 
     @property
     def get_order_items(self):
@@ -153,10 +272,7 @@ class Order(models.Model):
     @property
     def get_total_after_discount(self):
         """Return the total price after applying any discounts"""
-        total = self.calculate_total  # Use calculated total instead of stored total_price
-        if self.coupon and self.coupon.is_valid():
-            return total - self.discount_applied
-        return total
+        return self.total_after_discount
 
 
 class OrderItem(models.Model):
@@ -164,19 +280,31 @@ class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
     menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
     quantity = models.IntegerField(default=1, validators=[MinValueValidator(1)])
+    # Snapshot of the menu item when the order was placed, so later menu edits
+    # don't rewrite history and totals can be summed without a join
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    item_name = models.CharField(max_length=255, blank=True)
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            if not self.unit_price:
+                self.unit_price = self.menu_item.price
+            if not self.item_name:
+                self.item_name = self.menu_item.name
+        super().save(*args, **kwargs)
     
     def __str__(self):
-        return f"{self.quantity} × {self.menu_item.name}"
+        return f"{self.quantity} × {self.item_name}"
     
     @property
     def name(self):
         """Return the name of the menu item for template convenience"""
-        return self.menu_item.name
+        return self.item_name
     
     @property
     def price(self):
         """Return the price of this line item (price × quantity)"""
-        return self.menu_item.price * self.quantity
+        return self.unit_price * self.quantity
     
     @property
     def description(self):
@@ -184,6 +312,13 @@ class OrderItem(models.Model):
         return self.menu_item.description
 
 
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def update_order_totals(sender, instance, **kwargs):
+    """Keep the denormalized Order totals in step with its lines"""
+    Order.update_totals(instance.order_id)
+
+
 class Review(models.Model):
     """Model for customer reviews of restaurants"""
     RATING_CHOICES = [
@@ -206,6 +341,24 @@ class Review(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the reviews page
+            models.Index(fields=['created_at', 'id'], name='review_created_idx'),
+            models.Index(fields=['restaurant', 'created_at', 'id'], name='review_restaurant_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored rating so rating totals can apply the difference
+        instance._loaded_rating = instance.__dict__.get('rating')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Let post_save receivers see what the rating was before this save
+        self._previous_rating = getattr(self, '_loaded_rating', None)
+        super().save(*args, **kwargs)
+        self._loaded_rating = self.rating
         
     def __str__(self):
         return f"Review for {self.restaurant.name} by {self.get_reviewer_name()}"
@@ -221,6 +374,41 @@ class Review(models.Model):
         """Return a string of stars representing the rating"""
         return '★' * self.rating + '☆' * (5 - self.rating)
 
+@receiver(post_save, sender=Review)
+def update_restaurant_review_stats(sender, instance, created, raw=False, **kwargs):
+    """Apply a new or re-rated review to the restaurant's rating totals"""
+    if raw:
+        return
+    if created:
+        Restaurant.objects.filter(pk=instance.restaurant_id).update(
+            rating_sum=F('rating_sum') + instance.rating,
+            review_count=F('review_count') + 1,
+        )
+    elif getattr(instance, '_previous_rating', None) is None:
+        Restaurant.update_review_stats([instance.restaurant_id])
+    elif instance._previous_rating != instance.rating:
+        Restaurant.objects.filter(pk=instance.restaurant_id).update(
+            rating_sum=F('rating_sum') + (instance.rating - instance._previous_rating),
+        )
+
+
+@receiver(post_delete, sender=Review)
+def remove_restaurant_review_stats(sender, instance, **kwargs):
+    Restaurant.objects.filter(pk=instance.restaurant_id).update(
+        rating_sum=F('rating_sum') - instance.rating,
+        review_count=F('review_count') - 1,
+    )
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+def update_restaurant_menu_stats(sender, instance, raw=False, **kwargs):
+    """Keep the restaurant's menu size and price range in step with its items"""
+    if raw:
+        return
+    Restaurant.update_menu_stats([instance.restaurant_id])
+
+
 class Owner(models.Model):
     """Model for restaurant owners"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='owner_profile')
@@ -244,6 +432,136 @@ class Owner(models.Model):
 
     def get_average_rating(self):
         """Get average rating for the restaurant"""
-        return self.restaurant.reviews.aggregate(
-            avg=models.Avg('rating')
-        )['avg'] or 0
+        return self.restaurant.average_rating
+
+
+class DailyRollup(models.Model):
+    """Per-restaurant order and review totals for one day, maintained by main.rollups"""
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='daily_rollups')
+    date = models.DateField()
+    orders = models.PositiveIntegerField(default=0)
+    pending_orders = models.PositiveIntegerField(default=0)
+    completed_orders = models.PositiveIntegerField(default=0)
+    # Revenue only counts completed orders
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    discounted_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['restaurant', 'date'], name='unique_daily_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.restaurant_id} {self.date}: {self.orders} orders"
+
+
+class HourlyRollup(models.Model):
+    """Per-restaurant order totals for one hour, maintained by main.rollups"""
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='hourly_rollups')
+    hour = models.DateTimeField()
+    orders = models.PositiveIntegerField(default=0)
+    completed_orders = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    discounted_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['restaurant', 'hour'], name='unique_hourly_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.restaurant_id} {self.hour}: {self.orders} orders"
+
+
+class ItemRollup(models.Model):
+    """Per-restaurant quantities sold of one menu item on one day, completed orders only"""
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='item_rollups')
+    date = models.DateField()
+    item_name = models.CharField(max_length=255)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['restaurant', 'date', 'item_name'], name='unique_item_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.restaurant_id} {self.date}: {self.quantity} × {self.item_name}"
+
+
+class CacheVersion(models.Model):
+    """Version counter behind a family of cache keys, shared by every process (main.cache_versions)"""
+    key = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField()
+    modified = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
+
+
+class OrderEvent(models.Model):
+    """Short-lived log of order changes read by the live kitchen feed (main.events)"""
+    CREATED = 'created'
+    STATUS = 'status'
+    KIND_CHOICES = [
+        (CREATED, 'Created'),
+        (STATUS, 'Status changed'),
+    ]
+
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='order_events')
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='events')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.kind} order {self.order_id}"
+
+
+class SearchDocument(models.Model):
+    """
+    Portable search index entry for one restaurant or menu item (main.search).
+
+    Only populated when the database has no SQLite FTS5; there the index
+    lives in the ``main_search`` virtual table instead.
+    """
+    RESTAURANT = 'restaurant'
+    MENU_ITEM = 'item'
+    KIND_CHOICES = [
+        (RESTAURANT, 'Restaurant'),
+        (MENU_ITEM, 'Menu item'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    restaurant_id = models.PositiveIntegerField()
+    title = models.CharField(max_length=255)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_document'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}: {self.title}"
+
+
+class SearchTerm(models.Model):
+    """One normalised token of a SearchDocument; title tokens carry a higher weight"""
+    document = models.ForeignKey(SearchDocument, on_delete=models.CASCADE, related_name='terms')
+    term = models.CharField(max_length=64, db_index=True)
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    def __str__(self):
+        return self.term
+
+
+class PurgeEvent(models.Model):
+    """Surrogate keys whose shared-cache copies went stale, read by proxies (main.shared_cache)"""
+    keys = models.CharField(max_length=255, help_text="Space separated surrogate keys")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"purge {self.keys}"
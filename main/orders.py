@@ -0,0 +1,149 @@
+"""
+Order ingestion for the customer-facing ordering flow.
+
+An order is resolved, priced and written in as few statements as possible:
+one query for every requested menu item, then a single short transaction
+that inserts the order with its totals already filled in and bulk inserts
+its lines. Keeping the write transaction small matters on SQLite, where the
+database write lock is held until commit. With ``ORDER_GROUP_COMMIT`` on,
+concurrent orders in a process share that transaction (main.group_commit).
+"""
+
+from django.db import transaction
+
+from . import coupons, group_commit
+from .models import MenuItem, Order, OrderItem
+from .sqlite import retry_on_lock
+
+# Largest number of units accepted in a single order
+MAX_ORDER_QUANTITY = 50
+
+
+class OrderError(Exception):
+    """Raised when a submitted order cannot be placed; the message is user-facing"""
+
+
+class EmptyOrderError(OrderError):
+    """Raised when no items were selected"""
+
+
+def parse_quantities(data):
+    """
+    Extract the requested quantities from ``quantity_<menu_item_id>`` form fields.
+
+    Args:
+        data: A mapping such as ``request.POST``
+
+    Returns:
+        dict: menu item id -> positive quantity, zero quantities are dropped
+
+    Raises:
+        OrderError: If a quantity or item id is malformed or negative
+    """
+    quantities = {}
+    for key, value in data.items():
+        if not key.startswith('quantity_'):
+            continue
+        try:
+            item_id = int(key[len('quantity_'):])
+            quantity = int(value)
+        except ValueError:
+            raise OrderError('Invalid quantity format.')
+        if quantity < 0:
+            raise OrderError('Invalid quantity specified.')
+        if quantity > 0:
+            quantities[item_id] = quantities.get(item_id, 0) + quantity
+    return quantities
+
+
+@retry_on_lock
+def create_order(user, restaurant, quantities):
+    """
+    Place an order for ``restaurant`` in a single transaction.
+
+    Menu items are fetched with one ``id__in`` query and the order total is
+    computed from those prices, so the order row is inserted complete and the
+    lines go in with one ``bulk_create``.
+
+    Args:
+        user: The ordering user
+        restaurant: The Restaurant being ordered from
+        quantities (dict): menu item id -> quantity, as from parse_quantities()
+
+    Returns:
+        Order: The saved order
+
+    Raises:
+        OrderError: If the order is empty, too large or references items
+            that are not on this restaurant's menu
+    """
+    if not quantities:
+        raise EmptyOrderError('Please select at least one item to place an order.')
+
+    item_count = sum(quantities.values())
+    if item_count > MAX_ORDER_QUANTITY:
+        raise OrderError('Order quantity exceeds maximum limit.')
+
+    # Resolve every item before taking the write lock
+    menu_items = MenuItem.objects.filter(restaurant=restaurant).in_bulk(list(quantities))
+    if len(menu_items) != len(quantities):
+        raise OrderError('Menu item not found or not available in this restaurant.')
+
+    subtotal = sum(menu_items[item_id].price * quantity for item_id, quantity in quantities.items())
+    lines = [(menu_items[item_id], quantity) for item_id, quantity in quantities.items()]
+
+    if group_commit.enabled():
+        # Shares a transaction with other threads' orders; see main.group_commit
+        return group_commit.writer.submit(_write_order, user, restaurant, subtotal, item_count, lines)
+    with transaction.atomic():
+        return _write_order(user, restaurant, subtotal, item_count, lines)
+
+
+def _write_order(user, restaurant, subtotal, item_count, lines):
+    """Insert an order and its lines; the caller provides the transaction"""
+    order = Order.objects.create(
+        user=user,
+        restaurant=restaurant,
+        status='Pending',
+        total_price=subtotal,
+        item_count=item_count,
+        total_after_discount=subtotal,
+    )
+    # bulk_create skips the OrderItem signals; the totals above are already final
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order,
+            menu_item=menu_item,
+            quantity=quantity,
+            unit_price=menu_item.price,
+            item_name=menu_item.name,
+        )
+        for menu_item, quantity in lines
+    ])
+    return order
+
+
+@retry_on_lock
+def update_status(order, status):
+    """
+    Move an order to ``status``.
+
+    The row, the dashboard rollups and the order feed event are written in one
+    transaction, so a lock timeout part way through can simply be retried.
+    """
+    with transaction.atomic():
+        order.status = status
+        order.save()
+
+
+@retry_on_lock
+def checkout(order, user):
+    """
+    Complete a paid order, redeeming its coupon in the same transaction.
+
+    Raises:
+        CouponError: The order's coupon can no longer be used; nothing was written
+    """
+    with transaction.atomic():
+        coupons.redeem(order, user)
+        update_status(order, 'Completed')
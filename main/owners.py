@@ -0,0 +1,113 @@
+"""
+Request-scoped restaurant owner resolution.
+
+OwnerMiddleware gives every request lazy ``request.owner_id`` and
+``request.restaurant_id`` attributes, read together with one indexed
+``values_list`` query the first time either is used. They are None for
+customers and anonymous visitors. The navigation only needs to know
+whether the user is an owner, so that is all most pages pay for.
+
+``request.owner`` and ``request.restaurant`` load the Owner with its
+restaurant in one ``select_related`` query, only when first used, and
+prime ``user.owner_profile``. Templates and views then never look the
+owner up again during the request.
+
+Views that are only for owners use ``owner_required`` instead of looking up
+the Owner themselves.
+"""
+
+from functools import wraps
+
+from django.contrib import messages
+from django.contrib.auth import REDIRECT_FIELD_NAME
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import redirect
+from django.utils.functional import SimpleLazyObject
+
+from .models import Owner
+
+
+def _prime(user, owner):
+    # Lets {{ user.owner_profile }} and friends reuse the row without a query
+    Owner.user.field.remote_field.set_cached_value(user, owner)
+
+
+def get_owner_ids(request):
+    """
+    Ids of the request's user's Owner profile and restaurant.
+
+    Returns:
+        tuple: (owner id, restaurant id), or (None, None) for anonymous
+            users and customers
+    """
+    if not hasattr(request, '_owner_ids'):
+        ids = None
+        if hasattr(request, '_cached_owner'):
+            owner = request._cached_owner
+            ids = (owner.pk, owner.restaurant_id) if owner else None
+        elif request.user.is_authenticated:
+            ids = Owner.objects.filter(user=request.user).values_list('pk', 'restaurant_id').first()
+        request._owner_ids = ids or (None, None)
+    return request._owner_ids
+
+
+def get_owner(request):
+    """
+    The Owner profile of the request's user, with its restaurant loaded.
+
+    Returns:
+        Owner: Or None for anonymous users and customers
+    """
+    if hasattr(request, '_cached_owner'):
+        return request._cached_owner
+    user = request.user
+    owner = None
+    if hasattr(request, '_owner_ids'):
+        owner_id = request._owner_ids[0]
+        if owner_id is not None:
+            owner = Owner.objects.select_related('restaurant').filter(pk=owner_id).first()
+    elif user.is_authenticated:
+        owner = Owner.objects.select_related('restaurant').filter(user=user).first()
+    if user.is_authenticated:
+        _prime(user, owner)
+    request._cached_owner = owner
+    return owner
+
+
+def get_restaurant(request):
+    owner = get_owner(request)
+    return owner.restaurant if owner else None
+
+
+class OwnerMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.owner_id = SimpleLazyObject(lambda: get_owner_ids(request)[0])
+        request.restaurant_id = SimpleLazyObject(lambda: get_owner_ids(request)[1])
+        request.owner = SimpleLazyObject(lambda: get_owner(request))
+        request.restaurant = SimpleLazyObject(lambda: get_restaurant(request))
+        return self.get_response(request)
+
+
+def owner_required(view):
+    """
+    Restrict a view to restaurant owners.
+
+    Anonymous users are sent to the login page. Signed-in customers are sent
+    there too, with a message. Inside the view ``request.owner`` and
+    ``request.restaurant`` are plain model instances.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), redirect_field_name=REDIRECT_FIELD_NAME)
+        owner = get_owner(request)
+        if owner is None:
+            messages.warning(request, 'Owner profile not found for this user. Please log in with an owner account.')
+            return redirect('login')
+        request.owner = owner
+        request.restaurant = owner.restaurant
+        return view(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,142 @@
+"""
+Full-page cache for anonymous GETs of the marketing pages.
+
+PageCacheMiddleware sits above the session, CSRF, auth and messages
+middleware. For the URL names in ``PAGE_CACHE_TTLS`` it answers a GET that
+carries no session or messages cookie straight from the cache, without
+running the rest of the middleware stack or the view. Once an entry is older
+than its TTL it is still served, for up to ``PAGE_CACHE_STALE`` more
+seconds, while a single background thread renders a fresh copy. Keys include
+``BUILD_VERSION``, so a deploy starts from an empty cache.
+
+Pages with forms embed a per-visitor CSRF token. It is stored as a
+placeholder and filled in on every hit by CsrfViewMiddleware itself, which
+also sets the visitor's CSRF cookie when needed.
+
+The query string is ignored: none of these pages read it, and campaign links
+(``utm_*``) would otherwise split the cache.
+"""
+
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+from django.middleware.csrf import CsrfViewMiddleware, get_token
+from django.urls import NoReverseMatch, reverse
+
+logger = logging.getLogger(__name__)
+
+CSRF_PLACEHOLDER = b'__page_cache_csrf_token__'
+_CSRF_INPUT = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+# Headers recomputed for each response rather than replayed from the cache
+_SKIP_HEADERS = {'content-length', 'set-cookie'}
+# How long one process may hold the refresh lock for a page
+REFRESH_LOCK_SECONDS = 30
+
+
+class PageCacheMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._ttls = None
+
+    def ttls(self):
+        """Cached page paths mapped to their TTL in seconds"""
+        if self._ttls is None:
+            ttls = {}
+            for name, ttl in getattr(settings, 'PAGE_CACHE_TTLS', {}).items():
+                try:
+                    ttls[reverse(name)] = ttl
+                except NoReverseMatch:
+                    logger.warning(f"PAGE_CACHE_TTLS: no URL named {name!r}")
+            self._ttls = ttls
+        return self._ttls
+
+    def __call__(self, request):
+        ttl = self.ttls().get(request.path_info)
+        if ttl is None or not getattr(settings, 'PAGE_CACHE_ENABLED', True) or not self.cacheable_request(request):
+            return self.get_response(request)
+
+        key = f'page:{settings.BUILD_VERSION}:{request.path_info}'
+        entry = cache.get(key)
+        if entry is not None:
+            age = time.time() - entry['stored']
+            state = 'hit'
+            if age > ttl:
+                state = 'stale'
+                self.refresh_in_background(request, key, ttl)
+            return self.replay(request, entry, state, age)
+
+        response = self.get_response(request)
+        self.store(request, key, ttl, response)
+        response['X-Page-Cache'] = 'miss'
+        return response
+
+    @staticmethod
+    def cacheable_request(request):
+        # A session or pending messages mean the page may not be the anonymous one
+        return (
+            request.method in ('GET', 'HEAD')
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES
+            and CookieStorage.cookie_name not in request.COOKIES
+        )
+
+    def store(self, request, key, ttl, response):
+        """Cache a freshly rendered response if it is the same for every anonymous visitor"""
+        if (
+            request.method != 'GET'
+            or response.status_code != 200
+            or response.streaming
+            or set(response.cookies) - {settings.CSRF_COOKIE_NAME}
+        ):
+            return
+        content, csrf = _CSRF_INPUT.subn(rb'\1' + CSRF_PLACEHOLDER + rb'\2', response.content)
+        cache.set(key, {
+            'content': content,
+            'status': response.status_code,
+            'headers': [(k, v) for k, v in response.items() if k.lower() not in _SKIP_HEADERS],
+            'csrf': bool(csrf),
+            'stored': time.time(),
+        }, ttl + getattr(settings, 'PAGE_CACHE_STALE', 86400))
+
+    def replay(self, request, entry, state, age):
+        response = HttpResponse(entry['content'], status=entry['status'])
+        for header, value in entry['headers']:
+            response[header] = value
+        if entry['csrf']:
+            csrf = CsrfViewMiddleware(self.get_response)
+            csrf.process_request(request)
+            response.content = entry['content'].replace(CSRF_PLACEHOLDER, get_token(request).encode())
+            csrf.process_response(request, response)
+        length = len(response.content)
+        if request.method == 'HEAD':
+            response.content = b''
+        response['Content-Length'] = length
+        response['Age'] = int(age)
+        response['X-Page-Cache'] = state
+        return response
+
+    def refresh_in_background(self, request, key, ttl):
+        if not cache.add(f'{key}:refreshing', 1, REFRESH_LOCK_SECONDS):
+            return
+        fresh = HttpRequest()
+        fresh.method = 'GET'
+        fresh.path = request.path
+        fresh.path_info = request.path_info
+        fresh.META = {k: v for k, v in request.META.items() if k not in ('HTTP_COOKIE', 'wsgi.input')}
+        fresh.META['REQUEST_METHOD'] = 'GET'
+        threading.Thread(target=self.refresh, args=(fresh, key, ttl), daemon=True).start()
+
+    def refresh(self, request, key, ttl):
+        try:
+            self.store(request, key, ttl, self.get_response(request))
+        except Exception:
+            logger.exception(f"Page cache refresh failed for {request.path}")
+        finally:
+            cache.delete(f'{key}:refreshing')
+            connections.close_all()
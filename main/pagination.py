@@ -0,0 +1,118 @@
+"""
+Keyset (cursor) pagination over ``(created_at, id)``.
+
+Unlike ``django.core.paginator.Paginator`` this never runs ``COUNT(*)`` and
+never uses ``OFFSET``: each page is a range scan that starts right after the
+last row of the previous page, so page N costs the same as page 1. Pages are
+addressed by opaque cursor tokens instead of page numbers.
+"""
+
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(created_at, pk, backwards=False):
+    """Pack a position into an opaque URL-safe token"""
+    payload = json.dumps([created_at.isoformat(), pk, int(backwards)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Unpack a cursor token.
+
+    Returns:
+        tuple: (created_at, pk, backwards), or None if the token is malformed
+    """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, pk, backwards = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at = parse_datetime(created_at)
+        if created_at is None:
+            return None
+        return created_at, int(pk), bool(backwards)
+    except (ValueError, TypeError, binascii.Error):
+        return None
+
+
+class KeysetPage:
+    """One page of results with cursors for its neighbours"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset newest first by ``(created_at, id)``.
+
+    The queryset should be backed by an index ending in ``(created_at, id)``
+    after any equality filters, e.g. ``(restaurant, created_at, id)``.
+    """
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def page(self, cursor=None):
+        """
+        Return the page after (or, for a backwards cursor, before) ``cursor``.
+
+        Args:
+            cursor (str, optional): A token from a previous page; an invalid
+                or missing cursor returns the first page
+        """
+        position = decode_cursor(cursor)
+        if position is None:
+            rows = list(self.queryset.order_by('-created_at', '-id')[:self.per_page + 1])
+            return self._forward_page(rows, has_previous=False)
+
+        created_at, pk, backwards = position
+        if backwards:
+            newer = Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+            rows = list(self.queryset.filter(newer).order_by('created_at', 'id')[:self.per_page + 1])
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            if not rows:
+                return self.page()
+            return KeysetPage(
+                rows,
+                next_cursor=encode_cursor(rows[-1].created_at, rows[-1].pk),
+                previous_cursor=encode_cursor(rows[0].created_at, rows[0].pk, backwards=True) if has_previous else None,
+            )
+
+        older = Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        rows = list(self.queryset.filter(older).order_by('-created_at', '-id')[:self.per_page + 1])
+        return self._forward_page(rows, has_previous=True)
+
+    def _forward_page(self, rows, has_previous):
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor(rows[-1].created_at, rows[-1].pk) if has_next else None,
+            previous_cursor=encode_cursor(rows[0].created_at, rows[0].pk, backwards=True) if has_previous and rows else None,
+        )
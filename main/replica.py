@@ -0,0 +1,99 @@
+"""
+Read replica routing for the catalogue and analytics pages.
+
+Views wrapped in ``read_replica`` run their queries against the ``replica``
+database alias: a PostgreSQL replica from ``DATABASE_REPLICA_URL``, or for
+SQLite a second, read-only connection to the same file. Every other query,
+every write and every read inside a transaction goes to ``default``.
+
+Replicas can lag. After a signed-in user's own write (any successful
+non-GET request), StickyWritesMiddleware stamps their session, and for
+``REPLICA_STICKY_SECONDS`` afterwards their requests read from ``default``
+so they see what they just changed. The menu cache is always rebuilt from
+``default`` (``use_primary()``), so a lagging replica never ends up in it.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+SESSION_KEY = '_last_write'
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def enabled():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # A transaction reads its own writes, and the rows it locks, on default
+        if _use_replica.get() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return REPLICA_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Also for instances that were read from the replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
+
+
+@contextmanager
+def _reading(replica):
+    token = _use_replica.set(replica)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def use_primary():
+    """Context manager sending reads back to ``default``, e.g. to fill a cache"""
+    return _reading(False)
+
+
+def recently_wrote(request):
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return False
+    last_write = request.session.get(SESSION_KEY)
+    return last_write is not None and time.time() - last_write < settings.REPLICA_STICKY_SECONDS
+
+
+def read_replica(view):
+    """Run a read-only view's queries on the replica, unless the user just wrote"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not enabled() or recently_wrote(request):
+            return view(request, *args, **kwargs)
+        with _reading(True):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class StickyWritesMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            enabled()
+            and request.method not in ('GET', 'HEAD', 'OPTIONS')
+            and response.status_code < 400
+            and hasattr(request, 'user')
+            and request.user.is_authenticated
+        ):
+            request.session[SESSION_KEY] = time.time()
+        return response
@@ -0,0 +1,315 @@
+"""
+Precomputed per-restaurant analytics for the owner dashboard.
+
+DailyRollup, HourlyRollup and ItemRollup rows are kept current from model
+signals. The hot paths (an order being placed, an order changing status, a
+review being written) adjust the affected buckets with a single F()
+increment. Rare paths such as deletions or editing the lines of a completed
+order rebuild just the affected restaurant-days from the source rows once
+the transaction commits, each at most once however many rows the
+transaction touched. ``manage.py rebuild_rollups`` recomputes everything
+for backfills.
+"""
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import DailyRollup, HourlyRollup, ItemRollup, Order, OrderItem, Restaurant, Review
+
+COMPLETED = 'Completed'
+PENDING = 'Pending'
+
+
+def buckets(moment):
+    """Return the (date, hour) rollup buckets a timestamp falls into"""
+    local = timezone.localtime(moment)
+    return local.date(), local.replace(minute=0, second=0, microsecond=0)
+
+
+def _bump(model, lookup, deltas):
+    """Add ``deltas`` to the rollup row identified by ``lookup``, creating it if needed"""
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+    increments = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**lookup).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # Another writer created the row first
+        model.objects.filter(**lookup).update(**increments)
+
+
+def _status_counts(status, sign=1):
+    return {
+        'pending_orders': sign * (status == PENDING),
+        'completed_orders': sign * (status == COMPLETED),
+    }
+
+
+def _completed_revenue(order, sign):
+    """
+    Add (sign=1) or remove (sign=-1) a completed order's lines from the item
+    rollups and return its revenue deltas for the day and hour buckets.
+    """
+    totals = Order.objects.filter(pk=order.pk).values('total_price', 'total_after_discount').get()
+    lines = OrderItem.objects.filter(order=order).values('item_name').annotate(
+        units=Sum('quantity'),
+        line_revenue=Sum(F('quantity') * F('unit_price')),
+    )
+    date, _ = buckets(order.created_at)
+    for line in lines:
+        _bump(
+            ItemRollup,
+            {'restaurant_id': order.restaurant_id, 'date': date, 'item_name': line['item_name']},
+            {'quantity': sign * line['units'], 'revenue': sign * line['line_revenue']},
+        )
+    return {
+        'revenue': sign * totals['total_price'],
+        'discounted_revenue': sign * totals['total_after_discount'],
+    }
+
+
+class PendingRebuilds:
+    """
+    The restaurant-days a connection asked to rebuild, run on commit.
+
+    Every request registers the same callable again, so the days survive
+    however much of the transaction is rolled back. The first callback after
+    a commit runs them all and the rest find nothing left. Days left over
+    from a rolled back transaction are rebuilt with the next commit, which
+    is only wasted work.
+    """
+
+    def __init__(self):
+        self.days = {}
+
+    def add(self, restaurant_id, date):
+        self.days.setdefault(date, set()).add(restaurant_id)
+
+    def __call__(self):
+        days, self.days = self.days, {}
+        for date, restaurant_ids in days.items():
+            rebuild(restaurant_ids=sorted(restaurant_ids), day=date)
+
+
+def schedule_rebuild(restaurant_id, moment):
+    """Rebuild one restaurant-day once the current transaction has committed"""
+    date, _ = buckets(moment)
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        rebuild(restaurant_ids=[restaurant_id], day=date)
+        return
+    # Deleting an order with N lines, or a restaurant with all its orders,
+    # asks for the same days over and over: they are collected per
+    # connection and rebuilt once
+    pending = getattr(connection, 'pending_rollup_rebuilds', None)
+    if pending is None:
+        pending = connection.pending_rollup_rebuilds = PendingRebuilds()
+    pending.add(restaurant_id, date)
+    transaction.on_commit(pending)
+
+
+def rebuild(restaurant_ids=None, day=None):
+    """
+    Recompute rollups from orders, order lines and reviews.
+
+    The source rows are read and the rollups replaced in one transaction,
+    after locking the restaurants and their rollup rows (SQLite's IMMEDIATE
+    transactions lock the whole database). A concurrent F() increment
+    therefore either lands before the source rows are read, and is counted,
+    or waits and is applied on top of the rebuilt rows.
+
+    Args:
+        restaurant_ids (list, optional): Limit the rebuild to these restaurants
+        day (date, optional): Limit the rebuild to a single day
+
+    Returns:
+        int: Number of rollup rows written
+    """
+    orders = Order.objects.order_by()
+    lines = OrderItem.objects.filter(order__status=COMPLETED).order_by()
+    reviews = Review.objects.order_by()
+    rollups = [DailyRollup.objects.all(), HourlyRollup.objects.all(), ItemRollup.objects.all()]
+    if restaurant_ids is not None:
+        orders = orders.filter(restaurant_id__in=restaurant_ids)
+        lines = lines.filter(order__restaurant_id__in=restaurant_ids)
+        reviews = reviews.filter(restaurant_id__in=restaurant_ids)
+        rollups = [qs.filter(restaurant_id__in=restaurant_ids) for qs in rollups]
+    if day is not None:
+        orders = orders.filter(created_at__date=day)
+        lines = lines.filter(order__created_at__date=day)
+        reviews = reviews.filter(created_at__date=day)
+        rollups[0] = rollups[0].filter(date=day)
+        rollups[1] = rollups[1].filter(hour__date=day)
+        rollups[2] = rollups[2].filter(date=day)
+
+    with transaction.atomic():
+        # Placing an order or writing a review locks its restaurant row
+        # (foreign key check), so this waits for those still in flight
+        restaurants = Restaurant.objects.select_for_update().order_by('pk')
+        if restaurant_ids is not None:
+            restaurants = restaurants.filter(pk__in=restaurant_ids)
+        list(restaurants.values_list('pk', flat=True))
+        for queryset in rollups:
+            list(queryset.select_for_update().order_by('pk').values_list('pk', flat=True))
+
+        completed = Q(status=COMPLETED)
+        by_hour = orders.annotate(bucket=TruncHour('created_at')).values('restaurant_id', 'bucket').annotate(
+            orders=Count('id'),
+            pending_orders=Count('id', filter=Q(status=PENDING)),
+            completed_orders=Count('id', filter=completed),
+            revenue=Sum('total_price', filter=completed, default=0),
+            discounted_revenue=Sum('total_after_discount', filter=completed, default=0),
+        )
+
+        daily = {}
+        hourly = []
+        for row in by_hour:
+            hourly.append(HourlyRollup(
+                restaurant_id=row['restaurant_id'],
+                hour=row['bucket'],
+                orders=row['orders'],
+                completed_orders=row['completed_orders'],
+                revenue=row['revenue'],
+                discounted_revenue=row['discounted_revenue'],
+            ))
+            key = (row['restaurant_id'], buckets(row['bucket'])[0])
+            rollup = daily.setdefault(key, DailyRollup(restaurant_id=key[0], date=key[1]))
+            for field in ('orders', 'pending_orders', 'completed_orders', 'revenue', 'discounted_revenue'):
+                setattr(rollup, field, getattr(rollup, field) + row[field])
+
+        by_day = reviews.annotate(bucket=TruncDate('created_at')).values('restaurant_id', 'bucket').annotate(
+            rating_sum=Sum('rating'),
+            rating_count=Count('id'),
+        )
+        for row in by_day:
+            key = (row['restaurant_id'], row['bucket'])
+            rollup = daily.setdefault(key, DailyRollup(restaurant_id=key[0], date=key[1]))
+            rollup.rating_sum = row['rating_sum']
+            rollup.rating_count = row['rating_count']
+
+        by_item = lines.annotate(bucket=TruncDate('order__created_at')).values(
+            'order__restaurant_id', 'bucket', 'item_name'
+        ).annotate(
+            units=Sum('quantity'),
+            line_revenue=Sum(F('quantity') * F('unit_price')),
+        )
+        items = [
+            ItemRollup(
+                restaurant_id=row['order__restaurant_id'],
+                date=row['bucket'],
+                item_name=row['item_name'],
+                quantity=row['units'],
+                revenue=row['line_revenue'],
+            )
+            for row in by_item
+        ]
+
+        for queryset in rollups:
+            queryset.delete()
+        DailyRollup.objects.bulk_create(daily.values(), batch_size=500)
+        HourlyRollup.objects.bulk_create(hourly, batch_size=500)
+        ItemRollup.objects.bulk_create(items, batch_size=500)
+    return len(daily) + len(hourly) + len(items)
+
+
+def restaurant_totals(restaurant):
+    """All-time order, revenue and rating totals for a restaurant in one query"""
+    totals = DailyRollup.objects.filter(restaurant=restaurant).aggregate(
+        orders=Sum('orders', default=0),
+        pending_orders=Sum('pending_orders', default=0),
+        completed_orders=Sum('completed_orders', default=0),
+        revenue=Sum('revenue', default=0),
+        discounted_revenue=Sum('discounted_revenue', default=0),
+        rating_sum=Sum('rating_sum', default=0),
+        rating_count=Sum('rating_count', default=0),
+    )
+    totals['average_rating'] = (
+        totals['rating_sum'] / totals['rating_count'] if totals['rating_count'] else 0
+    )
+    return totals
+
+
+def daily_series(restaurant, year, month):
+    """Per-day order count and revenue for one calendar month, newest first"""
+    return DailyRollup.objects.filter(
+        restaurant=restaurant,
+        date__year=year,
+        date__month=month,
+    ).order_by('-date').values('date', 'revenue', count=F('orders'))
+
+
+def bestsellers(restaurant, limit=5):
+    """Menu items with the most units sold in completed orders"""
+    return ItemRollup.objects.filter(restaurant=restaurant).values('item_name').annotate(
+        total_ordered=Sum('quantity'),
+        revenue=Sum('revenue'),
+    ).order_by('-total_ordered')[:limit]
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_status', None)
+    if created:
+        daily = {'orders': 1, **_status_counts(instance.status)}
+        revenue_sign = int(instance.status == COMPLETED)
+    elif previous is not None and previous != instance.status:
+        old, new = _status_counts(previous, -1), _status_counts(instance.status)
+        daily = {field: old[field] + new[field] for field in new}
+        revenue_sign = (instance.status == COMPLETED) - (previous == COMPLETED)
+    else:
+        return
+
+    hourly = {'orders': daily.get('orders', 0), 'completed_orders': daily['completed_orders']}
+    if revenue_sign:
+        revenue = _completed_revenue(instance, revenue_sign)
+        daily.update(revenue)
+        hourly.update(revenue)
+    date, hour = buckets(instance.created_at)
+    _bump(DailyRollup, {'restaurant_id': instance.restaurant_id, 'date': date}, daily)
+    _bump(HourlyRollup, {'restaurant_id': instance.restaurant_id, 'hour': hour}, hourly)
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    schedule_rebuild(instance.restaurant_id, instance.created_at)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def order_item_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Only completed orders feed revenue and item rollups
+    order = Order.objects.filter(pk=instance.order_id, status=COMPLETED).values('restaurant_id', 'created_at').first()
+    if order:
+        schedule_rebuild(order['restaurant_id'], order['created_at'])
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = 0 if created else getattr(instance, '_previous_rating', None)
+    if previous is None:
+        schedule_rebuild(instance.restaurant_id, instance.created_at)
+    else:
+        _bump(
+            DailyRollup,
+            {'restaurant_id': instance.restaurant_id, 'date': buckets(instance.created_at)[0]},
+            {'rating_sum': instance.rating - previous, 'rating_count': int(created)},
+        )
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    schedule_rebuild(instance.restaurant_id, instance.created_at)
@@ -0,0 +1,249 @@
+"""
+Full-text search over restaurants and menu items.
+
+On SQLite the index is the ``main_search`` FTS5 virtual table created by
+migration 0017: one row per restaurant or menu item with a ``title`` (the
+name) and a ``body`` (location/description), ranked with bm25 and a prefix
+index for typeahead. Row ids encode the kind and primary key, so keeping the
+index in sync never needs a lookup. Other databases, or SQLite builds without
+FTS5, use the portable SearchDocument/SearchTerm tables instead: one row per
+normalised token, matched by indexed equality or prefix lookups.
+
+The index is maintained by the Restaurant and MenuItem signal receivers below
+and can be rebuilt with ``manage.py rebuild_search_index``.
+"""
+
+import re
+import unicodedata
+
+from django.db import connections
+from django.db.models import Q, Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import MenuItem, Restaurant, SearchDocument, SearchTerm
+
+FTS_TABLE = 'main_search'
+RESTAURANT = SearchDocument.RESTAURANT
+MENU_ITEM = SearchDocument.MENU_ITEM
+# bm25 weight of the title column relative to the body
+TITLE_WEIGHT = 10
+SUGGEST_LIMIT = 8
+BATCH_SIZE = 1000
+
+_WORD = re.compile(r'\w+')
+_fts_enabled = {}
+
+
+def tokenize(text):
+    """Lower-case word tokens with accents stripped, matching FTS5's unicode61 tokenizer"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return [token[:64] for token in _WORD.findall(text.lower())]
+
+
+def fts_enabled(using='default'):
+    """Whether the FTS5 table exists on this database"""
+    if using not in _fts_enabled:
+        connection = connections[using]
+        _fts_enabled[using] = (
+            connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_enabled[using]
+
+
+def _rowid(kind, object_id):
+    return object_id * 2 + (kind == MENU_ITEM)
+
+
+def _split_rowid(rowid):
+    return (MENU_ITEM if rowid % 2 else RESTAURANT), rowid // 2
+
+
+def restaurant_document(restaurant):
+    return (RESTAURANT, restaurant.id, restaurant.id, restaurant.name,
+            ' '.join(filter(None, [restaurant.location, restaurant.description])))
+
+
+def item_document(item):
+    return (MENU_ITEM, item.id, item.restaurant_id, item.name, item.description or '')
+
+
+def _remove(keys):
+    """Drop index entries for (kind, object_id) pairs"""
+    if not keys:
+        return
+    if fts_enabled():
+        with connections['default'].cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [(_rowid(kind, object_id),) for kind, object_id in keys],
+            )
+        return
+    match = Q(pk__in=[])
+    for kind in {kind for kind, _ in keys}:
+        match |= Q(kind=kind, object_id__in=[object_id for k, object_id in keys if k == kind])
+    SearchDocument.objects.filter(match).delete()
+
+
+def _write(documents, replace=True):
+    """Index (kind, object_id, restaurant_id, title, body) tuples"""
+    if not documents:
+        return
+    if replace:
+        _remove([(kind, object_id) for kind, object_id, *_ in documents])
+    if fts_enabled():
+        with connections['default'].cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, body, restaurant_id) VALUES (%s, %s, %s, %s)',
+                [(_rowid(kind, object_id), title, body, restaurant_id)
+                 for kind, object_id, restaurant_id, title, body in documents],
+            )
+        return
+    created = SearchDocument.objects.bulk_create([
+        SearchDocument(kind=kind, object_id=object_id, restaurant_id=restaurant_id, title=title)
+        for kind, object_id, restaurant_id, title, _ in documents
+    ])
+    terms = []
+    for document, (_, _, _, title, body) in zip(created, documents):
+        weights = dict.fromkeys(tokenize(body), 1)
+        weights.update(dict.fromkeys(tokenize(title), TITLE_WEIGHT))
+        terms.extend(SearchTerm(document=document, term=term, weight=weight) for term, weight in weights.items())
+    SearchTerm.objects.bulk_create(terms, batch_size=BATCH_SIZE)
+
+
+def index_restaurants(restaurants):
+    _write([restaurant_document(restaurant) for restaurant in restaurants])
+
+
+def index_items(items):
+    _write([item_document(item) for item in items])
+
+
+def rebuild():
+    """
+    Re-index every restaurant and menu item from scratch.
+
+    Returns:
+        int: Number of documents indexed
+    """
+    if fts_enabled():
+        with connections['default'].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+    else:
+        SearchDocument.objects.all().delete()
+
+    count = 0
+    for model, document in ((Restaurant, restaurant_document), (MenuItem, item_document)):
+        batch = []
+        for obj in model.objects.order_by('pk').iterator(chunk_size=BATCH_SIZE):
+            batch.append(document(obj))
+            if len(batch) == BATCH_SIZE:
+                _write(batch, replace=False)
+                count += len(batch)
+                batch = []
+        _write(batch, replace=False)
+        count += len(batch)
+
+    if fts_enabled():
+        with connections['default'].cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return count
+
+
+def _match_expression(tokens, column=None):
+    """FTS5 query matching every token, the last one as a prefix"""
+    phrases = [f'"{token}"' for token in tokens]
+    phrases[-1] += '*'
+    expression = ' '.join(phrases)
+    return f'{column} : ({expression})' if column else expression
+
+
+def _fallback_query(tokens, title_only=False):
+    """
+    SearchDocuments containing every token (the last as a prefix), plus the
+    condition matching any of their terms for scoring.
+    """
+    documents = SearchDocument.objects.all()
+    any_token = Q()
+    for position, token in enumerate(tokens):
+        lookup = {'term__startswith': token} if position == len(tokens) - 1 else {'term': token}
+        if title_only:
+            lookup['weight'] = TITLE_WEIGHT
+        documents = documents.filter(id__in=SearchTerm.objects.filter(**lookup).values('document_id'))
+        any_token |= Q(**{f'terms__{key}': value for key, value in lookup.items()})
+    return documents, any_token
+
+
+def _result(kind, object_id, restaurant_id, title):
+    return {'kind': kind, 'id': object_id, 'restaurant_id': restaurant_id, 'title': title}
+
+
+def _run(sql, params):
+    with connections['default'].cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def search(text, limit=20):
+    """
+    Ranked matches for a free-text query.
+
+    Returns:
+        list: dicts with kind, id, restaurant_id and title, best match first
+    """
+    tokens = tokenize(text)
+    if not tokens:
+        return []
+    if fts_enabled():
+        rows = _run(
+            f'SELECT rowid, restaurant_id, title FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY bm25({FTS_TABLE}, {TITLE_WEIGHT}.0, 1.0) LIMIT %s',
+            [_match_expression(tokens), limit],
+        )
+        return [_result(*_split_rowid(rowid), restaurant_id, title) for rowid, restaurant_id, title in rows]
+    documents, any_token = _fallback_query(tokens)
+    documents = documents.annotate(score=Sum('terms__weight', filter=any_token)).order_by('-score', 'title')
+    return [_result(*row) for row in documents.values_list('kind', 'object_id', 'restaurant_id', 'title')[:limit]]
+
+
+def suggest(text, limit=SUGGEST_LIMIT):
+    """
+    Typeahead: names starting with the words typed so far.
+
+    Unlike search() this only looks at titles and doesn't rank by relevance,
+    so the cost stays flat however many rows share a short prefix.
+    """
+    tokens = tokenize(text)
+    if not tokens:
+        return []
+    if fts_enabled():
+        rows = _run(
+            f'SELECT rowid, restaurant_id, title FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s LIMIT %s',
+            [_match_expression(tokens, column='title'), limit],
+        )
+        return [_result(*_split_rowid(rowid), restaurant_id, title) for rowid, restaurant_id, title in rows]
+    documents, _ = _fallback_query(tokens, title_only=True)
+    return [_result(*row) for row in documents.values_list('kind', 'object_id', 'restaurant_id', 'title')[:limit]]
+
+
+@receiver(post_save, sender=Restaurant)
+def restaurant_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_restaurants([instance])
+
+
+@receiver(post_save, sender=MenuItem)
+def menu_item_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_items([instance])
+
+
+@receiver(post_delete, sender=Restaurant)
+def restaurant_deleted(sender, instance, **kwargs):
+    _remove([(RESTAURANT, instance.pk)])
+
+
+@receiver(post_delete, sender=MenuItem)
+def menu_item_deleted(sender, instance, **kwargs):
+    _remove([(MENU_ITEM, instance.pk)])
@@ -0,0 +1,134 @@
+"""
+Shared-cache (CDN / reverse proxy) support for anonymous restaurant and menu pages.
+
+Views wrapped in ``shared_cache`` tag their responses with a
+``Surrogate-Key`` header naming the restaurants they show. On the way out
+SharedCacheMiddleware, which sits above the session middleware, checks
+whether the response is the same for every anonymous visitor: a GET with no
+session cookie whose response sets no cookies. If so it sends
+``Cache-Control: public, max-age=0, s-maxage=SHARED_CACHE_SECONDS`` and
+drops ``Vary: Cookie``. Anything else is marked private and loses its keys.
+Proxies must bypass their cache for requests carrying the session cookie,
+as ``manage.py run_cache_proxy`` does.
+
+Restaurant, MenuItem and Review writes (the owner menu and settings pages,
+new reviews) append a PurgeEvent row with the affected keys once the
+transaction commits. Proxies poll fetch_purges() and evict matching pages.
+"""
+
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+
+from .models import MenuItem, PurgeEvent, Restaurant, Review
+
+SURROGATE_KEY_HEADER = 'Surrogate-Key'
+# Every page listing more than one restaurant
+CATALOGUE_KEY = 'catalogue'
+
+
+def restaurant_key(restaurant_id):
+    return f'restaurant-{restaurant_id}'
+
+
+def shared_cache(keys_func):
+    """
+    Tag a view's responses with surrogate keys so anonymous copies can be shared.
+
+    Args:
+        keys_func: Called with the view's arguments; returns the surrogate keys
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            response[SURROGATE_KEY_HEADER] = ' '.join(keys_func(request, *args, **kwargs))
+            return response
+        return wrapper
+    return decorator
+
+
+def _drop_vary_cookie(response):
+    vary = [header.strip() for header in response.get('Vary', '').split(',') if header.strip()]
+    vary = [header for header in vary if header.lower() != 'cookie']
+    if vary:
+        response['Vary'] = ', '.join(vary)
+    elif response.has_header('Vary'):
+        del response['Vary']
+
+
+class SharedCacheMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not response.has_header(SURROGATE_KEY_HEADER):
+            return response
+
+        seconds = getattr(settings, 'SHARED_CACHE_SECONDS', 0)
+        if (
+            seconds
+            and request.method in ('GET', 'HEAD')
+            and response.status_code in (200, 304)
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES
+            and not response.cookies
+        ):
+            # The same bytes for every anonymous visitor
+            if response.has_header('Cache-Control'):
+                del response['Cache-Control']
+            patch_cache_control(response, public=True, max_age=0, s_maxage=seconds)
+            _drop_vary_cookie(response)
+        else:
+            del response[SURROGATE_KEY_HEADER]
+            patch_cache_control(response, private=True)
+        return response
+
+
+def emit_purge(keys):
+    """Record surrogate keys to purge once the current transaction commits"""
+    keys = ' '.join(sorted(set(keys)))
+    transaction.on_commit(lambda: PurgeEvent.objects.create(keys=keys))
+
+
+def fetch_purges(after_id, limit=500):
+    """
+    Purge events newer than ``after_id``, oldest first.
+
+    Returns:
+        list: (id, [surrogate keys]) tuples
+    """
+    events = PurgeEvent.objects.filter(id__gt=after_id).order_by('id').values_list('id', 'keys')[:limit]
+    return [(event_id, keys.split()) for event_id, keys in events]
+
+
+def latest_purge_id():
+    return PurgeEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def prune_purges():
+    retention = getattr(settings, 'CACHE_PURGE_RETENTION', 3600)
+    PurgeEvent.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=retention)).delete()
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def restaurant_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        emit_purge([restaurant_key(instance.pk), CATALOGUE_KEY])
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def restaurant_content_changed(sender, instance, raw=False, **kwargs):
+    # Menu items change price ranges and reviews change ratings on the listings too
+    if not raw:
+        emit_purge([restaurant_key(instance.restaurant_id), CATALOGUE_KEY])
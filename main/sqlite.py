@@ -0,0 +1,89 @@
+"""
+SQLite tuning for several gunicorn workers sharing one database file.
+
+Every new SQLite connection gets the ``SQLITE_PRAGMAS`` profile from the
+settings. The defaults are:
+
+- WAL journaling, so readers never block the writer or the other way round
+- ``synchronous=NORMAL``, which is durable under WAL except on power loss
+- a busy timeout, so a writer waits for the lock instead of failing at once
+- a memory-mapped file, a larger page cache and in-memory temp tables
+
+Transactions begin IMMEDIATE (see DATABASES in settings), so the write lock
+is taken up front where the busy timeout applies. A deferred transaction
+that reads first and then writes can fail at the upgrade whatever the
+timeout.
+
+A writer can still give up after the busy timeout under a burst.
+``retry_on_lock`` re-runs such a write after a short random pause.
+"""
+
+import logging
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+# Errors SQLite raises when the busy timeout ran out
+_LOCK_MESSAGES = ('database is locked', 'database table is locked', 'database is busy')
+
+
+@receiver(connection_created)
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = dict(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    if not pragmas:
+        return
+    journal_mode = pragmas.pop('journal_mode', None)
+    if 'mode=ro' in str(connection.settings_dict['NAME']):
+        # The read replica connection (main.replica) can't change the file
+        journal_mode = None
+        pragmas['query_only'] = 1
+    with connection.cursor() as cursor:
+        # busy_timeout first, so the rest wait for a busy database
+        for name in sorted(pragmas, key=lambda name: name != 'busy_timeout'):
+            cursor.execute(f'PRAGMA {name} = {pragmas[name]}')
+        # The journal mode is stored in the file; switching it needs the
+        # database to ourselves, so only do it when it actually changes
+        if journal_mode:
+            cursor.execute('PRAGMA journal_mode')
+            if cursor.fetchone()[0].lower() != str(journal_mode).lower():
+                cursor.execute(f'PRAGMA journal_mode = {journal_mode}')
+
+
+def is_lock_error(error):
+    return isinstance(error, OperationalError) and any(m in str(error).lower() for m in _LOCK_MESSAGES)
+
+
+def retry_on_lock(func):
+    """
+    Retry a write that failed because SQLite stayed locked past the busy timeout.
+
+    Attempts are spaced by exponential backoff with full jitter, starting at
+    ``SQLITE_LOCK_BACKOFF`` seconds, up to ``SQLITE_LOCK_RETRIES`` retries.
+    Inside an outer transaction nothing is retried: the whole transaction
+    has to be rolled back.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = getattr(settings, 'SQLITE_LOCK_RETRIES', 0)
+        backoff = getattr(settings, 'SQLITE_LOCK_BACKOFF', 0.05)
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if attempt >= retries or not is_lock_error(e) or connection.in_atomic_block:
+                    raise
+                delay = random.uniform(0, backoff * 2 ** attempt)
+                attempt += 1
+                logger.warning(f'{func.__qualname__}: database locked, retry {attempt}/{retries} in {delay:.3f}s')
+                time.sleep(delay)
+    return wrapper
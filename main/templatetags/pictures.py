@@ -0,0 +1,62 @@
+"""
+Responsive image markup for restaurants and menu items.
+
+Both helpers take a Restaurant or MenuItem, or the dict main.menu_cache keeps
+for one, and read only its ``url``, ``image_variants`` and ``image_sources``:
+
+    {% load pictures %}
+    {% picture item sizes="(min-width: 768px) 33vw, 100vw" alt=item.name css_class="w-full h-48" %}
+    <img srcset="{{ item|srcset:'webp' }}" ...>
+
+Uploads get a srcset per format. Bundled images get the WebP/AVIF copies
+optimize_images made, once collectstatic has them in its manifest.
+"""
+
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html, format_html_join
+
+from main import images
+
+register = template.Library()
+
+
+def _field(obj, name):
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+@register.simple_tag
+def picture(obj, sizes='100vw', alt='', css_class='', loading='lazy'):
+    """<img>, wrapped in a <picture> with a <source> per better format when there are any"""
+    variants = _field(obj, 'image_variants')
+    sources = _field(obj, 'image_sources')
+    if sources is None:
+        # Cached before image_sources existed
+        sources = images.image_sources(None, variants, '')
+
+    attrs = {'src': _field(obj, 'url')}
+    if variants:
+        width, height = images.display_size(variants, variants['widths'][-1])
+        attrs.update(srcset=srcset(obj), sizes=sizes, width=width, height=height)
+    attrs.update({'alt': alt, 'class': css_class or None, 'loading': loading, 'decoding': 'async'})
+    img = format_html('<img{}>', flatatt(attrs))
+    if not sources:
+        return img
+    source_sizes = {'sizes': sizes} if variants else {}
+    return format_html(
+        '<picture>{}{}</picture>',
+        format_html_join(
+            '', '<source{}>',
+            ((flatatt({'type': mime, 'srcset': candidates, **source_sizes}),) for mime, candidates in sources),
+        ),
+        img,
+    )
+
+
+@register.filter
+def srcset(obj, format=images.FALLBACK_FORMAT):
+    """The ``srcset`` of one format's derivatives, or '' if there are none"""
+    mime = images.OUTPUT_FORMATS.get(format, (None, None, None))[2]
+    return dict(images.sources(_field(obj, 'image_variants'))).get(mime, '')
@@ -1,3 +1,1377 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, connections, router, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    cache_versions, coupons, events, group_commit, health, images, menu_cache, orders, owners, replica, rollups,
+    search, shared_cache,
+)
+from .management.commands.run_cache_proxy import ProxyCache, shared_max_age
+from .middleware import metadata, parse_range
+from .models import (
+    CacheVersion, Coupon, CouponUsage, DailyRollup, ItemRollup, MenuItem, Order, OrderEvent, OrderItem, Owner,
+    PurgeEvent, Restaurant, Review,
+)
+from .page_cache import CSRF_PLACEHOLDER, PageCacheMiddleware
+from .pagination import KeysetPaginator, decode_cursor, encode_cursor
+from .sqlite import retry_on_lock
+
+
+class MenuFixtures:
+    """A restaurant with two menu items and a customer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = Restaurant.objects.create(name='Seoul Kitchen', location='Downtown', cuisine='korean')
+        cls.bibimbap = MenuItem.objects.create(restaurant=cls.restaurant, name='Bibimbap', price=Decimal('12.50'))
+        cls.kimchi = MenuItem.objects.create(restaurant=cls.restaurant, name='Kimchi', price=Decimal('4.00'))
+        cls.customer = User.objects.create_user('customer', password='secret')
+
+
+class OrderTotalsTests(MenuFixtures, TestCase):
+    def setUp(self):
+        self.order = Order.objects.create(user=self.customer, restaurant=self.restaurant)
+
+    def assertTotals(self, total_price, item_count, total_after_discount=None):
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, Decimal(total_price))
+        self.assertEqual(self.order.item_count, item_count)
+        self.assertEqual(self.order.total_after_discount, Decimal(total_after_discount or total_price))
+
+    def test_adding_lines(self):
+        OrderItem.objects.create(order=self.order, menu_item=self.bibimbap, quantity=2)
+        self.assertTotals('25.00', 2)
+        OrderItem.objects.create(order=self.order, menu_item=self.kimchi)
+        self.assertTotals('29.00', 3)
+
+    def test_updating_a_line(self):
+        line = OrderItem.objects.create(order=self.order, menu_item=self.kimchi)
+        line.quantity = 5
+        line.save()
+        self.assertTotals('20.00', 5)
+
+    def test_deleting_lines(self):
+        line = OrderItem.objects.create(order=self.order, menu_item=self.bibimbap)
+        OrderItem.objects.create(order=self.order, menu_item=self.kimchi, quantity=2)
+        line.delete()
+        self.assertTotals('8.00', 2)
+        self.order.items.all().delete()
+        self.assertTotals('0.00', 0)
+
+    def test_discount_is_taken_from_the_stored_subtotal(self):
+        OrderItem.objects.create(order=self.order, menu_item=self.bibimbap, quantity=2)
+        self.order.discount_applied = Decimal('5.00')
+        self.order.save()
+        self.order.refresh_totals()
+        self.assertTotals('25.00', 2, '20.00')
+
+    def test_saving_a_stale_instance_keeps_the_totals(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        OrderItem.objects.create(order=self.order, menu_item=self.kimchi)
+        stale.status = 'Preparing'
+        stale.save()
+        self.assertTotals('4.00', 1)
+
+
+
+class OrderPlacementTests(MenuFixtures, TestCase):
+    def test_order_is_written_with_its_totals(self):
+        order = orders.create_order(self.customer, self.restaurant, {self.bibimbap.pk: 2, self.kimchi.pk: 3})
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'Pending')
+        self.assertEqual(order.total_price, Decimal('37.00'))
+        self.assertEqual(order.total_after_discount, Decimal('37.00'))
+        self.assertEqual(order.item_count, 5)
+        self.assertEqual(
+            sorted(order.items.values_list('item_name', 'quantity', 'unit_price')),
+            [('Bibimbap', 2, Decimal('12.50')), ('Kimchi', 3, Decimal('4.00'))],
+        )
+
+    def test_query_count_does_not_grow_with_the_lines(self):
+        # The first order of the day also creates the rollup rows
+        orders.create_order(self.customer, self.restaurant, {self.kimchi.pk: 1})
+        with CaptureQueriesContext(connection) as one_line:
+            orders.create_order(self.customer, self.restaurant, {self.kimchi.pk: 1})
+        with CaptureQueriesContext(connection) as two_lines:
+            orders.create_order(self.customer, self.restaurant, {self.bibimbap.pk: 4, self.kimchi.pk: 1})
+        self.assertEqual(len(two_lines), len(one_line))
+        self.assertEqual(sum('"main_menuitem"' in query['sql'] for query in two_lines), 1)
+
+    def test_invalid_orders_write_nothing(self):
+        other = Restaurant.objects.create(name='Bistro Lyon', location='Old town', cuisine='french')
+        soup = MenuItem.objects.create(restaurant=other, name='Onion soup', price=Decimal('8.00'))
+        for quantities, error in [
+            ({}, orders.EmptyOrderError),
+            ({self.kimchi.pk: orders.MAX_ORDER_QUANTITY + 1}, orders.OrderError),
+            ({self.kimchi.pk: 1, soup.pk: 1}, orders.OrderError),
+            ({self.kimchi.pk: 1, 0: 1}, orders.OrderError),
+        ]:
+            with self.subTest(quantities=quantities):
+                with self.assertRaises(error):
+                    orders.create_order(self.customer, self.restaurant, quantities)
+        self.assertFalse(Order.objects.exists())
+
+    def test_parse_quantities(self):
+        self.assertEqual(
+            orders.parse_quantities({'quantity_3': '2', 'quantity_4': '0', 'csrfmiddlewaretoken': 'x'}),
+            {3: 2},
+        )
+        for data in [{'quantity_3': 'two'}, {'quantity_x': '1'}, {'quantity_3': '-1'}]:
+            with self.subTest(data=data):
+                with self.assertRaises(orders.OrderError):
+                    orders.parse_quantities(data)
+
+
+class OrderItemSnapshotTests(MenuFixtures, TestCase):
+    def test_menu_edits_leave_placed_orders_alone(self):
+        order = orders.create_order(self.customer, self.restaurant, {self.bibimbap.pk: 2})
+        line = OrderItem.objects.create(order=order, menu_item=self.kimchi)
+        self.bibimbap.price = Decimal('20.00')
+        self.bibimbap.name = 'Dolsot bibimbap'
+        self.bibimbap.save()
+        MenuItem.objects.filter(pk=self.kimchi.pk).update(price=Decimal('9.00'))
+
+        line.quantity = 2
+        line.save()
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, Decimal('33.00'))
+        self.assertEqual(order.calculate_total, Decimal('33.00'))
+        self.assertEqual(
+            sorted((item.name, item.price) for item in order.items.all()),
+            [('Bibimbap', Decimal('25.00')), ('Kimchi', Decimal('8.00'))],
+        )
+
+    def test_explicit_snapshot_is_kept(self):
+        order = Order.objects.create(user=self.customer, restaurant=self.restaurant)
+        line = OrderItem.objects.create(order=order, menu_item=self.kimchi, unit_price=Decimal('3.50'), item_name='Kimchi (small)')
+        self.assertEqual((line.unit_price, line.item_name), (Decimal('3.50'), 'Kimchi (small)'))
+
+
+class RestaurantStatsTests(MenuFixtures, TestCase):
+    def stats(self):
+        self.restaurant.refresh_from_db()
+        return {field: getattr(self.restaurant, field) for field in Restaurant.STATS_FIELDS}
+
+    def test_reviews_keep_the_rating(self):
+        first = Review.objects.create(restaurant=self.restaurant, user=self.customer, rating=5, review_text='Great')
+        Review.objects.create(restaurant=self.restaurant, name='Guest', rating=2, review_text='Cold')
+        self.assertEqual(self.stats()['rating_sum'], 7)
+        self.assertEqual(self.restaurant.review_count, 2)
+        self.assertEqual(self.restaurant.average_rating, 3.5)
+
+        first = Review.objects.get(pk=first.pk)
+        first.rating = 3
+        first.save()
+        first.review_text = 'Good'
+        first.save()
+        self.assertEqual(self.stats()['rating_sum'], 5)
+
+        first.delete()
+        self.assertEqual((self.stats()['rating_sum'], self.restaurant.review_count), (2, 1))
+
+    def test_menu_changes_keep_the_size_and_price_range(self):
+        self.assertEqual(self.stats(), {
+            'rating_sum': 0, 'review_count': 0, 'menu_item_count': 2,
+            'min_price': Decimal('4.00'), 'max_price': Decimal('12.50'),
+        })
+        MenuItem.objects.create(restaurant=self.restaurant, name='Galbi', price=Decimal('24.00'))
+        self.kimchi.price = Decimal('5.00')
+        self.kimchi.save()
+        stats = self.stats()
+        self.assertEqual((stats['menu_item_count'], stats['min_price'], stats['max_price']),
+                         (3, Decimal('5.00'), Decimal('24.00')))
+        MenuItem.objects.filter(restaurant=self.restaurant).delete()
+        stats = self.stats()
+        self.assertEqual((stats['menu_item_count'], stats['min_price'], stats['max_price']), (0, None, None))
+
+    def test_saving_a_stale_instance_keeps_the_stats(self):
+        stale = Restaurant.objects.get(pk=self.restaurant.pk)
+        Review.objects.create(restaurant=self.restaurant, user=self.customer, rating=4, review_text='Nice')
+        stale.description = 'Korean home cooking'
+        stale.save()
+        self.assertEqual(self.stats()['review_count'], 1)
+        self.assertEqual(self.restaurant.description, 'Korean home cooking')
+
+
+class RollupTests(MenuFixtures, TestCase):
+    def place(self, status='Completed'):
+        order = orders.create_order(self.customer, self.restaurant, {self.bibimbap.pk: 2, self.kimchi.pk: 1})
+        orders.update_status(order, status)
+        return order
+
+    def test_completed_orders_are_counted(self):
+        self.place()
+        self.place('Pending')
+        totals = rollups.restaurant_totals(self.restaurant)
+        self.assertEqual(totals['orders'], 2)
+        self.assertEqual(totals['completed_orders'], 1)
+        self.assertEqual(totals['pending_orders'], 1)
+        self.assertEqual(totals['revenue'], Decimal('29.00'))
+        self.assertEqual(
+            dict(ItemRollup.objects.values_list('item_name', 'quantity')),
+            {'Bibimbap': 2, 'Kimchi': 1},
+        )
+
+    def test_rebuild_matches_the_increments(self):
+        self.place()
+        self.place('Cancelled')
+        expected = list(DailyRollup.objects.values('orders', 'completed_orders', 'revenue'))
+        rollups.rebuild(restaurant_ids=[self.restaurant.pk])
+        self.assertEqual(list(DailyRollup.objects.values('orders', 'completed_orders', 'revenue')), expected)
+
+    def test_deleting_an_order_rebuilds_its_day_once(self):
+        order = self.place()
+        with mock.patch.object(rollups, 'rebuild', wraps=rollups.rebuild) as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                order.delete()
+        rebuild.assert_called_once_with(restaurant_ids=[self.restaurant.pk], day=rollups.buckets(order.created_at)[0])
+        self.assertEqual(rollups.restaurant_totals(self.restaurant)['orders'], 0)
+        self.assertFalse(ItemRollup.objects.exists())
+
+    def test_rebuilds_survive_a_rolled_back_savepoint(self):
+        first, second = self.place(), self.place()
+        with mock.patch.object(rollups, 'rebuild', wraps=rollups.rebuild) as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        first.delete()
+                        raise IntegrityError
+                except IntegrityError:
+                    pass
+                second.delete()
+        rebuild.assert_called_once_with(restaurant_ids=[self.restaurant.pk], day=rollups.buckets(second.created_at)[0])
+        self.assertEqual(rollups.restaurant_totals(self.restaurant)['orders'], 1)
+        self.assertEqual(rollups.restaurant_totals(self.restaurant)['revenue'], Decimal('29.00'))
+
+
+class KeysetPaginatorTests(MenuFixtures, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        start = timezone.now()
+        for i in range(7):
+            review = Review.objects.create(restaurant=cls.restaurant, rating=5, review_text=f'Review {i}')
+            # Pairs of reviews share a timestamp, so the id has to break ties
+            Review.objects.filter(pk=review.pk).update(created_at=start - timedelta(minutes=i // 2))
+        cls.newest_first = list(Review.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def paginator(self):
+        return KeysetPaginator(Review.objects.all(), per_page=3)
+
+    def ids(self, page):
+        return [review.pk for review in page]
+
+    def test_cursor_round_trip(self):
+        moment = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(moment, 42)), (moment, 42, False))
+        self.assertEqual(decode_cursor(encode_cursor(moment, 42, backwards=True)), (moment, 42, True))
+
+    def test_malformed_cursor_gives_the_first_page(self):
+        for cursor in (None, '', 'not-a-cursor', '!!!', encode_cursor(timezone.now(), 1)[:-4]):
+            self.assertIsNone(decode_cursor(cursor))
+            self.assertEqual(self.ids(self.paginator().page(cursor)), self.newest_first[:3])
+
+    def test_forward_walk_visits_every_row_once(self):
+        seen = []
+        page = self.paginator().page()
+        self.assertFalse(page.has_previous())
+        while True:
+            seen += self.ids(page)
+            if not page.has_next():
+                break
+            page = self.paginator().page(page.next_cursor)
+        self.assertEqual(seen, self.newest_first)
+
+    def test_backward_walk_returns_the_same_pages(self):
+        first = self.paginator().page()
+        second = self.paginator().page(first.next_cursor)
+        last = self.paginator().page(second.next_cursor)
+        self.assertEqual(self.ids(last), self.newest_first[6:])
+        back = self.paginator().page(last.previous_cursor)
+        self.assertEqual(self.ids(back), self.ids(second))
+        back = self.paginator().page(back.previous_cursor)
+        self.assertEqual(self.ids(back), self.ids(first))
+        self.assertFalse(back.has_previous())
+
+
+class OrderEventTests(MenuFixtures, TestCase):
+    def place(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return orders.create_order(self.customer, self.restaurant, {self.kimchi.pk: 1})
+
+    def test_nothing_is_recorded_while_the_feed_is_off(self):
+        self.place()
+        self.assertFalse(OrderEvent.objects.exists())
+
+    @override_settings(ORDER_FEED_ENABLED=True, ORDER_FEED_RETENTION=60)
+    def test_writes_record_events_and_prune_old_ones(self):
+        self.place()
+        OrderEvent.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        events._pruned_at = None
+        new = self.place()
+        self.assertEqual(list(OrderEvent.objects.values_list('order_id', 'kind')), [(new.pk, OrderEvent.CREATED)])
+
+
+@override_settings(ORDER_FEED_POLL_INTERVAL=0.01)
+class OrderFeedTests(TestCase):
+    def test_notifier_survives_a_failed_poll(self):
+        event = {'id': 8, 'restaurant_id': 1, 'kind': OrderEvent.CREATED, 'order': {}}
+        results = [7, OperationalError('database is locked'), [event]]
+
+        def poll(after_id):
+            result = results.pop(0) if results else []
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        async def listen():
+            feed = events.OrderFeed()
+            queue = asyncio.Queue()
+            feed.subscribers[1].add(queue)
+            feed._ensure_running()
+            try:
+                return await asyncio.wait_for(queue.get(), 5), feed.last_id
+            finally:
+                feed.subscribers.clear()
+                await feed.task
+
+        with mock.patch.object(events, 'poll', side_effect=poll) as polled, self.assertLogs('main.events', 'ERROR'):
+            self.assertEqual(asyncio.run(listen()), (event, 8))
+        self.assertEqual([call.args[0] for call in polled.call_args_list[:3]], [None, 7, 7])
+
+
+class MenuCacheTests(MenuFixtures, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def prices(self):
+        return {item['name']: item['price'] for item in menu_cache.get_menu(self.restaurant.pk)['items']}
+
+    def test_menu_writes_invalidate_the_cached_menu(self):
+        self.assertEqual(self.prices()['Kimchi'], Decimal('4.00'))
+        version = menu_cache.versions([self.restaurant.pk])[self.restaurant.pk]
+        with self.captureOnCommitCallbacks(execute=True):
+            MenuItem.objects.filter(pk=self.kimchi.pk).update(price=Decimal('5.00'))
+            self.kimchi.refresh_from_db()
+            self.kimchi.save()
+        self.assertNotEqual(menu_cache.versions([self.restaurant.pk])[self.restaurant.pk], version)
+        self.assertEqual(self.prices()['Kimchi'], Decimal('5.00'))
+        self.assertIsNotNone(menu_cache.last_modified(self.restaurant.pk))
+
+    def test_a_bump_from_another_process_is_seen(self):
+        self.prices()
+        MenuItem.objects.filter(pk=self.kimchi.pk).update(price=Decimal('6.00'))
+        # What another worker's write leaves behind: only the database row changes
+        cache_versions.bump(f'menu:{self.restaurant.pk}')
+        self.assertEqual(self.prices()['Kimchi'], Decimal('6.00'))
+
+    def test_bump_creates_missing_counters(self):
+        cache_versions.bump('test:a', 'test:b')
+        first = cache_versions.get_many(['test:a', 'test:b'])
+        cache_versions.bump('test:a')
+        self.assertGreater(cache_versions.get('test:a')[0], first['test:a'][0])
+        self.assertEqual(cache_versions.get('test:b'), first['test:b'])
+        self.assertEqual(cache_versions.get('test:missing'), (0, None))
+        self.assertEqual(CacheVersion.objects.filter(key__startswith='test:').count(), 2)
+
+
+class CouponTests(MenuFixtures, TestCase):
+    def setUp(self):
+        index = mock.patch.object(coupons, 'index', coupons.CouponIndex())
+        index.start()
+        self.addCleanup(index.stop)
+        self.other = User.objects.create_user('other', password='secret')
+
+    def coupon(self, **limits):
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            return Coupon.objects.create(
+                code='SAVE10', discount_percentage=10,
+                valid_from=now - timedelta(days=1), valid_to=now + timedelta(days=1), **limits,
+            )
+
+    def order(self, user=None):
+        return orders.create_order(user or self.customer, self.restaurant, {self.bibimbap.pk: 2})
+
+    def apply(self, order, user=None):
+        return coupons.apply_coupon(order, 'save10', user or order.user)
+
+    def test_applying_stores_the_discount_without_redeeming(self):
+        coupon = self.coupon(max_redemptions=1)
+        order = self.order()
+        self.apply(order)
+        self.assertEqual(order.total_after_discount, Decimal('22.50'))
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.redemption_count, 0)
+        # An abandoned cart doesn't use up the code for anyone else
+        other = self.order(self.other)
+        self.apply(other)
+        orders.checkout(other, self.other)
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.redemption_count, 1)
+
+    def test_total_limit(self):
+        self.coupon(max_redemptions=1)
+        first, second = self.order(), self.order(self.other)
+        self.apply(first)
+        self.apply(second)
+        orders.checkout(first, self.customer)
+        with self.assertRaisesMessage(coupons.CouponError, 'fully redeemed'):
+            orders.checkout(second, self.other)
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'Pending')
+        self.assertFalse(second.coupon_redeemed)
+        with self.assertRaisesMessage(coupons.CouponError, 'fully redeemed'):
+            self.apply(self.order(self.other))
+
+    def test_per_user_limit(self):
+        coupon = self.coupon(max_redemptions_per_user=1)
+        first = self.order()
+        self.apply(first)
+        orders.checkout(first, self.customer)
+        with self.assertRaisesMessage(coupons.CouponError, 'maximum number of times'):
+            self.apply(self.order())
+        self.apply(self.order(self.other))
+        self.assertEqual(CouponUsage.objects.get(coupon=coupon, user=self.customer).redemptions, 1)
+
+    def test_checkout_redeems_once(self):
+        coupon = self.coupon(max_redemptions=5)
+        order = self.order()
+        self.apply(order)
+        coupons.redeem(order, self.customer)
+        coupons.redeem(order, self.customer)
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.redemption_count, 1)
+
+    def test_cancelling_a_checked_out_order_gives_the_redemption_back(self):
+        coupon = self.coupon(max_redemptions=1, max_redemptions_per_user=1)
+        order = self.order()
+        self.apply(order)
+        orders.checkout(order, self.customer)
+        orders.update_status(order, 'Cancelled')
+        orders.update_status(order, 'Cancelled')
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.redemption_count, 0)
+        self.assertEqual(CouponUsage.objects.get(coupon=coupon, user=self.customer).redemptions, 0)
+        self.apply(self.order())
+
+    def test_deactivated_coupon_fails_at_checkout(self):
+        coupon = self.coupon()
+        order = self.order()
+        self.apply(order)
+        with self.captureOnCommitCallbacks(execute=True):
+            coupon.is_active = False
+            coupon.save()
+        with self.assertRaises(coupons.CouponError):
+            orders.checkout(order, self.customer)
+        coupons.remove_coupon(order)
+        self.assertEqual(order.total_after_discount, Decimal('25.00'))
+
+
+class CampaignCouponTests(MenuFixtures, TestCase):
+    def test_generated_codes_are_unique_and_prefixed(self):
+        codes = coupons.generate_codes(2000, prefix=' spring ')
+        self.assertEqual(len(set(codes)), 2000)
+        self.assertEqual(codes, sorted(codes))
+        for code in codes:
+            self.assertEqual(len(code), len('SPRING') + coupons.CODE_LENGTH)
+            self.assertTrue(code.startswith('SPRING'))
+            self.assertLessEqual(set(code[len('SPRING'):]), set(coupons.CODE_ALPHABET))
+
+    def test_codes_in_use_are_drawn_again(self):
+        now = timezone.now()
+        Coupon.objects.create(code='SPRINGAAAA', discount_percentage=5, valid_from=now, valid_to=now)
+        draws = [['AAAA', 'BBBB'], ['AAAA'], ['CCCC']]
+        with mock.patch.object(coupons, '_random_codes', side_effect=lambda *args: draws.pop(0)):
+            self.assertEqual(coupons.generate_codes(2, length=4, prefix='spring'), ['SPRINGBBBB', 'SPRINGCCCC'])
+
+    def test_impossible_requests(self):
+        for kwargs in [
+            {'count': 10, 'length': 2, 'alphabet': 'AB'},
+            {'count': 1, 'alphabet': 'A'},
+            {'count': 1, 'alphabet': 'ÄÖ'},
+            {'count': 1, 'length': 60},
+        ]:
+            with self.subTest(**kwargs):
+                with self.assertRaises(ValueError):
+                    coupons.generate_codes(**kwargs)
+
+    def test_command_creates_the_campaign(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'codes.csv')
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                call_command('generate_coupons', 250, prefix='spring', discount=15, batch_size=100,
+                             per_user=1, output=output, stderr=io.StringIO())
+            with open(output, newline='') as file:
+                rows = list(csv.DictReader(file))
+        self.assertEqual(len(rows), 250)
+        # A few multi-row INSERTs (SQLite's parameter limit splits the batches of 100)
+        self.assertLessEqual(sum(query['sql'].startswith('INSERT INTO "main_coupon"') for query in queries), 5)
+        created = Coupon.objects.filter(code__startswith='SPRING')
+        self.assertEqual(sorted(created.values_list('code', flat=True)), [row['code'] for row in rows])
+        self.assertEqual(set(created.values_list('discount_percentage', 'max_redemptions', 'max_redemptions_per_user')),
+                         {(15, 1, 1)})
+        # The coupon index sees the new codes
+        order = orders.create_order(self.customer, self.restaurant, {self.bibimbap.pk: 2})
+        coupons.apply_coupon(order, rows[0]['code'].lower(), self.customer)
+        self.assertEqual(order.total_after_discount, Decimal('21.25'))
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """
+    Checkouts racing for the last redemption, each on its own connection, so
+    the row locks and F() counters are exercised on the real backend (and the
+    pool when DB_POOL is on).
+    """
+
+    CUSTOMERS = 4
+
+    def setUp(self):
+        index = mock.patch.object(coupons, 'index', coupons.CouponIndex())
+        index.start()
+        self.addCleanup(index.stop)
+        restaurant = Restaurant.objects.create(name='Seoul Kitchen', location='Downtown', cuisine='korean')
+        item = MenuItem.objects.create(restaurant=restaurant, name='Bibimbap', price=Decimal('12.50'))
+        now = timezone.now()
+        self.coupon = Coupon.objects.create(
+            code='LAST1', discount_percentage=10, max_redemptions=1,
+            valid_from=now - timedelta(days=1), valid_to=now + timedelta(days=1),
+        )
+        self.orders = []
+        for number in range(self.CUSTOMERS):
+            user = User.objects.create_user(f'customer{number}', password='secret')
+            order = orders.create_order(user, restaurant, {item.pk: 1})
+            coupons.apply_coupon(order, 'last1', user)
+            self.orders.append(order)
+
+    def test_only_one_checkout_gets_the_last_redemption(self):
+        barrier = threading.Barrier(self.CUSTOMERS)
+        outcomes = []
+
+        def check_out(order):
+            try:
+                barrier.wait()
+                orders.checkout(order, order.user)
+                outcomes.append('completed')
+            except coupons.CouponError:
+                outcomes.append('rejected')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=check_out, args=(order,)) for order in self.orders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(outcomes), ['completed'] + ['rejected'] * (self.CUSTOMERS - 1))
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.redemption_count, 1)
+        self.assertEqual(Order.objects.filter(status='Completed', coupon_redeemed=True).count(), 1)
+
+
+class SearchTests(MenuFixtures, TestCase):
+    """Runs on the backend's own index: FTS5 on SQLite, the token tables elsewhere"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        MenuItem.objects.create(restaurant=cls.restaurant, name='Dolsot bibimbap', price=Decimal('14.00'),
+                                description='Served in a hot stone bowl')
+        cls.bistro = Restaurant.objects.create(name='Bistro Lyon', location='Old town', cuisine='french')
+        MenuItem.objects.create(restaurant=cls.bistro, name='Onion soup', price=Decimal('8.00'),
+                                description='With a kimchi twist')
+
+    def titles(self, results):
+        return [result['title'] for result in results]
+
+    def test_title_matches_rank_first(self):
+        results = search.search('kimchi')
+        self.assertEqual(self.titles(results), ['Kimchi', 'Onion soup'])
+        self.assertEqual(results[0], {
+            'kind': search.MENU_ITEM, 'id': self.kimchi.pk,
+            'restaurant_id': self.restaurant.pk, 'title': 'Kimchi',
+        })
+
+    def test_every_word_must_match_and_the_last_is_a_prefix(self):
+        self.assertEqual(self.titles(search.search('stone bibim')), ['Dolsot bibimbap'])
+        self.assertEqual(search.search('stone lyon'), [])
+        self.assertEqual(search.search('  '), [])
+
+    def test_suggest_only_matches_titles(self):
+        self.assertEqual(sorted(self.titles(search.suggest('bibi'))), ['Bibimbap', 'Dolsot bibimbap'])
+        self.assertEqual(self.titles(search.suggest('bis')), ['Bistro Lyon'])
+        self.assertEqual(search.suggest('stone'), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.kimchi.name = 'Kkakdugi'
+        self.kimchi.save()
+        self.assertEqual(self.titles(search.search('kimchi')), ['Onion soup'])
+        self.bistro.delete()
+        self.assertEqual(search.search('kimchi'), [])
+        self.assertEqual(self.titles(search.suggest('kkak')), ['Kkakdugi'])
+
+    def test_rebuild(self):
+        self.assertEqual(search.rebuild(), 6)
+        self.assertEqual(self.titles(search.search('kimchi')), ['Kimchi', 'Onion soup'])
+
+
+@mock.patch.dict(search._fts_enabled, {'default': False})
+class FallbackSearchTests(SearchTests):
+    """The token tables, as used on PostgreSQL or SQLite builds without FTS5"""
+
+    @classmethod
+    def setUpTestData(cls):
+        with mock.patch.dict(search._fts_enabled, {'default': False}):
+            super().setUpTestData()
+
+
+@override_settings(SQLITE_LOCK_RETRIES=2, SQLITE_LOCK_BACKOFF=0)
+class RetryOnLockTests(TransactionTestCase):
+    """Not a TestCase: its transaction would turn retries off"""
+
+    def flaky(self, *errors):
+        """A write that raises ``errors`` one per call, then succeeds"""
+        errors = list(errors)
+
+        @retry_on_lock
+        def write():
+            if errors:
+                raise errors.pop(0)
+            return 'written'
+        return write
+
+    def test_lock_errors_are_retried(self):
+        with self.assertLogs('main.sqlite', 'WARNING') as logs:
+            self.assertEqual(self.flaky(OperationalError('database is locked'),
+                                        OperationalError('database table is locked'))(), 'written')
+        self.assertEqual(len(logs.records), 2)
+
+    def test_gives_up_after_the_retries(self):
+        write = self.flaky(*[OperationalError('database is locked')] * 3)
+        with self.assertLogs('main.sqlite', 'WARNING') as logs, self.assertRaisesMessage(OperationalError, 'locked'):
+            write()
+        self.assertEqual(len(logs.records), 2)
+
+    def test_other_errors_are_not_retried(self):
+        write = self.flaky(OperationalError('no such table: main_order'))
+        with self.assertRaisesMessage(OperationalError, 'no such table'):
+            write()
+        self.assertEqual(write(), 'written')
+
+    def test_nothing_is_retried_inside_a_transaction(self):
+        write = self.flaky(OperationalError('database is locked'))
+        with self.assertRaisesMessage(OperationalError, 'locked'):
+            with transaction.atomic():
+                write()
+        self.assertEqual(write(), 'written')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite pragmas')
+class SqlitePragmaTests(TestCase):
+    def test_pragmas_are_applied_to_new_connections(self):
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = {**connection.settings_dict, 'NAME': os.path.join(directory, 'db.sqlite3')}
+            database = connections['default'].__class__(settings_dict)
+            try:
+                with database.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                    cursor.execute('PRAGMA busy_timeout')
+                    self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+                database.close()
+
+                # The journal mode is already WAL, so a new connection only reads it
+                database.force_debug_cursor = True
+                database.ensure_connection()
+                statements = [query['sql'] for query in database.queries]
+                self.assertEqual(statements[0], f"PRAGMA busy_timeout = {settings.SQLITE_PRAGMAS['busy_timeout']}")
+                self.assertIn('PRAGMA journal_mode', statements)
+                self.assertFalse([sql for sql in statements if sql.startswith('PRAGMA journal_mode =')])
+            finally:
+                database.close()
+
+
+class GroupCommitTests(TransactionTestCase):
+    """The writer thread uses its own connection, so these commit for real"""
+
+    def setUp(self):
+        self.writer = group_commit.GroupCommitWriter()
+
+    def queue(self, func, *args):
+        future = group_commit.Future()
+        self.writer.jobs.put((future, func, args, {}))
+        return future
+
+    @staticmethod
+    def create(name):
+        return Restaurant.objects.create(name=name, location='Downtown')
+
+    @classmethod
+    def create_and_fail(cls, name):
+        cls.create(name)
+        raise ValueError(f'{name} was refused')
+
+    def test_a_failing_job_only_fails_its_caller(self):
+        # Queued before the thread starts, so they go in one batch
+        futures = [self.queue(self.create, 'Seoul Kitchen'), self.queue(self.create_and_fail, 'Bistro Lyon'),
+                   self.queue(self.create, 'Taco Stand')]
+        self.writer.ensure_started()
+        self.assertEqual(futures[0].result(5).name, 'Seoul Kitchen')
+        with self.assertRaisesMessage(ValueError, 'Bistro Lyon was refused'):
+            futures[1].result(5)
+        self.assertEqual(futures[2].result(5).name, 'Taco Stand')
+        self.assertEqual(sorted(Restaurant.objects.values_list('name', flat=True)), ['Seoul Kitchen', 'Taco Stand'])
+        self.assertEqual((self.writer.batches, self.writer.written), (1, 3))
+
+    def test_writer_survives_a_failure_outside_the_batch(self):
+        with mock.patch.object(group_commit, 'close_old_connections', side_effect=[OperationalError('gone'), None]):
+            with self.assertLogs('main.group_commit', 'ERROR'), self.assertRaisesMessage(OperationalError, 'gone'):
+                self.writer.submit(self.create, 'Seoul Kitchen')
+            self.assertEqual(self.writer.submit(self.create, 'Bistro Lyon').name, 'Bistro Lyon')
+        self.assertTrue(self.writer.thread.is_alive())
+
+    def test_dead_writer_is_restarted(self):
+        self.writer.submit(self.create, 'Seoul Kitchen')
+        thread = self.writer.thread
+        # Something the loop doesn't catch ends the thread
+        self.writer.jobs.put((mock.Mock(**{'set_running_or_notify_cancel.side_effect': SystemExit}), None, (), {}))
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        with self.assertLogs('main.group_commit', 'ERROR'):
+            self.assertEqual(self.writer.submit(self.create, 'Bistro Lyon').name, 'Bistro Lyon')
+        self.assertIsNot(self.writer.thread, thread)
+
+    @override_settings(ORDER_GROUP_COMMIT_TIMEOUT=0.05)
+    def test_a_stuck_writer_falls_back_to_an_inline_write(self):
+        with mock.patch.object(self.writer, 'ensure_started'):
+            with self.assertLogs('main.group_commit', 'WARNING'):
+                self.assertEqual(self.writer.submit(self.create, 'Seoul Kitchen').name, 'Seoul Kitchen')
+        # The withdrawn job is skipped once the writer catches up
+        self.assertEqual(self.writer.submit(self.create, 'Bistro Lyon').name, 'Bistro Lyon')
+        self.assertEqual(sorted(Restaurant.objects.values_list('name', flat=True)), ['Bistro Lyon', 'Seoul Kitchen'])
+        self.assertEqual(self.writer.written, 1)
+
+    @override_settings(ORDER_GROUP_COMMIT=True)
+    def test_orders_go_through_the_writer(self):
+        restaurant = self.create('Seoul Kitchen')
+        item = MenuItem.objects.create(restaurant=restaurant, name='Kimchi', price=Decimal('4.00'))
+        customer = User.objects.create_user('customer', password='secret')
+        with mock.patch.object(group_commit, 'writer', self.writer):
+            order = orders.create_order(customer, restaurant, {item.pk: 3})
+        self.assertEqual(Order.objects.get(pk=order.pk).total_price, Decimal('12.00'))
+        self.assertEqual(self.writer.written, 1)
+
+
+@override_settings(DATABASE_ROUTERS=['main.replica.ReplicaRouter'])
+class ReplicaRouterTests(TransactionTestCase):
+    def read_alias(self):
+        return Restaurant.objects.all().db
+
+    def test_reads_go_to_the_replica_inside_its_context(self):
+        self.assertEqual(self.read_alias(), 'default')
+        with replica._reading(True):
+            self.assertEqual(self.read_alias(), 'replica')
+            self.assertEqual(router.db_for_write(Restaurant), 'default')
+            with replica.use_primary():
+                self.assertEqual(self.read_alias(), 'default')
+            with transaction.atomic():
+                self.assertEqual(self.read_alias(), 'default')
+            self.assertEqual(self.read_alias(), 'replica')
+
+    def test_read_replica_views(self):
+        session = SessionStore()
+        session[replica.SESSION_KEY] = time.time()
+        session.save()
+        self.addCleanup(session.delete)
+
+        @replica.read_replica
+        def view(request):
+            return self.read_alias()
+
+        anonymous = RequestFactory().get('/restaurants/')
+        signed_in = RequestFactory().get('/restaurants/')
+        signed_in.COOKIES[settings.SESSION_COOKIE_NAME] = session.session_key
+        signed_in.session = session
+        with mock.patch.object(replica, 'enabled', return_value=True):
+            self.assertEqual(view(anonymous), 'replica')
+            # Just wrote, so reads what it wrote
+            self.assertEqual(view(signed_in), 'default')
+            with override_settings(REPLICA_STICKY_SECONDS=0):
+                self.assertEqual(view(signed_in), 'replica')
+        # No replica configured
+        self.assertEqual(view(anonymous), 'default')
+
+    def test_writes_stamp_the_session(self):
+        user = User.objects.create_user('customer', password='secret')
+        self.client.force_login(user)
+        with mock.patch.object(replica, 'enabled', return_value=True):
+            self.client.get('/restaurants/')
+            self.assertNotIn(replica.SESSION_KEY, self.client.session)
+            self.client.post('/contact/', {})
+            self.assertIn(replica.SESSION_KEY, self.client.session)
+
+
+class ParseRangeTests(TestCase):
+    def test_satisfiable_ranges(self):
+        for header, expected in [
+            ('bytes=0-99', (0, 99)),
+            ('bytes=10-', (10, 999)),
+            ('bytes=990-5000', (990, 999)),
+            ('bytes=-100', (900, 999)),
+            ('bytes=-5000', (0, 999)),
+            ('bytes=999-999', (999, 999)),
+            ('Bytes = 5 - 9', (5, 9)),
+        ]:
+            with self.subTest(header=header):
+                self.assertEqual(parse_range(header, 1000), expected)
+
+    def test_headers_that_get_the_whole_file(self):
+        for header in [
+            '', 'bytes', 'bytes=', 'bytes=-', 'items=0-9', 'bytes=0-9,20-29',
+            'bytes=9-5', 'bytes=abc', 'bytes=5-x', 'bytes=x-5', 'bytes=-1-2', 'bytes=²-',
+        ]:
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range(header, 1000))
+
+    def test_unsatisfiable_ranges(self):
+        for header, size in [('bytes=1000-', 1000), ('bytes=1000-2000', 1000), ('bytes=-0', 1000),
+                             ('bytes=0-', 0), ('bytes=-10', 0)]:
+            with self.subTest(header=header, size=size):
+                with self.assertRaises(ValueError):
+                    parse_range(header, size)
+
+
+class MediaRangeTests(TestCase):
+    CONTENT = bytes(range(256)) * 4
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        with open(os.path.join(media_root.name, 'menu.pdf'), 'wb') as file:
+            file.write(self.CONTENT)
+        overrides = override_settings(MEDIA_ROOT=media_root.name, MEDIA_SENDFILE='')
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.addCleanup(metadata.forget, 'menu.pdf')
+
+    def get(self, **headers):
+        return self.client.get('/media/menu.pdf', headers=headers)
+
+    def test_range_is_served_partially(self):
+        response = self.get(range='bytes=1000-')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 1000-1023/1024')
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT[1000:])
+
+    def test_unsatisfiable_range(self):
+        response = self.get(range='bytes=1024-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_malformed_or_stale_range_gets_the_whole_file(self):
+        etag = self.get()['ETag']
+        for headers in [{'range': 'bytes=5-x'}, {'range': 'bytes=0-1,5-9'},
+                        {'range': 'bytes=0-9', 'if_range': '"stale"'}]:
+            with self.subTest(headers=headers):
+                response = self.get(**headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(b''.join(response.streaming_content), self.CONTENT)
+        self.assertEqual(self.get(range='bytes=0-9', if_range=etag).status_code, 206)
+
+    def test_validators(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(if_none_match=etag).status_code, 304)
+
+    def test_files_are_not_logged_per_request(self):
+        with self.assertNoLogs('hotel_management.urls', 'INFO'):
+            self.get()
+            self.client.get('/static/images/missing.png')
+        with self.assertLogs('hotel_management.urls', 'INFO'):
+            self.client.get('/aboutus/')
+
+
+@override_settings(IMAGE_WIDTHS=[40, 100, 400], IMAGE_FORMATS=['webp', 'jpeg'], IMAGE_WORKERS=0)
+class ImageUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media_root.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.media_root = media_root.name
+        # render_derivatives() sets the limit for the whole process
+        patcher = mock.patch.object(Image, 'MAX_IMAGE_PIXELS', Image.MAX_IMAGE_PIXELS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, width, height, format='PNG', name='photo.png'):
+        buffer = io.BytesIO()
+        Image.new('RGB', (width, height), 'orange').save(buffer, format)
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def open(self, name):
+        with Image.open(os.path.join(self.media_root, name)) as image:
+            return image.format, image.size
+
+    def test_derivatives_per_width_and_format(self):
+        image, variants = images.save_upload(self.upload(120, 60), 'menu_items')
+        self.assertEqual(variants['widths'], [40, 100])
+        self.assertEqual(variants['formats'], ['webp', 'jpeg'])
+        self.assertEqual((variants['width'], variants['height']), (120, 60))
+        self.assertTrue(variants['base'].startswith('uploads/menu_items/'))
+        self.assertEqual(image, f"{variants['base']}-100.jpg")
+        for width, height in [(40, 20), (100, 50)]:
+            self.assertEqual(self.open(f"{variants['base']}-{width}.jpg"), ('JPEG', (width, height)))
+            self.assertEqual(self.open(f"{variants['base']}-{width}.webp"), ('WEBP', (width, height)))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, f"{variants['base']}-400.jpg")))
+
+    def test_small_images_are_not_upscaled(self):
+        image, variants = images.save_upload(self.upload(30, 30), 'restaurants')
+        self.assertEqual(variants['widths'], [30])
+        self.assertEqual(self.open(image), ('JPEG', (30, 30)))
+
+    def test_same_upload_is_stored_once(self):
+        first = images.save_upload(self.upload(120, 60), 'menu_items')
+        with mock.patch.object(images.default_storage, 'save') as save:
+            self.assertEqual(images.save_upload(self.upload(120, 60), 'menu_items'), first)
+        save.assert_not_called()
+
+    def test_rejects_files_that_are_not_images(self):
+        for upload in [SimpleUploadedFile('menu.pdf', b'%PDF-1.4 not an image'),
+                       self.upload(50, 50, 'BMP', 'photo.bmp')]:
+            with self.subTest(name=upload.name), self.assertRaises(images.ImageError):
+                images.save_upload(upload, 'menu_items')
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, images.UPLOAD_DIR)))
+
+    @override_settings(IMAGE_MAX_PIXELS=100)
+    def test_rejects_too_many_pixels(self):
+        # Just over the limit, and over twice the limit (Pillow's bomb error)
+        for size in [(11, 10), (15, 15)]:
+            with self.subTest(size=size), self.assertRaisesMessage(images.ImageError, 'at most 100 pixels'):
+                images.save_upload(self.upload(*size), 'menu_items')
+        self.assertEqual(images.save_upload(self.upload(10, 10), 'menu_items')[1]['width'], 10)
+
+    @override_settings(IMAGE_MAX_UPLOAD_BYTES=10)
+    def test_rejects_large_files_unread(self):
+        upload = self.upload(10, 10)
+        with mock.patch.object(images.pool, 'run') as run, self.assertRaises(images.ImageError):
+            images.save_upload(upload, 'menu_items')
+        run.assert_not_called()
+
+
+@override_settings(IMAGE_FORMATS=['webp', 'jpeg'], IMAGE_OPTIMIZE_DIRS=['static/images'])
+class OptimizeImagesTests(TestCase):
+    def setUp(self):
+        base_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(base_dir.cleanup)
+        self.base_dir = base_dir.name
+        self.build_dir = os.path.join(self.base_dir, 'build')
+        self.images = os.path.join(self.base_dir, 'static', 'images')
+        os.makedirs(os.path.join(self.images, 'menu_items'))
+        overrides = override_settings(
+            BASE_DIR=self.base_dir, IMAGE_BUILD_DIR=self.build_dir,
+            STATICFILES_DIRS=[os.path.join(self.base_dir, 'static')],
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        # A wide PNG saved without compression, and a JPEG already encoded
+        # the way the build would
+        Image.linear_gradient('L').convert('RGB').resize((300, 150)).save(
+            os.path.join(self.images, 'menu_items', 'wide.png'), compress_level=0,
+        )
+        Image.new('RGB', (40, 40), 'orange').save(
+            os.path.join(self.images, 'small.jpg'), **images.OUTPUT_FORMATS['jpeg'][3],
+        )
+
+    def optimize(self, **options):
+        out = io.StringIO()
+        call_command('optimize_images', jobs=1, max_width=100, stdout=out, **options)
+        with open(os.path.join(self.build_dir, 'manifest.json')) as f:
+            return json.load(f), out.getvalue()
+
+    def built(self, path):
+        with Image.open(os.path.join(self.build_dir, path)) as image:
+            return image.format, image.size
+
+    def test_outputs_and_manifest(self):
+        manifest, out = self.optimize()
+        self.assertIn('2 images optimized, 0 unchanged, 0 failed', out)
+        self.assertEqual(set(manifest), {'static/images/menu_items/wide.png', 'static/images/small.jpg'})
+
+        wide = manifest['static/images/menu_items/wide.png']
+        self.assertEqual((wide['format'], wide['width'], wide['height']), ('png', 100, 50))
+        self.assertEqual(set(wide['outputs']), {'png', 'webp', 'jpeg'})
+        self.assertEqual(wide['outputs']['png'][0], 'static/images/menu_items/wide.png')
+        self.assertLess(wide['outputs']['png'][1], wide['size'])
+        self.assertEqual(self.built('static/images/menu_items/wide.png'), ('PNG', (100, 50)))
+        self.assertEqual(self.built('static/images/menu_items/wide.png.webp'), ('WEBP', (100, 50)))
+        self.assertEqual(self.built('static/images/menu_items/wide.png.jpg'), ('JPEG', (100, 50)))
+
+        # Not smaller once recompressed: the original is collected as it is
+        small = manifest['static/images/small.jpg']
+        self.assertIsNone(small['outputs']['jpeg'])
+        self.assertFalse(os.path.exists(os.path.join(self.build_dir, 'static/images/small.jpg')))
+        self.assertEqual(self.built('static/images/small.jpg.webp'), ('WEBP', (40, 40)))
+
+    def test_finder_prefers_the_optimized_copy(self):
+        from django.contrib.staticfiles.finders import get_finder
+
+        self.optimize()
+        get_finder.cache_clear()
+        self.addCleanup(get_finder.cache_clear)
+        finder = get_finder('main.finders.OptimizedFileSystemFinder')
+        self.assertEqual(
+            finder.find('images/menu_items/wide.png'),
+            os.path.join(self.build_dir, 'static', 'images', 'menu_items', 'wide.png'),
+        )
+        self.assertEqual(finder.find('images/small.jpg'), os.path.join(self.images, 'small.jpg'))
+
+    def test_unchanged_images_are_skipped_and_removed_ones_cleaned_up(self):
+        first, _ = self.optimize()
+        manifest, out = self.optimize()
+        self.assertIn('0 images optimized, 2 unchanged', out)
+        self.assertEqual(manifest, first)
+        self.assertIn('2 images optimized', self.optimize(force=True)[1])
+
+        os.remove(os.path.join(self.images, 'menu_items', 'wide.png'))
+        manifest, _ = self.optimize()
+        self.assertEqual(set(manifest), {'static/images/small.jpg'})
+        self.assertFalse(os.path.exists(os.path.join(self.build_dir, 'static/images/menu_items/wide.png.webp')))
+
+
+class StaticImageUrlTests(TestCase):
+    MANIFEST = {
+        'images/menu_items/default.jpg': 'images/menu_items/default.1a2b3c.jpg',
+        'images/menu_items/bibimbap.jpg': 'images/menu_items/bibimbap.4d5e6f.jpg',
+        'images/menu_items/bibimbap.jpg.webp': 'images/menu_items/bibimbap.jpg.7a8b9c.webp',
+    }
+
+    def setUp(self):
+        patcher = mock.patch.object(images, '_static_manifest', return_value=self.MANIFEST)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bundled_images_resolve_to_their_hashed_copy(self):
+        for image in ['menu_items/bibimbap.jpg', 'bibimbap.jpg', ' bibimbap.jpg ']:
+            with self.subTest(image=image):
+                self.assertEqual(images.url(image, 'menu_items'), '/static/images/menu_items/bibimbap.4d5e6f.jpg')
+        for image in ['', None]:
+            self.assertEqual(images.url(image, 'menu_items'), '/static/images/menu_items/default.1a2b3c.jpg')
+        # Not collected (yet): the unhashed path
+        self.assertEqual(images.url('curry.jpg', 'menu_items'), '/static/images/menu_items/curry.jpg')
+
+    def test_uploads_are_not_looked_up(self):
+        self.assertEqual(
+            images.url('uploads/menu_items/abc-800.jpg', 'menu_items'), '/media/uploads/menu_items/abc-800.jpg',
+        )
+
+    def test_sources_list_the_collected_formats(self):
+        self.assertEqual(
+            images.image_sources('bibimbap.jpg', None, 'menu_items'),
+            [('image/webp', '/static/images/menu_items/bibimbap.jpg.7a8b9c.webp')],
+        )
+        self.assertEqual(images.image_sources('curry.jpg', None, 'menu_items'), [])
+
+
+class StaticManifestTests(TestCase):
+    def setUp(self):
+        images._static_manifest.cache_clear()
+        self.addCleanup(images._static_manifest.cache_clear)
+
+    def test_manifest_is_read_once_from_collectstatic(self):
+        storage = mock.Mock(hashed_files={'images/a.jpg': 'images/a.123.jpg'})
+        with mock.patch('django.contrib.staticfiles.storage.staticfiles_storage', storage):
+            self.assertEqual(images.static_url('a.jpg'), '/static/images/a.123.jpg')
+        # Cached for the life of the process
+        self.assertEqual(images.static_url('a.jpg'), '/static/images/a.123.jpg')
+
+    @override_settings(DEBUG=True)
+    def test_development_serves_unhashed_files(self):
+        self.assertEqual(images.static_url('a.jpg'), '/static/images/a.jpg')
+
+
+@override_settings(HEALTH_CHECK_TTL=0, HEALTH_DB_TIMEOUT=2)
+class HealthTests(TestCase):
+    def setUp(self):
+        database = mock.patch.object(health, 'database', health.DatabaseCheck())
+        database.start()
+        self.addCleanup(database.stop)
+
+    def test_ready(self):
+        response = self.client.get('/health/ready')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'ready')
+        self.assertIn('default', response.json()['database']['latency_ms'])
+
+    def test_not_ready_when_the_database_fails(self):
+        with mock.patch.object(health, '_ping', side_effect=RuntimeError('default: connection refused')):
+            response = self.client.get('/health/ready')
+            live = self.client.get('/health/live')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {
+            'status': 'unavailable', 'database': {'error': 'default: connection refused'},
+        })
+        self.assertEqual(response['Cache-Control'], 'max-age=0, no-cache, no-store, must-revalidate, private')
+        # Liveness doesn't depend on the database
+        self.assertEqual(live.status_code, 200)
+
+    @override_settings(HEALTH_DB_TIMEOUT=0.05)
+    def test_not_ready_when_the_database_hangs(self):
+        answered = threading.Event()
+        self.addCleanup(answered.set)
+        with mock.patch.object(health, '_ping', side_effect=lambda: answered.wait(5)):
+            response = self.client.get('/health/ready')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['database'], {'error': 'no answer within 0.05s'})
+
+
+class ApiTests(MenuFixtures, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def get(self, path, **headers):
+        return self.client.get(f'/api/v1/{path}', headers=headers)
+
+    def test_etag_round_trip(self):
+        path = f'restaurants/{self.restaurant.pk}/'
+        response = self.get(path)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.get(path, if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        # Another URL is another representation
+        self.assertNotEqual(self.get(f'{path}?fields[items]=name')['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kimchi.price = Decimal('4.50')
+            self.kimchi.save()
+        response = self.get(path, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('4.50', [item['price'] for item in response.json()['data']['items']])
+
+    def test_batched_fetches(self):
+        bistro = Restaurant.objects.create(name='Bistro Lyon', location='Old town', cuisine='french')
+        ids = f'{bistro.pk},999,{self.restaurant.pk},{bistro.pk}'
+        response = self.get(f'restaurants/?ids={ids}')
+        self.assertEqual([data['id'] for data in response.json()['data']], [bistro.pk, self.restaurant.pk])
+        self.assertEqual(response.json()['missing'], [999])
+
+        response = self.get(f'menus/?ids={ids}')
+        data = response.json()['data']
+        self.assertEqual([(menu['id'], len(menu['items'])) for menu in data], [(bistro.pk, 0), (self.restaurant.pk, 2)])
+        self.assertEqual(response.json()['missing'], [999])
+
+    def test_sparse_fieldsets(self):
+        response = self.get(f'menus/?ids={self.restaurant.pk}&fields[restaurants]=name,min_price&fields[items]=name')
+        self.assertEqual(response.json()['data'], [{
+            'name': 'Seoul Kitchen', 'min_price': '4.00',
+            'items': [{'name': 'Bibimbap'}, {'name': 'Kimchi'}],
+        }])
+        Review.objects.create(restaurant=self.restaurant, user=self.customer, rating=4, review_text='Nice')
+        response = self.get(f'restaurants/{self.restaurant.pk}/reviews/?fields[reviews]=author,rating')
+        self.assertEqual(response.json()['data'], [{'author': 'customer', 'rating': 4}])
+
+    def test_errors(self):
+        for path, status, error in [
+            ('restaurants/?ids=1,x', 400, 'ids must be a comma separated list of integers'),
+            ('restaurants/?ids=,', 400, 'ids must not be empty'),
+            (f"restaurants/?ids={','.join(map(str, range(1, 52)))}", 400, 'at most 50 ids per request'),
+            ('restaurants/?fields[restaurants]=name,secret', 400, 'unknown restaurants field(s): secret'),
+            ('menus/', 400, 'ids is required'),
+            ('restaurants/999/', 404, 'restaurant not found'),
+            ('restaurants/999/reviews/', 404, 'restaurant not found'),
+        ]:
+            with self.subTest(path=path):
+                response = self.get(path)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(response.json(), {'error': error})
+                self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(self.client.post('/api/v1/restaurants/').status_code, 405)
+
+
+@override_settings(PAGE_CACHE_ENABLED=True)
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def csrf_token(self, response):
+        return re.search(rb'name="csrfmiddlewaretoken" value="([^"]*)"', response.content).group(1).decode()
+
+    def test_anonymous_page_is_cached(self):
+        first = self.client.get('/aboutus/')
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            second = self.client.get('/aboutus/?utm_source=newsletter')
+        self.assertEqual(second['X-Page-Cache'], 'hit')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(int(second['Content-Length']), len(first.content))
+
+    def test_stale_page_is_served_while_it_is_refreshed(self):
+        self.client.get('/aboutus/')
+        key = f'page:{settings.BUILD_VERSION}:/aboutus/'
+        entry = cache.get(key)
+        entry['stored'] -= settings.PAGE_CACHE_TTLS['aboutus'] + 1
+        cache.set(key, entry)
+        with mock.patch.object(PageCacheMiddleware, 'refresh_in_background') as refresh:
+            response = self.client.get('/aboutus/')
+        self.assertEqual(response['X-Page-Cache'], 'stale')
+        refresh.assert_called_once()
+
+    def test_signed_in_and_post_requests_bypass_the_cache(self):
+        self.client.get('/aboutus/')
+        self.client.force_login(User.objects.create_user('visitor', password='secret'))
+        self.assertFalse(self.client.get('/aboutus/').has_header('X-Page-Cache'))
+        self.client.logout()
+        self.client.cookies.clear()
+        self.assertFalse(self.client.post('/contact/', {}).has_header('X-Page-Cache'))
+        self.assertFalse(self.client.get('/restaurants/').has_header('X-Page-Cache'))
+
+    def test_cached_form_pages_get_a_fresh_csrf_token(self):
+        for path in ('/contact/', '/schedule-demo/'):
+            with self.subTest(path=path):
+                self.client.get(path)
+                visitor = self.client_class(enforce_csrf_checks=True)
+                response = visitor.get(path)
+                self.assertEqual(response['X-Page-Cache'], 'hit')
+                self.assertNotIn(CSRF_PLACEHOLDER, response.content)
+                self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+                # The token in the replayed form is accepted with the cookie set alongside it
+                response = visitor.post(path, {'csrfmiddlewaretoken': self.csrf_token(response)})
+                self.assertNotEqual(response.status_code, 403)
+                self.assertEqual(visitor.post(path, {'csrfmiddlewaretoken': 'x' * 64}).status_code, 403)
+
+
+@override_settings(SHARED_CACHE_SECONDS=300)
+class SharedCacheTests(MenuFixtures, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def pages(self):
+        return [
+            ('/restaurants/', 'catalogue'),
+            (f'/restaurants/{self.restaurant.pk}/', f'restaurant-{self.restaurant.pk}'),
+            ('/menu/', 'catalogue'),
+        ]
+
+    def test_anonymous_pages_can_be_shared(self):
+        for path, key in self.pages():
+            with self.subTest(path=path):
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Surrogate-Key'], key)
+                self.assertEqual(shared_max_age(response), 300)
+                self.assertIn('max-age=0', response['Cache-Control'])
+                self.assertFalse(response.cookies)
+                self.assertNotIn('cookie', response.get('Vary', '').lower())
+
+    def test_signed_in_pages_stay_private(self):
+        self.client.force_login(self.customer)
+        for path, _ in self.pages():
+            with self.subTest(path=path):
+                response = self.client.get(path)
+                self.assertFalse(response.has_header('Surrogate-Key'))
+                self.assertIsNone(shared_max_age(response))
+                self.assertIn('private', response['Cache-Control'])
+
+    def test_writes_record_purges(self):
+        keys = ['catalogue', f'restaurant-{self.restaurant.pk}']
+        start = shared_cache.latest_purge_id()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kimchi.price = Decimal('4.50')
+            self.kimchi.save()
+            Review.objects.create(restaurant=self.restaurant, user=self.customer, rating=5, review_text='Great')
+        purges = shared_cache.fetch_purges(start)
+        self.assertEqual([purged for _, purged in purges], [keys, keys])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.restaurant.delete()
+        purges = shared_cache.fetch_purges(purges[-1][0])
+        self.assertTrue(purges)
+        self.assertTrue(all(purged == keys for _, purged in purges))
+        # Nothing is recorded for a write that is rolled back
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Restaurant.objects.create(name='Bistro Lyon', location='Old town', cuisine='french')
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        self.assertEqual(shared_cache.latest_purge_id(), purges[-1][0])
+
+    def test_proxy_cache_evicts_by_key(self):
+        proxy = ProxyCache()
+        proxy.put('/restaurants/', 200, [('Surrogate-Key', 'catalogue')], b'list', 300)
+        proxy.put('/restaurants/1/', 200, [('Surrogate-Key', 'restaurant-1')], b'one', 300)
+        proxy.put('/restaurants/2/', 200, [('Surrogate-Key', 'restaurant-2')], b'two', 300)
+        self.assertEqual(proxy.purge(['restaurant-1', 'catalogue']), 2)
+        self.assertIsNone(proxy.get('/restaurants/'))
+        self.assertIsNone(proxy.get('/restaurants/1/'))
+        self.assertEqual(proxy.get('/restaurants/2/')['body'], b'two')
+        self.assertIsNone(shared_max_age({'Cache-Control': 'public, s-maxage=60, private'}))
+
+
+class OwnerResolutionTests(MenuFixtures, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.owner_user = User.objects.create_user('owner', password='secret')
+        cls.owner = Owner.objects.create(user=cls.owner_user, restaurant=cls.restaurant)
+
+    def request(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        owners.OwnerMiddleware(lambda request: None)(request)
+        return request
+
+    def test_customers_cost_one_small_query(self):
+        request = self.request(self.customer)
+        with self.assertNumQueries(1):
+            self.assertFalse(request.owner_id)
+            self.assertFalse(request.restaurant_id)
+            self.assertIsNone(owners.get_owner(request))
+
+    def test_navigation_only_reads_the_ids(self):
+        request = self.request(self.owner_user)
+        with self.assertNumQueries(1):
+            self.assertEqual(request.owner_id, self.owner.pk)
+            self.assertEqual(request.restaurant_id, self.restaurant.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(request.restaurant.name, 'Seoul Kitchen')
+            self.assertEqual(self.owner_user.owner_profile, self.owner)
+
+    def test_owner_views_load_the_owner_once(self):
+        request = self.request(self.owner_user)
+        with self.assertNumQueries(1):
+            self.assertEqual(owners.get_owner(request), self.owner)
+            self.assertEqual(request.owner_id, self.owner.pk)
+            self.assertEqual(request.restaurant.pk, self.restaurant.pk)
+
+    def test_owner_changes_are_seen_on_the_next_request(self):
+        self.assertTrue(self.request(self.owner_user).owner_id)
+        self.owner.delete()
+        self.assertFalse(self.request(self.owner_user).owner_id)
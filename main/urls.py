@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 from django.contrib.auth import views as auth_views
 from django.conf import settings
 from django.conf.urls.static import static
@@ -10,6 +10,14 @@ urlpatterns = [
     path('restaurants/', views.restaurant_list, name='restaurant_list'),
     path('restaurants/<int:id>/', views.restaurant_detail, name='restaurant_detail'),
     path('menu/', views.menu_view, name='menu'),
+    path('search/', views.search_view, name='search'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
+
+    # JSON API for kiosk and QR table clients
+    path('api/v1/restaurants/', api.restaurants, name='api_restaurants'),
+    path('api/v1/restaurants/<int:id>/', api.restaurant_detail, name='api_restaurant_detail'),
+    path('api/v1/restaurants/<int:id>/reviews/', api.restaurant_reviews, name='api_restaurant_reviews'),
+    path('api/v1/menus/', api.menus, name='api_menus'),
     
     # Authentication routes
     path('login/', views.login_view, name='login'),
@@ -36,6 +44,7 @@ urlpatterns = [
     path('owner/dashboard/', views.owner_dashboard, name='owner_dashboard'),
     path('owner/menu/edit/', views.owner_menu_edit, name='owner_menu_edit'),
     path('owner/orders/', views.owner_orders, name='owner_orders'),
+    path('owner/orders/stream/', views.owner_order_stream, name='owner_order_stream'),
     path('owner/settings/', views.owner_settings, name='owner_settings'),
 ]
 
@@ -3,15 +3,27 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.utils import timezone
 from django.contrib.auth.models import User  # Import User model
 from django.db import IntegrityError, transaction # For database transactions
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Sum, Avg
-from django.db.models import Count, Sum, Avg
+from django.db.models import Count, Sum, Avg, F
 from django.db.models.functions import TruncDate
-from .models import Restaurant, MenuItem, Coupon, Order, OrderItem, Review, Owner
+from .models import Restaurant, MenuItem, Order, OrderItem, Review, Owner
 from .forms import LoginForm, RegisterForm, CouponApplyForm, ContactForm, RestaurantSignupForm, ReviewForm
+from . import coupons, images, menu_cache, rollups, search
+from .conditional import (
+    catalogue_modified, catalogue_version, conditional_page, restaurant_modified, restaurant_version,
+)
+from .events import enabled as order_feed_enabled, order_feed
+from .orders import EmptyOrderError, OrderError, checkout as checkout_order, create_order, parse_quantities, update_status
+from .owners import owner_required
+from .pagination import KeysetPaginator
+from .replica import read_replica
+from .shared_cache import CATALOGUE_KEY, restaurant_key, shared_cache
 
 # Validation utility functions
 def is_valid_email(email):
@@ -57,6 +69,9 @@ def home(request):
         messages.error(request, f'Error loading home page: {str(e)}')
         return render(request, 'main/home.html')
 
+@shared_cache(lambda request: [CATALOGUE_KEY])
+@conditional_page(catalogue_version, catalogue_modified)
+@read_replica
 def restaurant_list(request):
     """Display list of all restaurants"""
     try:
@@ -69,51 +84,57 @@ def restaurant_list(request):
         messages.error(request, f'Error loading restaurants: {str(e)}')
         return redirect('home')
 
+@shared_cache(lambda request, id: [restaurant_key(id)])
+@conditional_page(restaurant_version, restaurant_modified)
+@read_replica
 def restaurant_detail(request, id):
     """Display details of a specific restaurant"""
     try:
-        restaurant = get_object_or_404(Restaurant, id=id)
-        menu_items = MenuItem.objects.filter(restaurant=restaurant)
+        menu = menu_cache.get_menu(id)
+        if menu is None:
+            raise Http404('No Restaurant matches the given query.')
         context = {
-            'restaurant': restaurant,
-            'menu_items': menu_items
+            'restaurant': menu['restaurant'],
+            'menu_items': menu['items']
         }
         return render(request, 'main/restaurant_detail.html', context)
     except Exception as e:
         messages.error(request, f'Error loading restaurant details: {str(e)}')
         return redirect('restaurant_list')
 
+@shared_cache(lambda request: [CATALOGUE_KEY])
+@conditional_page(catalogue_version, catalogue_modified)
+@read_replica
 def menu_view(request):
     """Display menu items with filtering options"""
     try:
-        # Get all restaurants for filter dropdown
-        restaurants = Restaurant.objects.all()
+        # All restaurants for the filter dropdown, served from the menu cache
+        restaurants = menu_cache.get_catalogue()
         
         # Get filter parameters
         restaurant_id = request.GET.get('restaurant')
         cuisine = request.GET.get('cuisine')
         
-        # Start with all menu items
-        menu_items = MenuItem.objects.select_related('restaurant').all()
-        
         # Apply filters if provided
+        selected = restaurants
         filtered_restaurant = None
         if restaurant_id:
-            try:
-                filtered_restaurant = Restaurant.objects.get(id=restaurant_id)
-                menu_items = menu_items.filter(restaurant=filtered_restaurant)
-            except Restaurant.DoesNotExist:
+            filtered_restaurant = next((r for r in restaurants if str(r['id']) == restaurant_id), None)
+            if filtered_restaurant is None:
                 messages.warning(request, "Restaurant not found.")
+            else:
+                selected = [filtered_restaurant]
         
         if cuisine:
-            menu_items = menu_items.filter(restaurant__cuisine=cuisine)
+            selected = [r for r in selected if r['cuisine'] == cuisine]
         
-        # Group menu items by restaurant
-        menu_by_restaurant = {}
-        for item in menu_items:
-            if item.restaurant not in menu_by_restaurant:
-                menu_by_restaurant[item.restaurant] = []
-            menu_by_restaurant[item.restaurant].append(item)
+        # Pre-grouped menus by restaurant, skipping restaurants with no items
+        menus = menu_cache.get_menus([r['id'] for r in selected])
+        menu_by_restaurant = [
+            (menus[r['id']]['restaurant'], menus[r['id']]['items'])
+            for r in selected
+            if r['id'] in menus and menus[r['id']]['items']
+        ]
         
         context = {
             'menu_by_restaurant': menu_by_restaurant,
@@ -127,6 +148,45 @@ def menu_view(request):
         messages.error(request, f'Error loading menu: {str(e)}')
         return redirect('home')
 
+@read_replica
+def search_view(request):
+    """Ranked search across restaurant and menu item names and descriptions"""
+    query = request.GET.get('q', '').strip()
+    matches = search.search(query, limit=30) if query else []
+
+    restaurants = Restaurant.objects.in_bulk(
+        [match['id'] for match in matches if match['kind'] == search.RESTAURANT]
+    )
+    items = MenuItem.objects.select_related('restaurant').in_bulk(
+        [match['id'] for match in matches if match['kind'] == search.MENU_ITEM]
+    )
+    results = []
+    for match in matches:
+        found = (restaurants if match['kind'] == search.RESTAURANT else items).get(match['id'])
+        if found is not None:
+            results.append({'kind': match['kind'], 'object': found})
+
+    context = {
+        'query': query,
+        'results': results,
+    }
+    return render(request, 'main/search.html', context)
+
+def search_suggest(request):
+    """Typeahead suggestions for the search box as JSON"""
+    suggestions = []
+    for match in search.suggest(request.GET.get('q', '')):
+        url = reverse('restaurant_detail', args=[match['restaurant_id']])
+        if match['kind'] == search.MENU_ITEM:
+            url += f"?highlight={match['id']}"
+        suggestions.append({
+            'kind': match['kind'],
+            'id': match['id'],
+            'name': match['title'],
+            'url': url,
+        })
+    return JsonResponse({'results': suggestions})
+
 # Authentication views
 def login_view(request):
     """Handle user login with user type verification"""
@@ -187,7 +247,7 @@ def user_profile(request):
     """Display and update user profile information"""
     try:
         # Get recent orders for the user (limit to 5)
-        recent_orders = Order.objects.filter(user=request.user).order_by('-created_at')[:5]
+        recent_orders = Order.objects.filter(user=request.user).select_related('restaurant').order_by('-created_at')[:5]
         
         # Get user's reviews if any
         user_reviews = Review.objects.filter(user=request.user).select_related('restaurant').order_by('-created_at')[:3]
@@ -232,66 +292,18 @@ def place_order(request, restaurant_id):
         restaurant = get_object_or_404(Restaurant, id=restaurant_id)
         
         if request.method == 'POST':
-            # Process items from the form
-            items_to_add = []
-            total_items = 0
-            
-            for key, value in request.POST.items():
-                if key.startswith('quantity_'):
-                    try:
-                        quantity = int(value)
-                        if quantity < 0:
-                            messages.error(request, 'Invalid quantity specified.')
-                            return redirect('restaurant_detail', id=restaurant_id)
-                        elif quantity > 0:
-                            item_id = key.replace('quantity_', '')
-                            try:
-                                menu_item = MenuItem.objects.get(id=item_id, restaurant=restaurant)
-                                items_to_add.append((menu_item, quantity))
-                                total_items += quantity
-                            except MenuItem.DoesNotExist:
-                                messages.error(request, f'Menu item not found or not available in this restaurant.')
-                                return redirect('restaurant_detail', id=restaurant_id)
-                    except ValueError:
-                        messages.error(request, 'Invalid quantity format.')
-                        return redirect('restaurant_detail', id=restaurant_id)
-            
-            # Check if order is empty or too large
-            if not items_to_add:
-                messages.warning(request, 'Please select at least one item to place an order.')
+            try:
+                quantities = parse_quantities(request.POST)
+                order = create_order(request.user, restaurant, quantities)
+            except EmptyOrderError as e:
+                messages.warning(request, str(e))
                 return redirect('restaurant_detail', id=restaurant_id)
-            
-            if total_items > 50:  # Set a reasonable maximum order size
-                messages.error(request, 'Order quantity exceeds maximum limit.')
+            except OrderError as e:
+                messages.error(request, str(e))
                 return redirect('restaurant_detail', id=restaurant_id)
             
-            if items_to_add:
-                # Create the order
-                order = Order(
-                    user=request.user,
-                    restaurant=restaurant,
-                    status='Pending'
-                )
-                # Set skip_price_calculation for initial save since we don't have items yet
-                order.skip_price_calculation = True
-                order.save()
-                
-                # Add items to the order
-                for menu_item, quantity in items_to_add:
-                    OrderItem.objects.create(
-                        order=order,
-                        menu_item=menu_item,
-                        quantity=quantity
-                    )
-                
-                # Now calculate the total with all items
-                order.skip_price_calculation = False
-                order.save()  # This will trigger total calculation in save()
-                
-                messages.success(request, f'Your order from {restaurant.name} has been placed.')
-                return redirect('order_summary', order_id=order.id)
-            else:
-                messages.warning(request, 'Please select at least one item to place an order.')
+            messages.success(request, f'Your order from {restaurant.name} has been placed.')
+            return redirect('order_summary', order_id=order.id)
         
         return redirect('restaurant_detail', id=restaurant_id)
     except Exception as e:
@@ -306,15 +318,11 @@ def order_summary(request, order_id):
         
         # Handle coupon application
         if request.method == 'POST' and 'code' in request.POST:
-            coupon_code = request.POST.get('code')
             try:
-                coupon = Coupon.objects.get(code=coupon_code, is_active=True)
-                # In a real app, you'd check if coupon is valid
-                order.coupon = coupon
-                order.save()
-                messages.success(request, f'Coupon {coupon_code} applied successfully!')
-            except Coupon.DoesNotExist:
-                messages.error(request, 'Invalid coupon code.')
+                rule = coupons.apply_coupon(order, request.POST.get('code'), request.user)
+                messages.success(request, f'Coupon {rule.code} applied successfully!')
+            except coupons.CouponError as e:
+                messages.error(request, str(e))
             return redirect('order_summary', order_id=order.id)
         
         return render(request, 'main/order_summary.html', {'order': order})
@@ -499,6 +507,8 @@ def contact(request):
         messages.error(request, f'Error sending message: {str(e)}')
         return redirect('home')
 
+@conditional_page(catalogue_version, catalogue_modified)
+@read_replica
 def reviews(request):
     """Display a paginated list of reviews from all restaurants"""
     try:
@@ -520,16 +530,8 @@ def reviews(request):
         # Get all restaurants for filter dropdown
         restaurants = Restaurant.objects.all()
         
-        # Pagination
-        page = request.GET.get('page', 1)
-        paginator = Paginator(reviews_list, 5)  # Show 5 reviews per page
-        
-        try:
-            reviews = paginator.page(page)
-        except PageNotAnInteger:
-            reviews = paginator.page(1)
-        except EmptyPage:
-            reviews = paginator.page(paginator.num_pages)
+        # Keyset pagination, 5 reviews per page
+        reviews = KeysetPaginator(reviews_list, 5).page(request.GET.get('cursor'))
             
         context = {
             'reviews': reviews,
@@ -547,10 +549,10 @@ def order_history(request):
     """Display the order history for the logged-in user"""
     try:
         # Get all orders for the current user, ordered by most recent first
-        orders = Order.objects.filter(user=request.user).order_by('-created_at')
+        orders = Order.objects.filter(user=request.user).select_related('restaurant')
         
         context = {
-            'orders': orders
+            'orders': KeysetPaginator(orders, 20).page(request.GET.get('cursor'))
         }
         return render(request, 'main/order_history.html', context)
     except Exception as e:
@@ -563,10 +565,6 @@ def checkout(request, order_id):
     try:
         order = get_object_or_404(Order, id=order_id, user=request.user)
         
-        # Force recalculation of total
-        order.skip_price_calculation = False
-        order.save()
-        
         # Check if order is already completed
         if order.status == 'Completed':
             messages.info(request, 'This order has already been processed.')
@@ -587,8 +585,12 @@ def checkout(request, order_id):
             # 4. Update order status based on payment result
             
             # Mock successful payment for demo
-            order.status = 'Completed'
-            order.save()
+            try:
+                checkout_order(order, request.user)
+            except coupons.CouponError as e:
+                coupons.remove_coupon(order)
+                messages.error(request, f'{e} It has been removed from your order; please review the new total.')
+                return redirect('checkout', order_id=order.id)
             
             messages.success(request, 'Payment successful! Your order has been confirmed.')
             return redirect('order_history')
@@ -601,88 +603,53 @@ def checkout(request, order_id):
         messages.error(request, f'Error during checkout: {str(e)}')
         return redirect('order_history')
 
-@login_required
+@owner_required
+@read_replica
 def owner_dashboard(request):
     """Dashboard view for restaurant owners"""
     try:
-        # Verify the user is an owner
-        owner = get_object_or_404(Owner, user=request.user)
-        restaurant = owner.restaurant
-        
-        # Calculate statistics directly with querysets
-        total_orders = Order.objects.filter(restaurant=restaurant).count()
-        
-        # Calculate total revenue from completed orders
-        revenue_result = Order.objects.filter(
-            restaurant=restaurant,
-            status='Completed'
-        ).aggregate(
-            total=Sum('total_price')
-        )
-        total_revenue = revenue_result['total'] or 0
-        
-        # Calculate average rating
-        rating_result = Review.objects.filter(
-            restaurant=restaurant
-        ).aggregate(
-            avg=Avg('rating')
-        )
-        average_rating = rating_result['avg'] or 0
+        owner = request.owner
+        restaurant = request.restaurant
+        
+        # Order, revenue and rating totals come from the precomputed rollups
+        totals = rollups.restaurant_totals(restaurant)
         
         # Get recent orders for the restaurant
         recent_orders = Order.objects.filter(
             restaurant=restaurant
-        ).order_by('-created_at')[:5]
+        ).select_related('user').order_by('-created_at')[:5]
         
         # Get recent reviews
         recent_reviews = Review.objects.filter(
             restaurant=restaurant
-        ).order_by('-created_at')[:3]
+        ).select_related('user').order_by('-created_at')[:3]
         
         # Get best-selling items
-        bestsellers = OrderItem.objects.filter(
-            order__restaurant=restaurant,
-            order__status='Completed'
-        ).values(
-            'menu_item__name'
-        ).annotate(
-            total_ordered=Count('id')
-        ).order_by('-total_ordered')[:5]
+        bestsellers = rollups.bestsellers(restaurant)
         
         # Get daily orders for current month
-        daily_orders = Order.objects.filter(
-            restaurant=restaurant,
-            created_at__month=timezone.now().month
-        ).annotate(
-            date=TruncDate('created_at')
-        ).values('date').annotate(
-            count=Count('id'),
-            revenue=Sum('total_price')
-        ).order_by('-date')[:30]
+        now = timezone.localtime()
+        daily_orders = rollups.daily_series(restaurant, now.year, now.month)[:30]
         
         context = {
             'owner': owner,
             'restaurant': restaurant,
-            'total_orders': total_orders,
-            'total_revenue': total_revenue,
-            'average_rating': average_rating,
+            'total_orders': totals['orders'],
+            'total_revenue': totals['revenue'],
+            'average_rating': totals['average_rating'],
             'recent_orders': recent_orders,
             'recent_reviews': recent_reviews,
             'bestsellers': bestsellers,
             'daily_orders': daily_orders,
             # Add statistics for the dashboard
             'stats': {
-                'pending_orders': Order.objects.filter(restaurant=restaurant, status='Pending').count(),
-                'completed_orders': Order.objects.filter(restaurant=restaurant, status='Completed').count(),
-                'menu_items': MenuItem.objects.filter(restaurant=restaurant).count(),
-                'total_reviews': restaurant.reviews.count(),
+                'pending_orders': totals['pending_orders'],
+                'completed_orders': totals['completed_orders'],
+                'menu_items': restaurant.menu_item_count,
+                'total_reviews': totals['rating_count'],
             }
         }
         return render(request, 'main/owner_dashboard.html', context)
-    except Owner.DoesNotExist:
-        # Redirect to login page with appropriate message
-        messages.warning(request, 'Owner profile not found for this user. Please log in with an owner account.') 
-        return redirect('login')
     except Exception as e:
         # Print the actual exception to the console for debugging
         import traceback
@@ -699,13 +666,11 @@ def aboutus(request):
         messages.error(request, f'Error loading about us page: {str(e)}')
         return render(request, 'main/aboutus.html')
     
-@login_required
+@owner_required
 def owner_menu_edit(request):
     """View for restaurant owners to edit their menu items"""
     try:
-        # Verify the user is an owner
-        owner = get_object_or_404(Owner, user=request.user)
-        restaurant = owner.restaurant
+        restaurant = request.restaurant
         
         if request.method == 'POST':
             action = request.POST.get('action')
@@ -719,14 +684,18 @@ def owner_menu_edit(request):
                 
                 if name and price:
                     try:
+                        image_path, image_variants = images.save_upload(image, 'menu_items') if image else (None, {})
                         MenuItem.objects.create(
                             restaurant=restaurant,
                             name=name,
                             price=price,
                             description=description,
-                            image=image if image else None
+                            image=image_path,
+                            image_variants=image_variants,
                         )
                         messages.success(request, 'Menu item added successfully!')
+                    except images.ImageError as e:
+                        messages.error(request, str(e))
                     except ValueError:
                         messages.error(request, 'Invalid price format.')
                 else:
@@ -748,9 +717,11 @@ def owner_menu_edit(request):
                         item.price = price
                         item.description = description
                         if image:
-                            item.image = image
+                            item.image, item.image_variants = images.save_upload(image, 'menu_items')
                         item.save()
                         messages.success(request, 'Menu item updated successfully!')
+                    except images.ImageError as e:
+                        messages.error(request, str(e))
                     except ValueError:
                         messages.error(request, 'Invalid price format.')
                 else:
@@ -777,13 +748,11 @@ def owner_menu_edit(request):
         messages.error(request, 'An error occurred while managing menu items.')
         return redirect('owner_dashboard')
 
-@login_required
+@owner_required
 def owner_orders(request):
     """View for restaurant owners to manage their orders"""
     try:
-        # Verify the user is an owner
-        owner = get_object_or_404(Owner, user=request.user)
-        restaurant = owner.restaurant
+        restaurant = request.restaurant
         
         if request.method == 'POST':
             order_id = request.POST.get('order_id')
@@ -792,8 +761,7 @@ def owner_orders(request):
             if order_id and new_status:
                 order = get_object_or_404(Order, id=order_id, restaurant=restaurant)
                 if new_status in [status[0] for status in Order.STATUS_CHOICES]:
-                    order.status = new_status
-                    order.save()
+                    update_status(order, new_status)
                     messages.success(request, f'Order #{order.id} status updated to {new_status}')
                 else:
                     messages.error(request, 'Invalid status selected.')
@@ -803,20 +771,20 @@ def owner_orders(request):
         status_filter = request.GET.get('status')
         date_filter = request.GET.get('date')
         
-        orders = Order.objects.filter(restaurant=restaurant)
+        orders = Order.objects.filter(restaurant=restaurant).select_related('user')
         
         if status_filter:
             orders = orders.filter(status=status_filter)
         if date_filter:
             orders = orders.filter(created_at__date=date_filter)
-            
-        orders = orders.order_by('-created_at')
         
         context = {
             'restaurant': restaurant,
-            'orders': orders,
+            'orders': KeysetPaginator(orders, 25).page(request.GET.get('cursor')),
             'status_choices': Order.STATUS_CHOICES,
             'current_status': status_filter,
+            'current_date': date_filter,
+            'live_feed': order_feed_enabled(),
         }
         return render(request, 'main/owner_orders.html', context)
     except Exception as e:
@@ -824,12 +792,37 @@ def owner_orders(request):
         return redirect('owner_dashboard')
 
 @login_required
+async def owner_order_stream(request):
+    """Stream new orders and status changes for the owner's restaurant as Server-Sent Events"""
+    if not order_feed_enabled() or not isinstance(request, ASGIRequest):
+        # A never-ending response would tie up a WSGI worker thread; 204 tells
+        # the browser's EventSource to stop reconnecting
+        return HttpResponse(status=204)
+    
+    user = await request.auser()
+    restaurant_id = await Owner.objects.filter(user=user).values_list('restaurant_id', flat=True).afirst()
+    if restaurant_id is None:
+        return HttpResponseForbidden('Owner profile not found for this user.')
+    
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_event_id = None
+    
+    response = StreamingHttpResponse(
+        order_feed.listen(restaurant_id, last_event_id),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering
+    return response
+
+@owner_required
 def owner_settings(request):
     """View for restaurant owners to manage their restaurant settings"""
     try:
-        # Verify the user is an owner
-        owner = get_object_or_404(Owner, user=request.user)
-        restaurant = owner.restaurant
+        owner = request.owner
+        restaurant = request.restaurant
         
         if request.method == 'POST':
             # Update restaurant information
@@ -841,12 +834,16 @@ def owner_settings(request):
             phone = request.POST.get('phone')
             
             if name and location and cuisine:
+                if image:
+                    try:
+                        restaurant.image, restaurant.image_variants = images.save_upload(image, 'restaurants')
+                    except images.ImageError as e:
+                        messages.error(request, str(e))
+                        return redirect('owner_settings')
                 restaurant.name = name
                 restaurant.location = location
                 restaurant.description = description
                 restaurant.cuisine = cuisine
-                if image:
-                    restaurant.image = image
                 restaurant.save()
                 
                 if phone: